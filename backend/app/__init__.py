@@ -1,6 +1,6 @@
 from flask import Flask
 from flask_cors import CORS
-from app.extensions import db, celery
+from app.extensions import db
 import os
 from dotenv import load_dotenv
 
@@ -10,6 +10,10 @@ load_dotenv()
 def create_app(config_name=None):
     app = Flask(__name__)
     
+    # Validate uploaded files while they stream in
+    from app.middleware.file_validation import ValidatingRequest
+    app.request_class = ValidatingRequest
+    
     # Configure the Flask application
     app.config.from_object('config.config.Config')
     
@@ -18,22 +22,31 @@ def create_app(config_name=None):
         r"/api/*": {
             "origins": os.getenv('CORS_ORIGINS', 'http://localhost').split(','),
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"]
+            "allow_headers": ["Content-Type", "Authorization"],
+            "expose_headers": ["X-Next-Cursor", "ETag", "Content-Range", "Accept-Ranges", "X-Trace-Id"]
         }
     })
     
+    # Client address and scheme as seen by the trusted proxies, e.g. for per-client job limits
+    if app.config['TRUSTED_PROXY_COUNT']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        hops = app.config['TRUSTED_PROXY_COUNT']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+    
     # Initialize extensions
     db.init_app(app)
     
-    # Initialize Celery
-    celery.conf.update(app.config)
+    # Request timing, trace IDs and sampled profiling; commit timing
+    from app.utils import instrumentation
+    instrumentation.init_app(app)
+    instrumentation.instrument_sqlalchemy()
     
     # Register blueprints
     from app.routes import api
     app.register_blueprint(api.bp)
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
+    # Schema changes are a separate deploy step: flask --app wsgi init-db
+    from app.cli import init_db_command
+    app.cli.add_command(init_db_command)
     
     return app 
\ No newline at end of file
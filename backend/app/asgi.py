@@ -0,0 +1,43 @@
+import os
+from contextlib import asynccontextmanager
+from app import create_app
+from app.config.config import BaseConfig
+
+def create_asgi_app(flask_app=None):
+    """
+    The API as an ASGI app: upload, job status and download are served by
+    the async endpoints in app.routes.ingest, every other route by the Flask
+    app, which runs in a pool of ASGI_WSGI_THREADS threads.
+    """
+    from a2wsgi import WSGIMiddleware
+    from anyio import to_thread
+    from starlette.applications import Starlette
+    from starlette.middleware.cors import CORSMiddleware
+    from starlette.routing import Mount, Route
+    from app.routes import ingest
+
+    flask_app = flask_app or create_app()
+    ingest.ingest_store.init_app(flask_app)
+
+    # Same policy as the Flask app's; preflight requests are still answered by Flask
+    cors = {
+        'allow_origins': os.getenv('CORS_ORIGINS', 'http://localhost').split(','),
+        'allow_methods': ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+        'allow_headers': ["Content-Type", "Authorization"],
+        'expose_headers': ["X-Next-Cursor", "ETag", "Content-Range", "Accept-Ranges", "X-Trace-Id"]
+    }
+    routes = [
+        Route(route.path, CORSMiddleware(route.app, **cors), methods=route.methods, name=route.name)
+        for route in ingest.routes
+    ]
+
+    @asynccontextmanager
+    async def lifespan(app):
+        to_thread.current_default_thread_limiter().total_tokens = BaseConfig.ASGI_BLOCKING_THREADS
+        yield
+        await ingest.ingest_store.engine.dispose()
+
+    return Starlette(
+        routes=routes + [Mount('/', app=WSGIMiddleware(flask_app, workers=BaseConfig.ASGI_WSGI_THREADS))],
+        lifespan=lifespan
+    )
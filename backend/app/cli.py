@@ -0,0 +1,17 @@
+import click
+from flask.cli import with_appcontext
+from app.extensions import db
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """
+    Create any missing tables. Run once per deploy, before the API and
+    workers start (flask --app wsgi init-db); app startup never touches
+    the schema.
+    """
+    # Every model must be imported for create_all to see its table
+    import app.models  # noqa: F401
+
+    db.create_all()
+    click.echo('Database schema is up to date.')
@@ -1,5 +1,45 @@
+from functools import lru_cache
 from flask_sqlalchemy import SQLAlchemy
-from celery import Celery
+from celery.local import Proxy
+import redis
+from app.config.config import BaseConfig
 
 db = SQLAlchemy()
-celery = Celery() 
\ No newline at end of file
+
+@lru_cache(maxsize=None)
+def get_celery():
+    """
+    The Celery app, built on first use. Importing Celery costs the API
+    ~80ms at startup, and it is only needed once a job is submitted.
+    """
+    from celery import Celery
+
+    app = Celery()
+    # Current in every thread, not only the one that built it (shared_task resolves through it)
+    app.set_default()
+    # New-style setting names only; Celery refuses to mix them with CELERY_*
+    app.conf.update(
+        broker_url=BaseConfig.CELERY_BROKER_URL,
+        result_backend=BaseConfig.CELERY_RESULT_BACKEND,
+        broker_transport_options=BaseConfig.CELERY_BROKER_TRANSPORT_OPTIONS,
+        task_time_limit=BaseConfig.TASK_TIME_LIMIT
+    )
+    # Enqueue/run timing and trace ID propagation, on both sides of the broker
+    from app.utils.instrumentation import instrument_celery
+    instrument_celery()
+    return app
+
+@lru_cache(maxsize=None)
+def get_async_redis():
+    """
+    asyncio Redis client for the ASGI endpoints, built on first use so the
+    WSGI app and workers never import redis.asyncio. Its connections belong
+    to the event loop that first uses it.
+    """
+    import redis.asyncio
+
+    return redis.asyncio.Redis.from_url(BaseConfig.REDIS_URL)
+
+celery = Proxy(get_celery)
+# Connections are opened lazily and pooled per process
+redis_client = redis.Redis.from_url(BaseConfig.REDIS_URL)
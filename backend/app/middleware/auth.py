@@ -1,28 +1,67 @@
 from functools import wraps
-from flask import request, jsonify
+from typing import Optional
+from flask import g, request
 from app.utils.error_handling import AuthenticationError
 import jwt
-from app.config.config import BaseConfig
+from app.services.auth_cache import RevokedTokenError, auth_cache
+
+def _bearer_token() -> Optional[str]:
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return None
+    return auth_header[7:]
+
+def authenticate(auth_header: Optional[str]) -> dict:
+    """Claims of the bearer token in an Authorization header; raises AuthenticationError otherwise."""
+    if not auth_header:
+        raise AuthenticationError('No authorization header')
+    if not auth_header.startswith('Bearer '):
+        raise AuthenticationError('Invalid token')
+    try:
+        # Verified signatures are cached until the token expires or is revoked
+        return auth_cache.verify(auth_header[7:])
+    except jwt.ExpiredSignatureError:
+        raise AuthenticationError('Token has expired')
+    except RevokedTokenError:
+        raise AuthenticationError('Token has been revoked')
+    except jwt.InvalidTokenError:
+        raise AuthenticationError('Invalid token')
 
 def require_auth(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        auth_header = request.headers.get('Authorization')
-        
-        if not auth_header:
-            raise AuthenticationError('No authorization header')
-            
+        payload = authenticate(request.headers.get('Authorization'))
+        g.auth_claims = payload
+        # Loaded again, for these claims, if the route asks for it
+        g.pop('current_user', None)
+        # Add user_id to request context
+        request.user_id = payload['sub']
+        return f(*args, **kwargs)
+
+    return decorated
+
+def get_claims() -> Optional[dict]:
+    """Claims of the request's bearer token if it is valid, else None; checked once per request."""
+    if 'auth_claims' not in g:
+        token = _bearer_token()
         try:
-            # Remove 'Bearer ' prefix
-            token = auth_header.split(' ')[1]
-            # Verify token
-            payload = jwt.decode(token, BaseConfig.SECRET_KEY, algorithms=['HS256'])
-            # Add user_id to request context
-            request.user_id = payload['sub']
-            return f(*args, **kwargs)
-        except jwt.ExpiredSignatureError:
-            raise AuthenticationError('Token has expired')
+            g.auth_claims = auth_cache.verify(token) if token else None
         except jwt.InvalidTokenError:
-            raise AuthenticationError('Invalid token')
-            
-    return decorated 
\ No newline at end of file
+            g.auth_claims = None
+    return g.auth_claims
+
+def get_user_id():
+    """The authenticated user's ID if a valid bearer token was sent, else None."""
+    claims = get_claims()
+    return claims.get('sub') if claims else None
+
+def get_current_user() -> Optional[dict]:
+    """The authenticated user's record, loaded at most once per request and cached briefly across them."""
+    if 'current_user' not in g:
+        user_id = get_user_id()
+        g.current_user = auth_cache.get_user(user_id) if user_id else None
+    return g.current_user
+
+def get_tenant():
+    """Key that job limits are accounted under: the user, or the client address."""
+    return get_user_id() or f"ip:{request.remote_addr}"
@@ -1,28 +1,188 @@
 from functools import wraps
-from flask import request, jsonify
+from flask import Request, request, jsonify
 from werkzeug.utils import secure_filename
+from app.config.config import BaseConfig
+from app.utils.error_handling import AppError, FileTooLargeError, InvalidFileError
+import hashlib
 import os
+import re
+import tempfile
 
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_FILE_SIZE = BaseConfig.MAX_CONTENT_LENGTH
 ALLOWED_EXTENSIONS = {'pdf'}
 
+# Leading bytes each accepted file type must start with
+MAGIC_BYTES = {
+    'pdf': (b'%PDF-',),
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'jpg': (b'\xff\xd8\xff',),
+    'jpeg': (b'\xff\xd8\xff',),
+    'gif': (b'GIF87a', b'GIF89a'),
+    'tif': (b'II*\x00', b'MM\x00*'),
+    'tiff': (b'II*\x00', b'MM\x00*'),
+    'doc': (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1',),
+    'docx': (b'PK\x03\x04',),
+}
+# Readers accept the PDF header anywhere in the first 1024 bytes, and
+# expect startxref/%%EOF in the last 1024
+SNIFF_SIZE = 1024
+TAIL_SIZE = 1024
+STARTXREF = re.compile(rb'startxref\s+(\d+)\s+%%EOF')
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def file_extension(filename) -> str:
+    filename = secure_filename(filename or '')
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+def sniff(extension: str, head: bytes) -> None:
+    """Reject content whose leading bytes do not match its extension."""
+    if extension == 'pdf':
+        matches = b'%PDF-' in head[:SNIFF_SIZE]
+    else:
+        prefixes = MAGIC_BYTES.get(extension)
+        matches = bool(prefixes) and head.startswith(prefixes)
+    if not matches:
+        raise InvalidFileError(f"Content does not look like a .{extension or '?'} file")
+
+def inspect_pdf(file, size: int, tail: bytes) -> int:
+    """
+    Check a complete PDF's trailer and return its page count. Only the
+    cross-reference data and page tree root are read, not the pages.
+    """
+    # Imported on first use so it stays out of API startup
+    from PyPDF2 import PdfReader
+
+    match = STARTXREF.search(tail)
+    if not match or not 0 < int(match.group(1)) < size:
+        raise InvalidFileError('Truncated or malformed PDF: no valid startxref/%%EOF trailer')
+    try:
+        file.seek(0)
+        # len(reader.pages) would load every page dictionary to count them
+        count = PdfReader(file).trailer['/Root']['/Pages']['/Count']
+    except Exception as e:
+        raise InvalidFileError(f"Malformed PDF: {str(e)}")
+    finally:
+        file.seek(0)
+    if not isinstance(count, int) or count < 0:
+        raise InvalidFileError('Malformed PDF: invalid page count')
+    return int(count)
+
+def inspect_stored(backend, key: str, extension: str = 'pdf') -> dict:
+    """
+    Validate a file already in the storage backend (e.g. a joined chunked
+    upload) through ranged reads, without fetching the whole of it.
+    """
+    with backend.open(key) as f:
+        size = backend.size(key)
+        sniff(extension, f.read(SNIFF_SIZE))
+        if extension != 'pdf':
+            return {'size': size}
+        f.seek(max(0, size - TAIL_SIZE))
+        return {'size': size, 'page_count': inspect_pdf(f, size, f.read())}
+
+class ValidatingUploadStream:
+    """
+    Spool target for one uploaded file that validates while it is written:
+    the type is sniffed from the first KB, the size limit is enforced as
+    bytes arrive, and the SHA-256 is computed on the way through. Bad files
+    are rejected mid-upload, and nothing needs to read the file again to
+    hash it.
+    """
+
+    def __init__(self, filename: str, max_size: int = MAX_FILE_SIZE,
+                 scratch_dir: str = BaseConfig.UPLOAD_FOLDER):
+        self.extension = file_extension(filename)
+        self.max_size = max_size
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._head = b''
+        self._tail = b''
+        self._metadata = None
+        os.makedirs(scratch_dir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=scratch_dir, suffix='.upload')
+        self._file = os.fdopen(fd, 'w+b')
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        try:
+            if self.size > self.max_size:
+                raise FileTooLargeError(f"File too large. Maximum size is {self.max_size/1024/1024}MB")
+            if len(self._head) < SNIFF_SIZE:
+                self._head += data[:SNIFF_SIZE - len(self._head)]
+                if len(self._head) == SNIFF_SIZE:
+                    sniff(self.extension, self._head)
+        except AppError:
+            self.close()
+            raise
+        self._sha256.update(data)
+        self._tail = (self._tail + data)[-TAIL_SIZE:]
+        return self._file.write(data)
+
+    def finish(self) -> dict:
+        """Final checks once the file is complete; returns digest, size and page count."""
+        if self._metadata is None:
+            if len(self._head) < SNIFF_SIZE:
+                sniff(self.extension, self._head)
+            self._file.flush()
+            metadata = {'sha256': self._sha256.hexdigest(), 'size': self.size}
+            if self.extension == 'pdf':
+                metadata['page_count'] = inspect_pdf(self._file, self.size, self._tail)
+            self._metadata = metadata
+        return self._metadata
+
+    @property
+    def digest(self) -> str:
+        return self.finish()['sha256']
+
+    def close(self) -> None:
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+class ValidatingRequest(Request):
+    """Request whose multipart file parts are spooled through ValidatingUploadStream."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = ValidatingUploadStream(filename)
+        # Tracked here too: parts parsed before a rejected one never reach request.files
+        self.__dict__.setdefault('_upload_streams', []).append(stream)
+        return stream
+
+    def close(self) -> None:
+        super().close()
+        for stream in self.__dict__.pop('_upload_streams', []):
+            stream.close()
+
+def inspect_upload(file) -> dict:
+    """Digest, size and (for PDFs) page count of a validated upload."""
+    stream = file.stream
+    if isinstance(stream, ValidatingUploadStream):
+        return stream.finish()
+    return {}
+
 def validate_files(max_files=10):
     def decorator(f):
         @wraps(f)
         def wrapped(*args, **kwargs):
+            # Parsing the body runs the in-stream checks
+            try:
+                files = request.files.getlist('files[]')
+            except AppError as e:
+                return jsonify({'error': e.message, 'code': e.code}), e.status
+
             # Check if files are present
-            if 'files[]' not in request.files:
+            if not files:
                 return jsonify({
                     'error': 'No files provided',
                     'code': 'NO_FILES'
                 }), 400
 
-            files = request.files.getlist('files[]')
-            
             # Check number of files
             if len(files) > max_files:
                 return jsonify({
@@ -45,18 +205,16 @@ def validate_files(max_files=10):
                         'filename': file.filename
                     }), 400
 
-                # Check file size
-                file.seek(0, os.SEEK_END)
-                size = file.tell()
-                file.seek(0)
-                
-                if size > MAX_FILE_SIZE:
+                # Structure checks need the whole file; size and type were checked as it arrived
+                try:
+                    inspect_upload(file)
+                except AppError as e:
                     return jsonify({
-                        'error': f'File too large. Maximum size is {MAX_FILE_SIZE/1024/1024}MB',
-                        'code': 'FILE_TOO_LARGE',
+                        'error': e.message,
+                        'code': e.code,
                         'filename': file.filename
-                    }), 400
+                    }), e.status
 
             return f(*args, **kwargs)
         return wrapped
-    return decorator 
\ No newline at end of file
+    return decorator
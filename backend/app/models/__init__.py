@@ -0,0 +1,4 @@
+# Import every model so relationships resolve and db.create_all sees all tables
+from app.models.blob import Blob
+from app.models.document import Document
+from app.models.user import User
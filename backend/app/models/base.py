@@ -1,7 +1,22 @@
+from contextlib import contextmanager
 from datetime import datetime
+from typing import List
 from app.extensions import db
 import uuid
 
+@contextmanager
+def unit_of_work():
+    """
+    Group several writes into one transaction: use save(commit=False)
+    inside the block, and everything is committed once at the end.
+    """
+    try:
+        yield db.session
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
 class BaseModel(db.Model):
     """Base model class that includes CRUD convenience methods."""
     
@@ -11,10 +26,11 @@ class BaseModel(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    def save(self):
-        """Save the current instance."""
+    def save(self, commit=True):
+        """Save the current instance; commit=False defers to the surrounding unit of work."""
         db.session.add(self)
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return self
         
     def delete(self):
@@ -25,4 +41,39 @@ class BaseModel(db.Model):
     @classmethod
     def get_by_id(cls, id):
         """Get instance by ID."""
-        return cls.query.get(id) 
\ No newline at end of file
+        return cls.query.get(id)
+
+    @classmethod
+    def bulk_create(cls, rows: List[dict]) -> List[str]:
+        """Insert many rows with a single statement and commit; return their IDs."""
+        if not rows:
+            return []
+        now = datetime.utcnow()
+        rows = [
+            dict({'id': str(uuid.uuid4()), 'created_at': now, 'updated_at': now}, **row)
+            for row in rows
+        ]
+        db.session.execute(cls.__table__.insert(), rows)
+        db.session.commit()
+        return [row['id'] for row in rows]
+
+    @classmethod
+    def update_where(cls, id, values: dict, **conditions) -> bool:
+        """
+        UPDATE one row by ID without loading it, only if every condition
+        holds (a list means any of). Returns whether the row was updated.
+        """
+        query = cls.query.filter(cls.id == id)
+        for name, expected in conditions.items():
+            column = getattr(cls, name)
+            if isinstance(expected, (list, tuple, set)):
+                query = query.filter(column.in_(expected))
+            else:
+                query = query.filter(column == expected)
+        values = dict(values, updated_at=datetime.utcnow())
+        updated = query.update(
+            {getattr(cls, name): value for name, value in values.items()},
+            synchronize_session=False
+        )
+        db.session.commit()
+        return updated == 1
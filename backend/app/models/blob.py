@@ -0,0 +1,21 @@
+from app.extensions import db
+from app.models.base import BaseModel
+
+class Blob(BaseModel):
+    """A stored file, addressed by the SHA-256 of its content."""
+    __tablename__ = 'blobs'
+
+    digest = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    path = db.Column(db.String(500), nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+    documents = db.relationship('Document', backref='blob', lazy=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'digest': self.digest,
+            'size': self.size,
+            'ref_count': self.ref_count,
+            'created_at': self.created_at.isoformat()
+        }
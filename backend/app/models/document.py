@@ -5,6 +5,27 @@ from app.models.base import BaseModel
 
 class Document(BaseModel):
     __tablename__ = 'documents'
+    # Listing is keyset-paginated on (created_at, id), optionally filtered
+    __table_args__ = (
+        db.Index('ix_documents_created_at_id', 'created_at', 'id'),
+        db.Index('ix_documents_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_documents_status_created_at_id', 'status', 'created_at', 'id'),
+        db.Index('ix_documents_type_created_at_id', 'type', 'created_at', 'id'),
+        db.Index('ix_documents_parent_id_created_at_id', 'parent_id', 'created_at', 'id'),
+    )
+
+    # Public field name -> attribute, for sparse field selection
+    FIELDS = {
+        'id': 'id',
+        'name': 'name',
+        'status': 'status',
+        'created_at': 'created_at',
+        'url': 'url',
+        'type': 'type',
+        'size': 'size',
+        'parent_id': 'parent_id',
+        'metadata': 'metadata_'
+    }
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     name = db.Column(db.String(255), nullable=False)
@@ -14,16 +35,25 @@ class Document(BaseModel):
     type = db.Column(db.String(50))
     size = db.Column(db.Integer)
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=True)
-    metadata = db.Column(db.JSON)
+    blob_id = db.Column(db.String(36), db.ForeignKey('blobs.id'), nullable=True, index=True)
+    # Set on the outputs of split_pdf and extract_pages: the document they came from
+    parent_id = db.Column(db.String(36), db.ForeignKey('documents.id'), nullable=True)
+    # 'metadata' is reserved by SQLAlchemy's declarative base
+    metadata_ = db.Column('metadata', db.JSON)
+
+    @classmethod
+    def transition_status(cls, document_id: str, from_status, to_status: str, **values) -> bool:
+        """
+        Atomically move a document from from_status (or any of a list) to
+        to_status, setting values too. Returns False if it was in another
+        state or does not exist.
+        """
+        return cls.update_where(document_id, dict(values, status=to_status), status=from_status)
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'status': self.status,
-            'created_at': self.created_at.isoformat(),
-            'url': self.url,
-            'type': self.type,
-            'size': self.size,
-            'metadata': self.metadata
-        } 
\ No newline at end of file
+    def to_dict(self, fields=None):
+        """Serialize all fields, or only the given ones (which must be loaded)."""
+        data = {}
+        for field in fields or self.FIELDS:
+            value = getattr(self, self.FIELDS[field])
+            data[field] = value.isoformat() if field == 'created_at' and value else value
+        return data 
\ No newline at end of file
@@ -1,12 +1,22 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, current_app, request, jsonify, send_file, stream_with_context
 from app.services.document_service import DocumentService
 from app.services.storage_service import StorageService
-from app.extensions import db, celery
+from app.services.blob_service import BlobService
+from app.services.result_cache import ResultCache
+from app.services.upload_service import UploadService
+from app.services.download_service import DownloadService
+from app.services.page_index import PageIndexService
+from app.services.health_service import HealthMonitor
+from app.services.job_events import KEEPALIVE_SECONDS, TERMINAL_STATUSES, get_job_statuses, job_event_hub
+from app.services.job_scheduler import JobScheduler
 from werkzeug.utils import secure_filename
-from app.middleware.file_validation import validate_files
+from app.middleware.file_validation import file_extension, inspect_stored, inspect_upload, validate_files
+from app.config.config import BaseConfig
+import json
 import os
-from app.utils.error_handling import handle_errors
-from app.middleware.auth import require_auth
+import queue
+from app.utils.error_handling import handle_errors, AppError, AuthenticationError, InvalidFileError, ValidationError
+from app.middleware.auth import get_current_user, get_tenant, require_auth
 from flask_cors import cross_origin
 from typing import List
 
@@ -14,6 +24,35 @@ bp = Blueprint('api', __name__, url_prefix='/api')
 
 storage_service = StorageService()
 document_service = DocumentService(storage_service)
+blob_service = BlobService(storage_service)
+result_cache = ResultCache(blob_service)
+upload_service = UploadService(storage_service)
+download_service = DownloadService(storage_service)
+page_index_service = PageIndexService(storage_service)
+health_monitor = HealthMonitor(storage_service)
+
+def _owner_id():
+    """Owner of documents created by this request: the signed-in user, if any."""
+    user = get_current_user()
+    return user['id'] if user else None
+
+@bp.route('/livez', methods=['GET'])
+def liveness():
+    """Liveness probe: the process is serving requests. No I/O."""
+    return jsonify({'status': 'alive'}), 200
+
+def _readiness():
+    health_monitor.start(current_app._get_current_object())
+    return health_monitor.status()
+
+@bp.route('/readyz', methods=['GET'])
+def readiness():
+    """
+    Readiness probe: database, Redis, storage and broker as last checked
+    in the background, with each check's latency. 503 if any failed.
+    """
+    ready, checks = _readiness()
+    return jsonify({'status': 'ready' if ready else 'not ready', 'checks': checks}), 200 if ready else 503
 
 @bp.route('/health', methods=['GET'])
 @handle_errors
@@ -27,26 +66,19 @@ def health_check():
       500:
         description: Service is unhealthy
     """
-    try:
-        # Check database connection
-        db.session.execute('SELECT 1')
-        
-        # Check Redis connection
-        redis_health = celery.backend.client.ping()
-        
-        return jsonify({
-            'status': 'healthy',
-            'database': 'connected',
-            'redis': 'connected' if redis_health else 'error'
-        }), 200
-    except Exception as e:
-        return jsonify({
-            'status': 'unhealthy',
-            'error': str(e)
-        }), 500
+    # Served from the cached readiness checks; probes should use /livez and /readyz
+    ready, checks = _readiness()
+    return jsonify({
+        'status': 'healthy' if ready else 'unhealthy',
+        'database': 'connected' if checks['database']['ok'] else 'error',
+        'redis': 'connected' if checks['redis']['ok'] else 'error',
+        'checks': checks
+    }), 200 if ready else 500
 
 @bp.route('/documents/upload', methods=['POST'])
+@handle_errors
 def upload_document():
+    # Type and size are checked while the body is parsed; bad files fail here
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
     
@@ -54,14 +86,97 @@ def upload_document():
     if file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
     
+    metadata = inspect_upload(file)
     try:
         filename = secure_filename(file.filename)
-        document = document_service.create_document(filename)
-        storage_service.upload_file(file, f"{document.id}/{filename}")
+        file_type = file_extension(filename) or None
+        blob = blob_service.put_file(file)
+        document = document_service.create_document(
+            filename, file_type, blob.size, blob, metadata=dict(metadata, sha256=blob.digest), user_id=_owner_id()
+        )
         return jsonify({'message': 'File uploaded successfully', 'document_id': document.id}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/uploads', methods=['POST'])
+@handle_errors
+def create_upload():
+    """
+    Start a chunked upload
+    ---
+    parameters:
+      - in: body
+        name: body
+        schema:
+          properties:
+            filename: {type: string}
+            size: {type: integer}
+            chunk_size: {type: integer}
+    responses:
+      201:
+        description: Upload session created, with the ranges still missing
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        size = int(data.get('size', 0))
+        chunk_size = int(data['chunk_size']) if data.get('chunk_size') else None
+    except (TypeError, ValueError):
+        raise ValidationError('size and chunk_size must be integers')
+    return jsonify(upload_service.create_upload(data.get('filename'), size, chunk_size)), 201
+
+@bp.route('/uploads/<upload_id>', methods=['GET'])
+@handle_errors
+def get_upload(upload_id):
+    """Upload status, including the byte ranges a client still has to send."""
+    return jsonify(upload_service.get_upload(upload_id)), 200
+
+@bp.route('/uploads/<upload_id>/chunks/<int:offset>', methods=['PUT'])
+@handle_errors
+def put_upload_chunk(upload_id, offset):
+    """
+    Write one chunk at the given byte offset
+    ---
+    parameters:
+      - in: header
+        name: X-Chunk-SHA256
+        type: string
+        description: Hex SHA-256 of the chunk body, verified before the chunk is accepted
+    """
+    result = upload_service.write_chunk(
+        upload_id,
+        offset,
+        request.stream,
+        request.content_length,
+        request.headers.get('X-Chunk-SHA256')
+    )
+    return jsonify(result), 200
+
+@bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@handle_errors
+def complete_upload(upload_id):
+    """Finish a chunked upload and register it as a document."""
+    upload = upload_service.complete_upload(upload_id)
+    file_type = file_extension(upload['filename']) or 'pdf'
+    try:
+        # Read in place, a few ranges; the content is never fetched here
+        metadata = inspect_stored(storage_service.backend, upload['key'], file_type)
+    except InvalidFileError:
+        # Resending the same bytes would not help
+        upload_service.close_upload(upload_id)
+        raise
+    blob = blob_service.put_key(upload['key'], upload['digest'], metadata['size'])
+    try:
+        document = document_service.create_document(
+            upload['filename'], file_type, blob.size, blob, metadata=dict(metadata, sha256=blob.digest),
+            user_id=_owner_id()
+        )
+    except Exception:
+        blob_service.release([blob.id])
+        raise
+    # Only now is the upload kept elsewhere; until here, completing can be retried
+    upload_service.close_upload(upload_id)
+    return jsonify({'message': 'File uploaded successfully', 'document_id': document.id}), 200
+
 @bp.route('/documents/process', methods=['POST'])
 def process_document():
     data = request.json
@@ -69,12 +184,51 @@ def process_document():
         return jsonify({'error': 'Operation and document_id are required'}), 400
     
     try:
-        result = document_service.process_document(data['document_id'], data['operation'])
+        result = document_service.process_document(
+            data['document_id'],
+            data['operation'],
+            data.get('params'),
+            tenant=get_tenant()
+        )
         return jsonify(result), 202
+    except AppError as e:
+        return jsonify({'error': e.message, 'code': e.code}), e.status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/documents/pipeline', methods=['POST'])
+@handle_errors
+def process_pipeline():
+    """
+    Run several operations over documents as one job
+    ---
+    parameters:
+      - in: body
+        name: body
+        schema:
+          properties:
+            document_ids: {type: array, items: {type: string}}
+            steps:
+              type: array
+              description: "In order, e.g. [\"merge_pdfs\", {\"operation\": \"compress_pdf\", \"params\": {\"image_quality\": 60}}, \"linearize\"]"
+            name: {type: string}
+    responses:
+      202:
+        description: "{job_id, status, queue, document_id}; the output is a new document, per-step timings come with the final job status"
+    """
+    data = request.get_json(silent=True) or {}
+    result = document_service.process_pipeline(
+        data.get('document_ids'),
+        data.get('steps'),
+        tenant=get_tenant(),
+        name=data.get('name'),
+        user_id=_owner_id()
+    )
+    return jsonify(result), 202
+
 @bp.route('/jobs/<job_id>', methods=['GET'])
+@handle_errors
+@require_auth
 def get_job_status(job_id):
     try:
         status = document_service.get_job_status(job_id)
@@ -82,9 +236,73 @@ def get_job_status(job_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/jobs/<job_id>/events', methods=['GET'])
+@handle_errors
+@require_auth
+def stream_job_events(job_id):
+    """
+    Job progress as Server-Sent Events
+    ---
+    responses:
+      200:
+        description: text/event-stream of job status objects, closed once the job finishes
+    """
+    events = job_event_hub.subscribe(job_id)
+
+    def generate():
+        try:
+            # Current state first, so late subscribers do not wait for the next event
+            status = get_job_statuses([job_id])[job_id] or document_service.get_job_status(job_id)
+            yield f"data: {json.dumps(status)}\n\n"
+            while status.get('status') not in TERMINAL_STATUSES:
+                try:
+                    status = events.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    # Events can be lost (a full queue, a dropped subscription), the last
+                    # one too: whether the job has finished meanwhile is in Redis
+                    latest = get_job_statuses([job_id])[job_id]
+                    if not latest or latest.get('status') not in TERMINAL_STATUSES:
+                        yield ": keepalive\n\n"
+                        continue
+                    status = latest
+                yield f"data: {json.dumps(status)}\n\n"
+        finally:
+            job_event_hub.unsubscribe(job_id, events)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@bp.route('/jobs/status', methods=['POST'])
+@handle_errors
+@require_auth
+def get_job_statuses_batch():
+    """
+    Status of many jobs in one call
+    ---
+    parameters:
+      - in: body
+        name: body
+        schema:
+          properties:
+            job_ids: {type: array, items: {type: string}}
+    """
+    job_ids = (request.get_json(silent=True) or {}).get('job_ids')
+    if not isinstance(job_ids, list) or not job_ids:
+        raise ValidationError('job_ids must be a non-empty list')
+    if len(job_ids) > BaseConfig.JOB_STATUS_BATCH_LIMIT:
+        raise ValidationError(f'At most {BaseConfig.JOB_STATUS_BATCH_LIMIT} job_ids per request')
+
+    statuses = get_job_statuses(job_ids)
+    return jsonify({
+        'jobs': [statuses[job_id] or document_service.get_job_status(job_id) for job_id in job_ids]
+    }), 200
+
 @bp.route('/documents/merge', methods=['POST'])
 @handle_errors
-@validate_files(max_files=10)
+@validate_files(max_files=BaseConfig.MERGE_MAX_FILES)
 @cross_origin()
 def merge_documents():
     """
@@ -98,6 +316,10 @@ def merge_documents():
           type: file
         required: true
         description: PDF files to merge
+      - in: formData
+        name: linearize
+        type: boolean
+        description: Write the result linearized (fast web view)
     responses:
       202:
         description: Merge process started
@@ -106,23 +328,54 @@ def merge_documents():
       500:
         description: Processing error
     """
+    blobs = []
+    document = None
     try:
         files = request.files.getlist('files[]')
         
-        # Save uploaded files
-        pdf_paths = []
+        # Store uploaded files; content already stored is not written again
         for file in files:
-            path = storage_service.upload_file(file, file.filename)
-            pdf_paths.append(path)
+            blobs.append(blob_service.put_file(file))
+        pages = sum(inspect_upload(file).get('page_count') or 1 for file in files)
+        
+        linearize = request.form.get('linearize', '').lower() in ('1', 'true')
+        
+        # Serve repeated merges of the same inputs from the result cache
+        cache_key = ResultCache.make_key(
+            'merge_pdfs',
+            [blob.digest for blob in blobs],
+            {'linearize': True} if linearize else None
+        )
+        cached = result_cache.get(cache_key)
+        if cached:
+            document = document_service.create_document(
+                'merged.pdf', 'pdf', cached.size, cached, 'completed', metadata={'sha256': cached.digest},
+                user_id=_owner_id()
+            )
+            blob_service.release(blob.id for blob in blobs)
+            return jsonify({
+                'message': 'Merge result served from cache',
+                'job_id': None,
+                'document_id': document.id,
+                'status': 'completed'
+            }), 200
         
         # Create merged document record
-        document = document_service.create_document('merged.pdf')
+        document = document_service.create_document('merged.pdf', 'pdf', None, user_id=_owner_id())
         
-        # Queue merge task
+        # Queue merge task; it releases the input blobs when done
         result = document_service.process_document(
             document.id, 
             'merge_pdfs',
-            {'pdf_paths': pdf_paths, 'output_filename': f"{document.id}_merged.pdf"}
+            {
+                'pdf_keys': [blob.path for blob in blobs],
+                'input_blob_ids': [blob.id for blob in blobs],
+                'cache_key': cache_key,
+                'output_filename': f"{document.id}_merged.pdf",
+                'linearize': linearize
+            },
+            tenant=get_tenant(),
+            cost=JobScheduler.estimate_cost(pages, sum(blob.size for blob in blobs))
         )
         
         return jsonify({
@@ -131,27 +384,156 @@ def merge_documents():
             'document_id': document.id
         }), 202
         
+    except AppError as e:
+        # Not admitted (e.g. rate limited): nothing was queued
+        blob_service.release(blob.id for blob in blobs)
+        if document:
+            document.delete()
+        return jsonify({'error': e.message, 'code': e.code}), e.status
     except Exception as e:
+        blob_service.release(blob.id for blob in blobs)
         return jsonify({
             'error': str(e),
             'code': 'PROCESSING_ERROR'
         }), 500
 
+@bp.route('/queues/metrics', methods=['GET'])
+@handle_errors
+def queue_metrics():
+    """
+    Per-queue depth and wait times, for scaling each worker pool
+    ---
+    responses:
+      200:
+        description: "{queue: {depth, oldest_wait_seconds, wait_p50_seconds, wait_p95_seconds, started_total}}"
+    """
+    return jsonify(document_service.job_scheduler.metrics()), 200
+
+@bp.route('/cache/stats', methods=['GET'])
+@handle_errors
+def cache_stats():
+    """Result cache hit/miss/eviction counters, shared by all replicas."""
+    return jsonify(result_cache.stats()), 200
+
 @bp.route('/documents/download/<filename>', methods=['GET'])
+@handle_errors
+@require_auth
 def download_document(filename):
     try:
         file_path = storage_service.get_file_path(filename)
-        return send_file(file_path, as_attachment=True)
+        return send_file(file_path, as_attachment=True, conditional=True)
     except Exception as e:
         return jsonify({'error': str(e)}), 404
 
+@bp.route('/documents/<document_id>/download', methods=['GET'])
+@handle_errors
+@require_auth
+def download_document_content(document_id):
+    """
+    Download a document's content
+    ---
+    parameters:
+      - {in: header, name: Range, type: string, description: "A single byte range, e.g. bytes=0-1023"}
+      - {in: header, name: If-None-Match, type: string, description: ETag from an earlier download}
+    responses:
+      200:
+        description: The content; ETag is its SHA-256
+      206:
+        description: The requested byte range
+      302:
+        description: Redirect to a presigned object-store URL (DOWNLOAD_MODE=presign)
+      304:
+        description: Unchanged since the ETag given in If-None-Match
+      404:
+        description: Document not found or has no content
+    """
+    return download_service.build_response(document_id, request)
+
+@bp.route('/documents/<document_id>/pages/<int:number>', methods=['GET'])
+@handle_errors
+@require_auth
+def get_document_page(document_id, number):
+    """
+    One page of a document, extracted on demand
+    ---
+    parameters:
+      - {in: path, name: number, type: integer, description: 1-based page number}
+      - {in: query, name: format, type: string, description: "pdf (default) or thumbnail (PNG)"}
+      - {in: query, name: width, type: integer, description: "Thumbnail width in pixels (default 200)"}
+    responses:
+      200:
+        description: A one-page PDF, or a PNG thumbnail
+      404:
+        description: Document or page not found
+    """
+    output_format = request.args.get('format', 'pdf')
+    if output_format not in ('pdf', 'thumbnail'):
+        raise ValidationError('format must be pdf or thumbnail')
+    try:
+        width = min(max(int(request.args.get('width', 200)), 16), 1024)
+    except ValueError:
+        raise ValidationError('width must be an integer')
+
+    download = download_service.get_download(document_id)
+    etag = f"{download['digest']}-{number}-{output_format}" + (f"-{width}" if output_format == 'thumbnail' else '')
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif output_format == 'thumbnail':
+        response = Response(
+            page_index_service.thumbnail(download['digest'], download['key'], number, width),
+            mimetype='image/png'
+        )
+    else:
+        response = Response(
+            page_index_service.extract_page(download['digest'], download['key'], number),
+            mimetype='application/pdf'
+        )
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @bp.route('/documents', methods=['GET'])
+@handle_errors
+@require_auth
 def get_documents():
+    """
+    List the caller's documents, newest first
+    ---
+    parameters:
+      - {in: query, name: limit, type: integer, description: "Page size (default 50, max DOCUMENTS_PAGE_LIMIT)"}
+      - {in: query, name: cursor, type: string, description: Value of X-Next-Cursor from the previous page}
+      - {in: query, name: status, type: string}
+      - {in: query, name: type, type: string}
+      - {in: query, name: parent_id, type: string, description: Only the parts split or extracted from this document}
+      - {in: query, name: fields, type: string, description: "Comma-separated fields to return, e.g. id,name,status"}
+    responses:
+      200:
+        description: A page of documents; X-Next-Cursor is set when more pages follow
+    """
     try:
-        documents = Document.query.order_by(Document.created_at.desc()).all()
-        return jsonify([doc.to_dict() for doc in documents])
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        limit = min(int(request.args.get('limit', 50)), BaseConfig.DOCUMENTS_PAGE_LIMIT)
+    except ValueError:
+        raise ValidationError('limit must be an integer')
+    if limit < 1:
+        raise ValidationError('limit must be positive')
+    fields = [field for field in request.args.get('fields', '').split(',') if field] or None
+    user = get_current_user()
+    if user is None:
+        raise AuthenticationError('Unknown user')
+
+    documents, next_cursor = document_service.list_documents(
+        user_id=user['id'],
+        status=request.args.get('status'),
+        doc_type=request.args.get('type'),
+        cursor=request.args.get('cursor'),
+        parent_id=request.args.get('parent_id'),
+        limit=limit,
+        fields=fields
+    )
+    response = jsonify([doc.to_dict(fields) for doc in documents])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 @bp.errorhandler(413)
 def request_entity_too_large(error):
@@ -0,0 +1,313 @@
+"""
+Async versions of the endpoints that hold client connections longest:
+upload, job status (with event streams) and download. app.asgi serves
+them in front of the Flask app, which keeps every other route; request
+and response shapes are the same as in app.routes.api.
+
+A slow client costs a coroutine, not a thread: bodies are parsed as they
+arrive, Redis and the database are reached through asyncio clients, and
+only file I/O and CPU-bound checks run in (short) thread hops.
+"""
+import asyncio
+import json
+import logging
+import time
+import traceback
+from functools import wraps
+from typing import Optional
+
+from anyio.to_thread import run_sync
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import iterate_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.http import parse_etags, quote_etag
+from werkzeug.utils import secure_filename
+
+from app.config.config import BaseConfig
+from app.middleware.auth import authenticate
+from app.middleware.file_validation import SNIFF_SIZE, ValidatingUploadStream, file_extension
+from app.services.document_service import DocumentService
+from app.services.download_service import DownloadService
+from app.services.ingest_store import IngestStore
+from app.services.job_events import KEEPALIVE_SECONDS, TERMINAL_STATUSES, async_job_event_hub, get_job_statuses_async
+from app.services.storage_backends import LocalStorageBackend
+from app.services.storage_service import StorageService
+from app.utils.error_handling import AppError, FileTooLargeError, ValidationError
+from app.utils.instrumentation import REQUEST_SECONDS, TRACE_HEADER, trace
+
+logger = logging.getLogger(__name__)
+
+# Upload data is handed to a thread for writing once this much has arrived
+WRITE_SIZE = 256 * 1024
+
+storage_service = StorageService()
+ingest_store = IngestStore(storage_service)
+download_service = DownloadService(storage_service)
+
+def endpoint(f):
+    """Trace ID, request timing and AppError responses, as the Flask app gives its routes."""
+    @wraps(f)
+    async def wrapper(request: Request) -> Response:
+        started = time.perf_counter()
+        with trace(request.headers.get(TRACE_HEADER)) as trace_id:
+            try:
+                response = await f(request)
+            except AppError as e:
+                logger.error(f"Application error: {str(e)}")
+                response = JSONResponse({'error': e.message, 'code': e.code}, e.status)
+            except Exception as e:
+                logger.error(f"Unexpected error: {str(e)}\n{traceback.format_exc()}")
+                response = JSONResponse({'error': 'An unexpected error occurred', 'code': 'INTERNAL_ERROR'}, 500)
+        # Streamed bodies (downloads, job events) are sent after this point
+        REQUEST_SECONDS.labels(request.method, f"api.{f.__name__}", response.status_code).observe(
+            time.perf_counter() - started
+        )
+        response.headers[TRACE_HEADER] = trace_id
+        return response
+    return wrapper
+
+def require_auth(f):
+    """app.middleware.auth.require_auth for the async endpoints; the caller's ID is request.state.user_id."""
+    @wraps(f)
+    async def wrapper(request: Request) -> Response:
+        # A thread hop: a token not yet cached costs a signature check and a Redis round trip
+        claims = await run_sync(authenticate, request.headers.get('authorization'))
+        request.state.user_id = claims['sub']
+        return await f(request)
+    return wrapper
+
+class MultipartFileReceiver:
+    """
+    Parses a multipart body as it arrives and spools the first file part
+    named field through a ValidatingUploadStream, so type, size and hash
+    are checked on the way in as with the Flask app. Data is written in
+    threads, a batch at a time; the rest of the body is discarded.
+    """
+
+    def __init__(self, boundary: bytes, field: str, max_size: int = BaseConfig.MAX_CONTENT_LENGTH):
+        self.field = field.encode()
+        self.max_size = max_size
+        self.received = 0
+        self.found = False
+        self.filename: Optional[str] = None
+        self.stream: Optional[ValidatingUploadStream] = None
+        self._header_field = b''
+        self._header_value = b''
+        self._disposition = b''
+        self._in_part = False
+        self._pending = bytearray()
+        self._parser = MultipartParser(boundary, {
+            'on_part_begin': self._on_part_begin,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+        })
+
+    async def feed(self, chunk: bytes) -> None:
+        self.received += len(chunk)
+        if self.received > self.max_size:
+            raise FileTooLargeError('File too large')
+        try:
+            self._parser.write(chunk)
+        except MultipartParseError as e:
+            raise ValidationError(f"Malformed multipart body: {str(e)}")
+        # The first write is early so the type is sniffed before much is spooled
+        if len(self._pending) >= (WRITE_SIZE if self.stream and self.stream.size else SNIFF_SIZE):
+            await self._flush()
+
+    async def finish(self) -> None:
+        """Once the body has ended: stream is set if a named file part was found, even an empty one."""
+        try:
+            self._parser.finalize()
+        except MultipartParseError as e:
+            raise ValidationError(f"Malformed multipart body: {str(e)}")
+        await self._flush()
+        if self.filename and self.stream is None:
+            self.stream = await run_sync(ValidatingUploadStream, self.filename)
+
+    def close(self) -> None:
+        if self.stream is not None:
+            self.stream.close()
+
+    async def _flush(self) -> None:
+        if not self._pending or not self.filename:
+            return
+        if self.stream is None:
+            self.stream = await run_sync(ValidatingUploadStream, self.filename)
+        data, self._pending = bytes(self._pending), bytearray()
+        await run_sync(self.stream.write, data)
+
+    def _on_part_begin(self) -> None:
+        self._disposition = b''
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        if self._header_field.lower() == b'content-disposition':
+            self._disposition = self._header_value
+        self._header_field = self._header_value = b''
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        # A part without a filename is a form field, not a file
+        if not self.found and options.get(b'name') == self.field and b'filename' in options:
+            self.found = self._in_part = True
+            self.filename = options[b'filename'].decode('utf-8', 'replace')
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_part and self.filename:
+            self._pending += data[start:end]
+
+    def _on_part_end(self) -> None:
+        self._in_part = False
+
+@endpoint
+async def upload_document(request: Request) -> Response:
+    length = request.headers.get('content-length', '')
+    if length.isdigit() and int(length) > BaseConfig.MAX_CONTENT_LENGTH:
+        return JSONResponse({'error': 'File too large', 'code': 'FILE_TOO_LARGE'}, 413)
+    content_type, options = parse_options_header(request.headers.get('content-type', ''))
+    if content_type != b'multipart/form-data' or not options.get(b'boundary'):
+        return JSONResponse({'error': 'No file provided'}, 400)
+
+    # Type and size are checked while the body arrives; bad files fail here
+    receiver = MultipartFileReceiver(options[b'boundary'], 'file')
+    try:
+        async for chunk in request.stream():
+            await receiver.feed(chunk)
+        await receiver.finish()
+        if not receiver.found:
+            return JSONResponse({'error': 'No file provided'}, 400)
+        if not receiver.filename:
+            return JSONResponse({'error': 'No file selected'}, 400)
+
+        metadata = await run_sync(receiver.stream.finish)
+        try:
+            filename = secure_filename(receiver.filename)
+            document_id = await ingest_store.adopt_upload(
+                receiver.stream, filename, file_extension(filename) or None,
+                metadata=dict(metadata, sha256=receiver.stream.digest), user_id=await _owner_id(request)
+            )
+            return JSONResponse({'message': 'File uploaded successfully', 'document_id': document_id}, 200)
+        except Exception as e:
+            return JSONResponse({'error': str(e)}, 500)
+    finally:
+        receiver.close()
+
+async def _owner_id(request: Request) -> Optional[str]:
+    """app.routes.api._owner_id: the uploader, if a valid token of a known user was sent."""
+    try:
+        claims = await run_sync(authenticate, request.headers.get('authorization'))
+    except AppError:
+        return None
+    return claims['sub'] if await ingest_store.user_exists(claims['sub']) else None
+
+async def _job_status(job_id: str, published: Optional[dict]) -> dict:
+    # Jobs with no published event yet are looked up in the result backend
+    return published or await run_sync(DocumentService.get_job_status, job_id)
+
+@endpoint
+@require_auth
+async def get_job_status(request: Request) -> Response:
+    job_id = request.path_params['job_id']
+    statuses = await get_job_statuses_async([job_id])
+    return JSONResponse(await _job_status(job_id, statuses[job_id]), 200)
+
+@endpoint
+@require_auth
+async def get_job_statuses_batch(request: Request) -> Response:
+    try:
+        job_ids = (await request.json() or {}).get('job_ids')
+    except (ValueError, AttributeError):
+        job_ids = None
+    if not isinstance(job_ids, list) or not job_ids:
+        raise ValidationError('job_ids must be a non-empty list')
+    if len(job_ids) > BaseConfig.JOB_STATUS_BATCH_LIMIT:
+        raise ValidationError(f'At most {BaseConfig.JOB_STATUS_BATCH_LIMIT} job_ids per request')
+
+    statuses = await get_job_statuses_async(job_ids)
+    jobs = await asyncio.gather(*(_job_status(job_id, statuses[job_id]) for job_id in job_ids))
+    return JSONResponse({'jobs': list(jobs)}, 200)
+
+@endpoint
+@require_auth
+async def stream_job_events(request: Request) -> Response:
+    job_id = request.path_params['job_id']
+    events = async_job_event_hub.subscribe(job_id)
+
+    async def generate():
+        try:
+            # Current state first, so late subscribers do not wait for the next event
+            status = await _job_status(job_id, (await get_job_statuses_async([job_id]))[job_id])
+            yield f"data: {json.dumps(status)}\n\n"
+            while status.get('status') not in TERMINAL_STATUSES:
+                try:
+                    status = await asyncio.wait_for(events.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # As in app.routes.api: a lost final event must not hold the stream open
+                    latest = (await get_job_statuses_async([job_id]))[job_id]
+                    if not latest or latest.get('status') not in TERMINAL_STATUSES:
+                        yield ": keepalive\n\n"
+                        continue
+                    status = latest
+                yield f"data: {json.dumps(status)}\n\n"
+        finally:
+            async_job_event_hub.unsubscribe(job_id, events)
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@endpoint
+@require_auth
+async def download_document_content(request: Request) -> Response:
+    download = await ingest_store.get_download(request.path_params['document_id'])
+    etag = download['digest']
+    if parse_etags(request.headers.get('if-none-match')).contains(etag):
+        return Response(status_code=304, headers={'ETag': quote_etag(etag)})
+
+    backend = storage_service.backend
+    if download_service.mode == 'presign':
+        url = await run_sync(backend.presigned_url, download['key'], download['name'], BaseConfig.DOWNLOAD_URL_EXPIRY)
+        if url:
+            return RedirectResponse(url, 302, headers={'ETag': quote_etag(etag)})
+    if download_service.mode == 'accel' and isinstance(backend, LocalStorageBackend):
+        return Response(
+            media_type=download['mimetype'],
+            headers=dict(DownloadService.accel_headers(download), ETag=quote_etag(etag))
+        )
+
+    # Local files are streamed too (no sendfile here), one block per thread hop
+    size = download['size']
+    status, start, end = DownloadService.byte_range(
+        size, etag, request.headers.get('range'), request.headers.get('if-range')
+    )
+    if status == 416:
+        return Response(status_code=416, headers={'Content-Range': f"bytes */{size}"})
+    chunks = backend.iter_range(download['key'], start, end) if size else iter(())
+    return StreamingResponse(
+        iterate_in_threadpool(chunks),
+        status_code=status,
+        media_type=download['mimetype'],
+        headers=dict(DownloadService.stream_headers(download, status, start, end), ETag=quote_etag(etag))
+    )
+
+routes = [
+    Route('/api/documents/upload', upload_document, methods=['POST']),
+    Route('/api/jobs/status', get_job_statuses_batch, methods=['POST']),
+    Route('/api/jobs/{job_id}', get_job_status, methods=['GET']),
+    Route('/api/jobs/{job_id}/events', stream_job_events, methods=['GET']),
+    Route('/api/documents/{document_id}/download', download_document_content, methods=['GET']),
+]
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+import jwt
+from redis.exceptions import RedisError
+from app.config.config import BaseConfig
+from app.extensions import redis_client
+from app.models.user import User
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'auth_revocations'
+# How long revocations are remembered for tokens without an exp claim
+REVOCATION_TTL = 30 * 24 * 60 * 60
+
+class RevokedTokenError(jwt.InvalidTokenError):
+    pass
+
+class TTLCache:
+    """Thread-safe LRU map of bounded size whose entries also expire."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at: Optional[float] = None) -> None:
+        """Store value until expires_at (epoch seconds) or the TTL, whichever is sooner."""
+        if self.max_size <= 0:
+            return
+        expires_at = min(time.time() + self.ttl, expires_at or float('inf'))
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def pop_where(self, predicate: Callable) -> None:
+        with self._lock:
+            for key in [key for key, (value, _) in self._entries.items() if predicate(value)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class AuthCache:
+    """
+    Verified JWT claims and user records, cached per process so frequent
+    requests skip signature checks and user queries.
+
+    Claims are kept until the token's exp or TOKEN_CACHE_TTL, whichever
+    comes first. Revocations are recorded in Redis, where every cache miss
+    checks them, and broadcast to all processes, which drop the affected
+    entries. Each process holds one pub/sub subscription, read by a
+    background thread; TOKEN_CACHE_TTL bounds how long a missed broadcast
+    can matter.
+    """
+
+    def __init__(self, redis=redis_client, secret: str = BaseConfig.SECRET_KEY,
+                 token_cache_size: int = BaseConfig.TOKEN_CACHE_SIZE,
+                 token_ttl: float = BaseConfig.TOKEN_CACHE_TTL,
+                 user_cache_size: int = BaseConfig.USER_CACHE_SIZE,
+                 user_ttl: float = BaseConfig.USER_CACHE_TTL):
+        self.redis = redis
+        self.secret = secret
+        self.tokens = TTLCache(token_cache_size, token_ttl)
+        self.users = TTLCache(user_cache_size, user_ttl)
+        # Bumped on every revocation; a verification that raced one is not cached
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _token_key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def verify(self, token: str) -> dict:
+        """Claims of a valid token; raises jwt.InvalidTokenError (or a subclass) otherwise."""
+        key = self._token_key(token)
+        claims = self.tokens.get(key)
+        if claims is not None:
+            return claims
+
+        generation = self._generation
+        claims = jwt.decode(token, self.secret, algorithms=['HS256'])
+        try:
+            token_revoked, user_revoked_at = self.redis.mget([
+                f"auth:revoked_token:{key}", f"auth:revoked_user:{claims.get('sub')}"
+            ])
+        except RedisError as e:
+            # Revocations are unknown: accept the verified signature, but do not cache it
+            logger.warning(f"Failed to check token revocations: {str(e)}")
+            return claims
+        if token_revoked or (user_revoked_at and claims.get('iat', 0) <= float(user_revoked_at)):
+            raise RevokedTokenError('Token has been revoked')
+
+        self._ensure_listening()
+        if generation == self._generation:
+            self.tokens.set(key, claims, claims.get('exp'))
+        return claims
+
+    def get_user(self, user_id: str) -> Optional[dict]:
+        """The user's record as a dict, from the cache or the database (None if unknown)."""
+        user = self.users.get(user_id)
+        if user is None:
+            record = User.get_by_id(user_id)
+            if record is None:
+                return None
+            user = record.to_dict()
+            self.users.set(user_id, user)
+        return user
+
+    def revoke_token(self, token: str) -> None:
+        """Refuse this token from now on, in every process."""
+        claims = jwt.decode(token, options={'verify_signature': False})
+        ttl = int(claims['exp'] - time.time()) if 'exp' in claims else REVOCATION_TTL
+        key = self._token_key(token)
+        if ttl > 0:
+            self.redis.set(f"auth:revoked_token:{key}", 1, ex=ttl)
+        self._publish({'token': key})
+
+    def revoke_user(self, user_id: str) -> None:
+        """Refuse every token issued to the user until now (e.g. password change, logout everywhere)."""
+        self.redis.set(f"auth:revoked_user:{user_id}", time.time(), ex=REVOCATION_TTL)
+        self._publish({'user': user_id, 'tokens': True})
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop the cached user record everywhere, e.g. after the user was updated."""
+        self._publish({'user': user_id})
+
+    def _publish(self, event: dict) -> None:
+        # Applied here straight away; other processes apply it from the broadcast
+        self._apply(event)
+        self.redis.publish(CHANNEL, json.dumps(event))
+
+    def _apply(self, event: dict) -> None:
+        with self._lock:
+            self._generation += 1
+        if 'token' in event:
+            self.tokens.pop(event['token'])
+        if 'user' in event:
+            self.users.pop(event['user'])
+            if event.get('tokens'):
+                self.tokens.pop_where(lambda claims: claims.get('sub') == event['user'])
+
+    def _ensure_listening(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen, name='auth-revocations', daemon=True)
+                self._thread.start()
+
+    def _listen(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(CHANNEL)
+                for message in pubsub.listen():
+                    try:
+                        self._apply(json.loads(message['data']))
+                    except ValueError:
+                        continue
+            except Exception as e:
+                logger.warning(f"Revocation subscription lost, reconnecting: {str(e)}")
+                # Anything missed meanwhile must not outlive the outage
+                self.tokens.clear()
+                self.users.clear()
+                time.sleep(1)
+            finally:
+                pubsub.close()
+
+auth_cache = AuthCache()
@@ -0,0 +1,189 @@
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import BinaryIO, Iterable, List, Optional
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.models.blob import Blob
+from app.services.storage_service import StorageService
+import logging
+
+logger = logging.getLogger(__name__)
+
+class BlobService:
+    """
+    Content-addressed, reference-counted file storage.
+
+    put_file and put_path return a Blob holding one new reference; callers
+    hand that reference to a Document (or keep it for the lifetime of a job)
+    and give it back with release. Blobs whose count drops to zero are
+    removed by collect_garbage after a grace period.
+    """
+
+    GC_GRACE_PERIOD = timedelta(hours=1)
+
+    def __init__(self, storage_service: StorageService):
+        self.storage_service = storage_service
+
+    def put_file(self, file: BinaryIO) -> Blob:
+        """Store an uploaded file; duplicates cost one hash pass and no write."""
+        stream = getattr(file, 'stream', file)
+        if getattr(stream, 'digest', None):
+            return self._put_validated(stream)
+        digest, size = self.storage_service.hash_stream(stream)
+        blob = self._acquire(digest)
+        if blob:
+            return blob
+        stream.seek(0)
+        path = self.storage_service.write_blob(stream, digest)
+        return self._create(digest, size, path)
+
+    def _put_validated(self, stream) -> Blob:
+        """An upload hashed while it was spooled: adopt its scratch file without reading it."""
+        blob = self._acquire(stream.digest)
+        if blob:
+            return blob
+        stream.flush()
+        path = self.storage_service.move_to_blob(stream.path, stream.digest)
+        return self._create(stream.digest, stream.size, path)
+
+    def put_path(self, file_path: str) -> Blob:
+        """Adopt a file already written to storage, e.g. a task output."""
+        with open(file_path, 'rb') as f:
+            digest, size = self.storage_service.hash_stream(f)
+        blob = self._acquire(digest)
+        if blob:
+            os.remove(file_path)
+            return blob
+        path = self.storage_service.move_to_blob(file_path, digest)
+        return self._create(digest, size, path)
+
+    def put_key(self, key: str, digest: str, size: int) -> Blob:
+        """
+        Adopt content already in the storage backend under key, e.g. a
+        joined chunked upload whose digest is known: it is copied into
+        place within the backend if new. key itself is left to the caller.
+        """
+        blob = self._acquire(digest)
+        if blob:
+            return blob
+        path = self.storage_service.copy_to_blob(key, digest)
+        return self._create(digest, size, path)
+
+    def put_paths(self, file_paths: List[str]) -> List[Blob]:
+        """
+        put_path for many files, e.g. the parts of a split: new content is
+        stored with one SELECT and one INSERT for the whole batch instead of
+        a few round trips per file. Returns one Blob per path, in order.
+        """
+        hashed = []
+        for file_path in file_paths:
+            with open(file_path, 'rb') as f:
+                hashed.append(self.storage_service.hash_stream(f))
+        digests = [digest for digest, _ in hashed]
+        existing = {
+            digest for (digest,) in
+            Blob.query.with_entities(Blob.digest).filter(Blob.digest.in_(set(digests))).all()
+        }
+
+        # Content seen before goes the usual way; new content, once per digest
+        by_digest = {}
+        rows = {}
+        for file_path, (digest, size) in zip(file_paths, hashed):
+            if digest in existing:
+                by_digest[digest] = self.put_path(file_path)
+            elif digest in rows:
+                rows[digest]['ref_count'] += 1
+                os.remove(file_path)
+            else:
+                path = self.storage_service.move_to_blob(file_path, digest)
+                rows[digest] = {'digest': digest, 'size': size, 'path': path, 'ref_count': 1}
+        if rows:
+            try:
+                Blob.bulk_create(list(rows.values()))
+            except IntegrityError:
+                # Another request stored some of the same content first
+                db.session.rollback()
+                for row in rows.values():
+                    for _ in range(row['ref_count']):
+                        self._acquire(row['digest']) or self._create(row['digest'], row['size'], row['path'])
+            by_digest.update(
+                (blob.digest, blob) for blob in Blob.query.filter(Blob.digest.in_(list(rows))).all()
+            )
+        return [by_digest[digest] for digest in digests]
+
+    def acquire(self, blob_id: str) -> Optional[Blob]:
+        """Take one more reference on a stored blob, or None if it is gone."""
+        updated = Blob.query.filter_by(id=blob_id).update(
+            {Blob.ref_count: Blob.ref_count + 1, Blob.updated_at: datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.session.commit()
+        return Blob.query.get(blob_id) if updated else None
+
+    def release(self, blob_ids: Iterable[str]) -> None:
+        """Drop one reference per id (ids may repeat), in one UPDATE per distinct count."""
+        by_count = defaultdict(list)
+        for blob_id, count in Counter(blob_ids).items():
+            by_count[count].append(blob_id)
+        if not by_count:
+            return
+        for count, ids in by_count.items():
+            Blob.query.filter(Blob.id.in_(ids), Blob.ref_count >= count).update(
+                {Blob.ref_count: Blob.ref_count - count, Blob.updated_at: datetime.utcnow()},
+                synchronize_session=False
+            )
+        db.session.commit()
+
+    def collect_garbage(self, grace_period: timedelta = GC_GRACE_PERIOD) -> int:
+        """Delete unreferenced blobs older than grace_period; return how many."""
+        cutoff = datetime.utcnow() - grace_period
+        candidates = Blob.query.with_entities(Blob.id, Blob.digest).filter(
+            Blob.ref_count == 0, Blob.updated_at < cutoff
+        ).all()
+
+        removed = 0
+        for blob_id, digest in candidates:
+            # Lock the row if it is still unreferenced, then delete file and row
+            # under that lock: a put of the same content waits for the commit,
+            # finds no row and writes the file afresh, rather than taking a
+            # reference on (or rewriting) a file that is about to be deleted
+            blob = Blob.query.filter(Blob.id == blob_id, Blob.ref_count == 0).with_for_update().first()
+            if blob is None:
+                db.session.commit()
+                continue
+            try:
+                self.storage_service.delete_blob(digest)
+                Blob.query.filter(Blob.id == blob_id).delete(synchronize_session=False)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Failed to collect blob {blob_id}: {str(e)}")
+                continue
+            removed += 1
+        logger.info(f"Blob GC removed {removed} of {len(candidates)} candidates")
+        return removed
+
+    def _acquire(self, digest: str):
+        updated = Blob.query.filter_by(digest=digest).update(
+            {Blob.ref_count: Blob.ref_count + 1, Blob.updated_at: datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.session.commit()
+        if not updated:
+            return None
+        blob = Blob.query.filter_by(digest=digest).first()
+        if not self.storage_service.has_blob(digest):
+            # Row outlived its file; rewrite it from the caller's copy
+            self.release([blob.id])
+            return None
+        return blob
+
+    def _create(self, digest: str, size: int, path: str) -> Blob:
+        blob = Blob(digest=digest, size=size, path=path, ref_count=1)
+        try:
+            return blob.save()
+        except IntegrityError:
+            # Another request stored the same content first
+            db.session.rollback()
+            return self._acquire(digest) or self._create(digest, size, path)
@@ -1,21 +1,75 @@
-from typing import List, Optional
+import base64
+import json
+import os
+import re
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import tuple_
+from sqlalchemy.orm import load_only
+from app.models.blob import Blob
 from app.models.document import Document
+from app.services.blob_service import BlobService
+from app.services.encryption_service import EncryptionService
+from app.services.pdf_splitter import parse_page_ranges
+from app.config.config import BaseConfig
 from app.services.storage_service import StorageService
-from app.utils.error_handling import NotFoundError, ValidationError
+from app.utils.error_handling import AppError, NotFoundError, ValidationError
 from app.extensions import db, celery
+from app.services.job_events import publish_job_event
+from app.services.job_scheduler import JobScheduler
+
+# Pipeline step -> kind: 'source' steps only come first and decide what the
+# inputs are, 'page' steps run page by page, 'document' steps on the output
+PIPELINE_STEPS = {
+    'merge_pdfs': 'source',
+    'convert_to_pdf': 'source',
+    'compress_pdf': 'page',
+    'linearize': 'document',
+}
+PIPELINE_STEP_PARAMS = {
+    'compress_pdf': {'image_quality'},
+}
+OCR_LANGUAGE_PATTERN = re.compile(r'^[a-z_]{3,16}(\+[a-z_]{3,16})*$')
+# Operations that leave the document as it is and add child documents
+SPLIT_OPERATIONS = ('split_pdf', 'extract_pages')
+SPLIT_PARAMS = {
+    'split_pdf': {'pages_per_part', 'ranges'},
+    'extract_pages': {'pages'},
+}
+ENCRYPTION_PARAMS = {
+    'encrypt_pdf': {'mode', 'password', 'owner_password'},
+    'decrypt_pdf': {'password'},
+}
+# 'pdf': password protection a PDF reader understands; 'envelope': sealed
+# for storage at rest under the server's key, opaque until decrypted
+ENCRYPTION_MODES = ('pdf', 'envelope')
 
 class DocumentService:
-    def __init__(self, storage_service: StorageService):
+    def __init__(self, storage_service: StorageService, job_scheduler: Optional[JobScheduler] = None):
         self.storage_service = storage_service
+        self.job_scheduler = job_scheduler or JobScheduler()
     
-    def create_document(self, name: str, file_type: str, size: int) -> Document:
-        """Create a new document."""
+    def create_document(self, name: str, file_type: str, size: int, blob: Optional[Blob] = None,
+                        status: str = 'pending', metadata: Optional[dict] = None,
+                        user_id: Optional[str] = None) -> Document:
+        """
+        Create a new document, optionally taking over a reference to its
+        stored blob; metadata holds facts already known about the content
+        (sha256, page_count) so later stages need not re-read it. user_id
+        is the owner, if it was created by a signed-in user.
+        """
         document = Document(
             name=name,
             type=file_type,
             size=size,
-            status='pending'
+            status=status,
+            metadata_=metadata,
+            user_id=user_id
         )
+        if blob:
+            document.blob_id = blob.id
+            document.url = blob.path
         return document.save()
     
     def get_document(self, document_id: str) -> Document:
@@ -25,38 +79,316 @@ class DocumentService:
             raise NotFoundError(f"Document {document_id} not found")
         return document
     
-    def list_documents(self, user_id: Optional[str] = None) -> List[Document]:
-        """List all documents, optionally filtered by user."""
+    def list_documents(self, user_id: Optional[str] = None, status: Optional[str] = None,
+                       doc_type: Optional[str] = None, cursor: Optional[str] = None,
+                       parent_id: Optional[str] = None, limit: int = 50,
+                       fields: Optional[List[str]] = None) -> Tuple[List[Document], Optional[str]]:
+        """
+        List one page of documents, newest first, optionally filtered.
+
+        Pages are keyset-paginated on (created_at, id): pass the returned
+        cursor to get the next page. With fields, only those columns are
+        loaded. Returns (documents, next_cursor); next_cursor is None on
+        the last page.
+        """
         query = Document.query
         if user_id:
-            query = query.filter_by(user_id=user_id)
-        return query.order_by(Document.created_at.desc()).all()
+            query = query.filter(Document.user_id == user_id)
+        if status:
+            query = query.filter(Document.status == status)
+        if doc_type:
+            query = query.filter(Document.type == doc_type)
+        if parent_id:
+            query = query.filter(Document.parent_id == parent_id)
+        if cursor:
+            created_at, document_id = self._decode_cursor(cursor)
+            query = query.filter(
+                tuple_(Document.created_at, Document.id) < tuple_(created_at, document_id)
+            )
+        if fields:
+            unknown = set(fields) - set(Document.FIELDS)
+            if unknown:
+                raise ValidationError(f"Unknown fields: {', '.join(sorted(unknown))}")
+            # The cursor needs created_at and id even if they are not returned
+            columns = {Document.FIELDS[field] for field in fields} | {'id', 'created_at'}
+            query = query.options(load_only(*(getattr(Document, column) for column in columns)))
+
+        documents = query.order_by(Document.created_at.desc(), Document.id.desc()).limit(limit + 1).all()
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = self._encode_cursor(documents[-1])
+        return documents, next_cursor
+
+    @staticmethod
+    def _encode_cursor(document: Document) -> str:
+        raw = json.dumps([document.created_at.isoformat(), document.id])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+        try:
+            created_at, document_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return datetime.fromisoformat(created_at), document_id
+        except (ValueError, TypeError):
+            raise ValidationError('Invalid cursor')
     
-    def process_document(self, document_id: str, operation: str, params: dict = None) -> dict:
-        """Queue a document processing task."""
+    def process_document(self, document_id: str, operation: str, params: dict = None,
+                         tenant: str = 'anonymous', cost: Optional[int] = None) -> dict:
+        """
+        Queue a document processing task on the queue and at the priority
+        its estimated cost calls for, once the tenant's limits allow it.
+        Without cost, it is estimated from the document's size and page count.
+        """
         document = self.get_document(document_id)
         
         # Validate operation
-        if operation not in ['merge_pdfs', 'compress_pdf', 'convert_to_pdf']:
+        if operation not in ['merge_pdfs', 'compress_pdf', 'convert_to_pdf', 'ocr_pdf', *SPLIT_OPERATIONS,
+                             *ENCRYPTION_PARAMS]:
             raise ValidationError(f"Unsupported operation: {operation}")
+        if operation in ENCRYPTION_PARAMS:
+            params = self.prepare_encryption(operation, params or {}, document.metadata_ or {})
+        if operation in SPLIT_OPERATIONS:
+            if not document.blob_id:
+                raise ValidationError(f"Document {document_id} has no content")
+            self.plan_split(operation, params or {}, (document.metadata_ or {}).get('page_count'))
+        language = (params or {}).get('language')
+        if operation == 'ocr_pdf' and language is not None and (
+                not isinstance(language, str) or not OCR_LANGUAGE_PATTERN.match(language)):
+            raise ValidationError('language must be Tesseract language codes, e.g. eng or eng+deu')
         
-        # Queue the task
-        task = celery.send_task(
-            f'tasks.{operation}',
-            args=[document_id],
-            kwargs=params or {}
-        )
+        if cost is None:
+            metadata = document.metadata_ or {}
+            cost = JobScheduler.estimate_cost(metadata.get('page_count'), document.size)
+        # Operations apply to finished documents too (compress after merge, encrypt, ...),
+        # which are processed again; failed ones keep their content and can be retried.
+        # The worker only starts jobs on pending or processing documents.
+        previous_status = document.status
+        reprocess = operation not in SPLIT_OPERATIONS and previous_status in ('completed', 'failed')
+        if reprocess:
+            Document.transition_status(document_id, previous_status, 'pending')
+        try:
+            return self._enqueue(
+                'app.tasks.process_document', operation, [document_id, operation, params or {}],
+                document_id, tenant, cost
+            )
+        except Exception:
+            if reprocess:
+                Document.transition_status(document_id, 'pending', previous_status)
+            raise
+
+    def process_pipeline(self, document_ids: List[str], steps: List[dict],
+                         tenant: str = 'anonymous', name: Optional[str] = None,
+                         user_id: Optional[str] = None) -> dict:
+        """
+        Queue an ordered list of operations over one or more documents as a
+        single job, e.g. merge_pdfs -> compress_pdf -> linearize. The steps
+        share one pass over the pages in the worker and only the final
+        output is stored, as a new document. Returns the job, as
+        process_document does, with the new document's id; user_id owns it.
+        """
+        if not isinstance(document_ids, list) or not document_ids:
+            raise ValidationError('document_ids must be a non-empty list')
+        if len(document_ids) > BaseConfig.MERGE_MAX_FILES:
+            raise ValidationError(f"At most {BaseConfig.MERGE_MAX_FILES} documents per pipeline")
+        if name is not None and (not isinstance(name, str) or not name.strip()):
+            raise ValidationError('name must be a non-empty string')
+        plan = self.plan_pipeline(steps, len(document_ids))
+        documents = [self.get_document(document_id) for document_id in document_ids]
+
+        # The job holds a reference on each input until it finishes
+        blob_service = BlobService(self.storage_service)
+        blobs = []
+        output = None
+        try:
+            for document in documents:
+                blob = blob_service.acquire(document.blob_id) if document.blob_id else None
+                if not blob:
+                    raise ValidationError(f"Document {document.id} has no content")
+                blobs.append(blob)
+            if not name:
+                name = 'merged.pdf' if len(documents) > 1 else f"{os.path.splitext(documents[0].name)[0]}.pdf"
+            output = self.create_document(name, 'pdf', None, user_id=user_id)
+            cost = sum(
+                JobScheduler.estimate_cost((document.metadata_ or {}).get('page_count'), document.size)
+                for document in documents
+            )
+            result = self._enqueue(
+                'app.tasks.process_pipeline', 'pipeline',
+                [output.id, plan, {
+                    'input_keys': [blob.path for blob in blobs],
+                    'input_blob_ids': [blob.id for blob in blobs]
+                }],
+                output.id, tenant, cost
+            )
+        except Exception as e:
+            blob_service.release(blob.id for blob in blobs)
+            if output:
+                if isinstance(e, AppError):
+                    # Not admitted: nothing was queued
+                    output.delete()
+                else:
+                    Document.transition_status(output.id, 'pending', 'failed')
+            raise
+        return dict(result, document_id=output.id)
+
+    @staticmethod
+    def plan_pipeline(steps: List[dict], input_count: int) -> dict:
+        """
+        Validate pipeline steps ({'operation', 'params'} or just the name)
+        against the number of inputs and split them by kind for the worker.
+        """
+        if not isinstance(steps, list) or not steps:
+            raise ValidationError('steps must be a non-empty list')
+        if len(steps) > BaseConfig.PIPELINE_MAX_STEPS:
+            raise ValidationError(f"At most {BaseConfig.PIPELINE_MAX_STEPS} steps per pipeline")
+
+        normalized = []
+        for step in steps:
+            if isinstance(step, str):
+                step = {'operation': step}
+            if not isinstance(step, dict) or step.get('operation') not in PIPELINE_STEPS:
+                raise ValidationError(f"Unsupported pipeline step: {step}")
+            operation = step['operation']
+            params = step.get('params') or {}
+            if not isinstance(params, dict):
+                raise ValidationError(f"Parameters of {operation} must be an object")
+            unknown = set(params) - PIPELINE_STEP_PARAMS.get(operation, set())
+            if unknown:
+                raise ValidationError(f"Unknown parameters for {operation}: {', '.join(sorted(unknown))}")
+            if 'image_quality' in params:
+                if not isinstance(params['image_quality'], int) or not 1 <= params['image_quality'] <= 95:
+                    raise ValidationError('image_quality must be an integer from 1 to 95')
+            normalized.append({'operation': operation, 'params': params})
+
+        source = normalized[0]['operation'] if PIPELINE_STEPS[normalized[0]['operation']] == 'source' else None
+        rest = normalized[1:] if source else normalized
+        kinds = [PIPELINE_STEPS[step['operation']] for step in rest]
+        if 'source' in kinds:
+            raise ValidationError('merge_pdfs and convert_to_pdf can only be the first step')
+        if 'document' in kinds and 'page' in kinds[kinds.index('document'):]:
+            raise ValidationError('linearize must come after the page steps')
+        if source == 'merge_pdfs' and input_count < 2:
+            raise ValidationError('merge_pdfs needs at least two documents')
+        if source != 'merge_pdfs' and input_count != 1:
+            raise ValidationError('Several documents need merge_pdfs as the first step')
+
+        return {
+            'operations': [step['operation'] for step in normalized],
+            'images': source == 'convert_to_pdf',
+            'page_steps': [step for step in rest if PIPELINE_STEPS[step['operation']] == 'page'],
+            'document_steps': [step for step in rest if PIPELINE_STEPS[step['operation']] == 'document'],
+        }
+
+    @staticmethod
+    def plan_split(operation: str, params: dict, page_count: Optional[int]) -> Optional[List[List[int]]]:
+        """
+        The parts a split_pdf or extract_pages job writes, each a list of
+        1-based page numbers. split_pdf takes pages_per_part (default 1) or
+        ranges ('1-3,4-10', one part per range); extract_pages takes pages
+        ('1-3,7', all in one part). Without page_count only the parameters
+        are checked and None is returned.
+        """
+        if not isinstance(params, dict):
+            raise ValidationError(f"Parameters of {operation} must be an object")
+        unknown = set(params) - SPLIT_PARAMS[operation]
+        if unknown:
+            raise ValidationError(f"Unknown parameters for {operation}: {', '.join(sorted(unknown))}")
+        try:
+            if operation == 'extract_pages':
+                if 'pages' not in params:
+                    raise ValidationError('pages is required, e.g. 1-3,7')
+                groups = [parse_page_ranges(params['pages'], page_count)]
+            elif 'ranges' in params:
+                if 'pages_per_part' in params:
+                    raise ValidationError('Give either ranges or pages_per_part, not both')
+                groups = [[page_range] for page_range in parse_page_ranges(params['ranges'], page_count)]
+            else:
+                size = params.get('pages_per_part', 1)
+                if not isinstance(size, int) or isinstance(size, bool) or size < 1:
+                    raise ValidationError('pages_per_part must be a positive integer')
+                groups = [
+                    [(first, min(first + size - 1, page_count))] for first in range(1, page_count + 1, size)
+                ] if page_count is not None else []
+        except ValueError as e:
+            raise ValidationError(str(e))
+        if len(groups) > BaseConfig.SPLIT_MAX_PARTS:
+            raise ValidationError(f"At most {BaseConfig.SPLIT_MAX_PARTS} parts per split")
+        if page_count is None:
+            return None
+        return [[number for first, last in group for number in range(first, last + 1)] for group in groups]
+
+    @staticmethod
+    def prepare_encryption(operation: str, params: dict, metadata: dict) -> dict:
+        """
+        Validate the parameters of encrypt_pdf or decrypt_pdf against the
+        document's current encryption and return them with the passwords
+        sealed under the master key, since job arguments sit in the broker.
+        """
+        if not isinstance(params, dict):
+            raise ValidationError(f"Parameters of {operation} must be an object")
+        unknown = set(params) - ENCRYPTION_PARAMS[operation]
+        if unknown:
+            raise ValidationError(f"Unknown parameters for {operation}: {', '.join(sorted(unknown))}")
+        for name in ('password', 'owner_password'):
+            value = params.get(name)
+            if value is not None and (not isinstance(value, str) or len(value.encode()) > 127):
+                raise ValidationError(f"{name} must be a string of at most 127 bytes")
+
+        encryption = metadata.get('encryption')
+        if operation == 'encrypt_pdf':
+            mode = params.get('mode', 'pdf')
+            if mode not in ENCRYPTION_MODES:
+                raise ValidationError(f"mode must be one of: {', '.join(ENCRYPTION_MODES)}")
+            if encryption:
+                raise ValidationError('Document is already encrypted')
+            if mode == 'pdf' and not params.get('password'):
+                raise ValidationError('password is required')
+            if mode == 'envelope' and ('password' in params or 'owner_password' in params):
+                raise ValidationError('Envelope encryption uses the server key and takes no password')
+        elif encryption == 'envelope' and 'password' in params:
+            raise ValidationError('Envelope-encrypted documents take no password')
+
+        encryption_service = EncryptionService()
+        return {
+            name: encryption_service.seal(value) if name in ('password', 'owner_password') else value
+            for name, value in params.items()
+        }
+
+    def _enqueue(self, task_name: str, operation: str, args: list, document_id: str,
+                 tenant: str, cost: int) -> dict:
+        """Admit a job for the tenant and send it to its queue at its priority."""
+        # Registered and marked pending before sending, so a fast worker never
+        # sees an unknown job or has its first events overwritten
+        job_id = str(uuid.uuid4())
+        queue, priority = self.job_scheduler.admit(job_id, tenant, operation, cost)
+        publish_job_event(job_id, 'PENDING', progress=0, document_id=document_id)
+        try:
+            if celery.conf.task_always_eager:
+                # send_task ignores eager mode; run the registered task inline (local runs, benchmarks)
+                celery.tasks[task_name].apply_async(args=args, task_id=job_id)
+            else:
+                celery.send_task(task_name, args=args, task_id=job_id, queue=queue, priority=priority)
+        except Exception as e:
+            publish_job_event(job_id, 'FAILURE', document_id=document_id, error=str(e))
+            raise
         
         return {
-            'job_id': task.id,
-            'status': 'pending'
+            'job_id': job_id,
+            'status': 'pending',
+            'queue': queue
         }
 
     @staticmethod
     def get_job_status(job_id: str) -> dict:
         task = celery.AsyncResult(job_id)
-        return {
+        info = task.info if isinstance(task.info, dict) else {}
+        status = {
             'job_id': job_id,
             'status': task.status,
-            'progress': task.info.get('progress', 0) if task.info else 0
-        } 
\ No newline at end of file
+            'progress': info.get('progress', 0)
+        }
+        if 'total_pages' in info:
+            status['pages_done'] = info.get('pages_done', 0)
+            status['total_pages'] = info['total_pages']
+        return status 
\ No newline at end of file
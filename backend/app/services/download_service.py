@@ -0,0 +1,144 @@
+import mimetypes
+from typing import Dict, Optional, Tuple
+from flask import Request, Response, redirect, send_file
+from werkzeug.http import parse_range_header
+from werkzeug.utils import secure_filename
+from app.config.config import BaseConfig
+from app.extensions import db
+from app.models.blob import Blob
+from app.models.document import Document
+from app.services.storage_backends import LocalStorageBackend
+from app.services.storage_service import StorageService
+from app.utils.error_handling import NotFoundError
+
+class DownloadService:
+    """
+    Builds download responses for stored documents.
+
+    ETags are the blob's SHA-256, so they change exactly when the content
+    does. Depending on DOWNLOAD_MODE the bytes are streamed by the app
+    (honouring Range), handed to nginx with X-Accel-Redirect, or fetched by
+    the client from a presigned object-store URL; in the last two cases the
+    app worker only looks up metadata.
+    """
+
+    def __init__(self, storage_service: StorageService, mode: Optional[str] = None):
+        self.storage_service = storage_service
+        self.mode = mode or BaseConfig.DOWNLOAD_MODE
+
+    def get_download(self, document_id: str) -> dict:
+        """Name, digest, size and storage key of a document's content, in one query."""
+        row = db.session.query(
+            Document.name, Blob.digest, Blob.size, Blob.path
+        ).join(Blob, Document.blob_id == Blob.id).filter(Document.id == document_id).first()
+        if row is None:
+            raise NotFoundError(f"Document {document_id} not found or has no content")
+        return self.describe(document_id, row)
+
+    @staticmethod
+    def describe(document_id: str, row) -> dict:
+        """The download of a (name, digest, size, path) row."""
+        name = secure_filename(row.name) or document_id
+        return {
+            'name': name,
+            'mimetype': mimetypes.guess_type(name)[0] or 'application/octet-stream',
+            'digest': row.digest,
+            'size': row.size,
+            'key': row.path
+        }
+
+    @staticmethod
+    def byte_range(size: int, etag: str, range_header: Optional[str],
+                   if_range: Optional[str]) -> Tuple[int, int, int]:
+        """Status (200, 206 or 416) and inclusive first and last byte to send for a Range header."""
+        # If-Range: only honour Range when the client still has this version
+        byte_range = parse_range_header(range_header) if not if_range or if_range.strip('"') == etag else None
+        # Multipart (several ranges) responses are not supported; send it all
+        if byte_range is not None and byte_range.units == 'bytes' and len(byte_range.ranges) == 1:
+            bounds = byte_range.range_for_length(size)
+            if bounds is None:
+                return 416, 0, size - 1
+            return 206, bounds[0], bounds[1] - 1
+        return 200, 0, size - 1
+
+    @staticmethod
+    def stream_headers(download: dict, status: int, start: int, end: int) -> Dict[str, str]:
+        """Headers of a streamed download, or of one byte range of it."""
+        headers = {
+            'Content-Length': str(end - start + 1),
+            'Accept-Ranges': 'bytes',
+            'Content-Disposition': f'attachment; filename="{download["name"]}"',
+            'Cache-Control': 'no-cache'
+        }
+        if status == 206:
+            headers['Content-Range'] = f"bytes {start}-{end}/{download['size']}"
+        return headers
+
+    def build_response(self, document_id: str, request: Request) -> Response:
+        download = self.get_download(document_id)
+        etag = download['digest']
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        backend = self.storage_service.backend
+        if self.mode == 'presign':
+            url = backend.presigned_url(download['key'], download['name'], BaseConfig.DOWNLOAD_URL_EXPIRY)
+            if url:
+                response = redirect(url, code=302)
+                response.set_etag(etag)
+                return response
+
+        if isinstance(backend, LocalStorageBackend):
+            if self.mode == 'accel':
+                return self._accel_response(download)
+            # Werkzeug handles Range/conditionals and the WSGI server can use sendfile
+            response = send_file(
+                str(backend.path(download['key']).resolve()),
+                as_attachment=True,
+                download_name=download['name'],
+                conditional=True,
+                etag=etag
+            )
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+        return self._stream_response(download, request)
+
+    def _accel_response(self, download: dict) -> Response:
+        """Empty response telling nginx which internal location to serve (Range included)."""
+        response = Response(mimetype=download['mimetype'])
+        response.headers.update(self.accel_headers(download))
+        response.set_etag(download['digest'])
+        return response
+
+    @staticmethod
+    def accel_headers(download: dict) -> Dict[str, str]:
+        return {
+            'X-Accel-Redirect': BaseConfig.DOWNLOAD_ACCEL_PREFIX + download['key'],
+            'Content-Disposition': f'attachment; filename="{download["name"]}"',
+            'Cache-Control': 'no-cache'
+        }
+
+    def _stream_response(self, download: dict, request: Request) -> Response:
+        """Stream the object (or one requested byte range of it) from the backend."""
+        size = download['size']
+        etag = download['digest']
+        status, start, end = self.byte_range(size, etag, request.headers.get('Range'), request.headers.get('If-Range'))
+        if status == 416:
+            response = Response(status=416)
+            response.headers['Content-Range'] = f"bytes */{size}"
+            return response
+
+        chunks = self.storage_service.backend.iter_range(download['key'], start, end) if size else iter(())
+        response = Response(
+            chunks,
+            status=status,
+            mimetype=download['mimetype'],
+            direct_passthrough=True
+        )
+        response.headers.update(self.stream_headers(download, status, start, end))
+        response.set_etag(etag)
+        return response
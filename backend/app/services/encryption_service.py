@@ -0,0 +1,133 @@
+import base64
+import hashlib
+import itertools
+import os
+import struct
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from app.config.config import BaseConfig
+
+MAGIC = b'FOPSENV1'
+# MAGIC, chunk size, master key id, nonce and wrapped data key, chunk nonce prefix
+HEADER = struct.Struct('>8sI8s12s48s7s')
+TAG_SIZE = 16
+
+def _master_key() -> bytes:
+    """ENCRYPTION_MASTER_KEY (base64, 32 bytes), or in development a key derived from SECRET_KEY."""
+    if BaseConfig.ENCRYPTION_MASTER_KEY:
+        key = base64.b64decode(BaseConfig.ENCRYPTION_MASTER_KEY)
+        if len(key) != 32:
+            raise ValueError('ENCRYPTION_MASTER_KEY must be 32 bytes, base64-encoded')
+        return key
+    return hashlib.sha256(b'fileops-envelope:' + BaseConfig.SECRET_KEY.encode()).digest()
+
+class EncryptionService:
+    """
+    Envelope encryption of whole files for storage at rest.
+
+    Each file gets a random AES-256 data key, stored in the file's header
+    wrapped (AES-GCM) by the master key. The content is sealed in fixed-size
+    chunks, each AES-256-GCM with its index and an end-of-file flag in the
+    nonce, so chunks cannot be reordered or the file truncated unnoticed.
+    Both directions work over a stream of blocks (e.g. the storage
+    backend's iter_range) and hold one chunk at a time.
+    """
+
+    def __init__(self, master_key: Optional[bytes] = None, chunk_size: int = BaseConfig.ENCRYPTION_CHUNK_SIZE):
+        self.master_key = master_key or _master_key()
+        self.key_id = hashlib.sha256(self.master_key).digest()[:8]
+        self.chunk_size = chunk_size
+
+    def encrypt_stream(self, blocks: Iterable[bytes], output: BinaryIO) -> int:
+        """Write the envelope of the content in blocks to output; returns the plaintext size."""
+        data_key = AESGCM.generate_key(bit_length=256)
+        key_nonce, prefix = os.urandom(12), os.urandom(7)
+        wrapped = AESGCM(self.master_key).encrypt(key_nonce, data_key, MAGIC + self.key_id)
+        header = HEADER.pack(MAGIC, self.chunk_size, self.key_id, key_nonce, wrapped, prefix)
+        output.write(header)
+
+        cipher = AESGCM(data_key)
+        size = 0
+        index = 0
+        chunks = _fixed_chunks(blocks, self.chunk_size)
+        chunk = next(chunks, b'')
+        while True:
+            following = next(chunks, None)
+            output.write(cipher.encrypt(self._nonce(prefix, index, following is None), chunk, header))
+            size += len(chunk)
+            if following is None:
+                return size
+            chunk = following
+            index += 1
+
+    def decrypt_stream(self, blocks: Iterable[bytes], output: BinaryIO) -> int:
+        """Write the content of an envelope in blocks to output; returns its size."""
+        header, blocks = _split_head(blocks, HEADER.size)
+        if len(header) != HEADER.size or not header.startswith(MAGIC):
+            raise ValueError('Not an encrypted document')
+        _, chunk_size, key_id, key_nonce, wrapped, prefix = HEADER.unpack(header)
+        if key_id != self.key_id:
+            raise ValueError('Encrypted with a different master key')
+        try:
+            cipher = AESGCM(AESGCM(self.master_key).decrypt(key_nonce, wrapped, MAGIC + key_id))
+        except InvalidTag:
+            raise ValueError('Encrypted document header is corrupt')
+
+        size = 0
+        index = 0
+        records = _fixed_chunks(blocks, chunk_size + TAG_SIZE)
+        record = next(records, b'')
+        while True:
+            following = next(records, None)
+            try:
+                chunk = cipher.decrypt(self._nonce(prefix, index, following is None), record, header)
+            except InvalidTag:
+                raise ValueError(f"Encrypted document is corrupt or truncated at chunk {index}")
+            output.write(chunk)
+            size += len(chunk)
+            if following is None:
+                return size
+            record = following
+            index += 1
+
+    def seal(self, text: str) -> str:
+        """Encrypt a short secret (e.g. a password passed through the broker) under the master key."""
+        nonce = os.urandom(12)
+        return base64.b64encode(nonce + AESGCM(self.master_key).encrypt(nonce, text.encode(), None)).decode()
+
+    def unseal(self, token: str) -> str:
+        raw = base64.b64decode(token)
+        return AESGCM(self.master_key).decrypt(raw[:12], raw[12:], None).decode()
+
+    @staticmethod
+    def _nonce(prefix: bytes, index: int, last: bool) -> bytes:
+        return prefix + struct.pack('>I?', index, last)
+
+def _split_head(blocks: Iterable[bytes], size: int) -> Tuple[bytes, Iterator[bytes]]:
+    """The first size bytes of a stream of blocks, and the stream of the rest."""
+    blocks = iter(blocks)
+    head = bytearray()
+    for block in blocks:
+        head += block
+        if len(head) >= size:
+            break
+    rest = bytes(head[size:])
+    return bytes(head[:size]), itertools.chain([rest] if rest else [], blocks)
+
+def _fixed_chunks(blocks: Iterable[bytes], size: int) -> Iterator[bytes]:
+    """Re-cut a stream of blocks into chunks of exactly size bytes; the last may be shorter."""
+    buffer = bytearray()
+    for block in blocks:
+        buffer += block
+        if len(buffer) < size:
+            continue
+        view = memoryview(buffer)
+        offset = 0
+        while len(buffer) - offset >= size:
+            yield bytes(view[offset:offset + size])
+            offset += size
+        view.release()
+        del buffer[:offset]
+    if buffer:
+        yield bytes(buffer)
@@ -0,0 +1,157 @@
+import io
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+import redis as redis_lib
+from app.config.config import BaseConfig
+from app.extensions import db, redis_client
+from app.services.job_scheduler import QUEUES
+from app.services.storage_service import StorageService
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Celery's default queue, for housekeeping tasks
+BROKER_QUEUES = QUEUES + ('celery',)
+
+class HealthMonitor:
+    """
+    Dependency checks for readiness, run by one background thread per
+    process every HEALTH_CHECK_INTERVAL seconds, never by the probe
+    requests themselves: /readyz only reads the latest results, so slow
+    dependencies cannot make probes pile up.
+
+    Each check gets HEALTH_CHECK_TIMEOUT seconds. One still hanging from an
+    earlier round is reported as timed out rather than started again.
+    """
+
+    def __init__(self, storage_service: StorageService, redis=redis_client, broker=None,
+                 interval: float = BaseConfig.HEALTH_CHECK_INTERVAL,
+                 timeout: float = BaseConfig.HEALTH_CHECK_TIMEOUT,
+                 max_queue_depth: int = BaseConfig.READINESS_MAX_QUEUE_DEPTH):
+        self.storage_service = storage_service
+        self.redis = redis
+        self.broker = broker or redis_lib.Redis.from_url(
+            BaseConfig.CELERY_BROKER_URL, socket_timeout=timeout, socket_connect_timeout=timeout
+        )
+        self.interval = interval
+        self.timeout = timeout
+        self.max_queue_depth = max_queue_depth
+        self.checks: Dict[str, Callable[[], Optional[dict]]] = {
+            'database': self._check_database,
+            'redis': self._check_redis,
+            'storage': self._check_storage,
+            'broker': self._check_broker,
+        }
+        self._results: Dict[str, dict] = {}
+        self._pending: Dict[str, threading.Thread] = {}
+        self._first_round = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._app = None
+
+    def start(self, app) -> None:
+        """Start the checking thread for this process, if it is not running yet."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._app = app
+                self._thread = threading.Thread(target=self._loop, name='health-monitor', daemon=True)
+                self._thread.start()
+
+    def status(self) -> Tuple[bool, dict]:
+        """(ready, per-check results) from the latest round; results older than three rounds count as failed."""
+        # A process's first probe waits for its first round instead of failing
+        self._first_round.wait(self.timeout + 1)
+        now = time.time()
+        with self._lock:
+            results = {name: dict(result) for name, result in self._results.items()}
+        for name in self.checks:
+            result = results.setdefault(name, {'ok': False, 'error': 'not checked yet'})
+            if result.get('checked_at') and now - result['checked_at'] > 3 * self.interval:
+                result.update(ok=False, error='result is stale')
+        return all(result['ok'] for result in results.values()), results
+
+    def run_checks(self) -> None:
+        """One round of every check, in parallel, each bounded by the timeout."""
+        threads = {}
+        for name, check in self.checks.items():
+            thread = self._pending.get(name)
+            if thread is None or not thread.is_alive():
+                # Daemon threads: a hung check must not hold up process exit
+                thread = threading.Thread(target=self._run_check, args=(name, check),
+                                          name=f"health-check-{name}", daemon=True)
+                thread.start()
+                self._pending[name] = thread
+            threads[name] = thread
+
+        deadline = time.monotonic() + self.timeout
+        for name, thread in threads.items():
+            thread.join(max(0, deadline - time.monotonic()))
+            if thread.is_alive():
+                with self._lock:
+                    self._results[name] = {'ok': False, 'error': f"timed out after {self.timeout}s",
+                                           'checked_at': time.time()}
+        self._first_round.set()
+
+    def _run_check(self, name: str, check: Callable[[], Optional[dict]]) -> None:
+        result = self._timed(check)
+        result['checked_at'] = time.time()
+        with self._lock:
+            self._results[name] = result
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self.run_checks()
+            except Exception as e:
+                logger.warning(f"Health checks failed to run: {str(e)}")
+            time.sleep(self.interval)
+
+    def _timed(self, check: Callable[[], Optional[dict]]) -> dict:
+        start = time.perf_counter()
+        try:
+            details = check() or {}
+        except Exception as e:
+            details = {'ok': False, 'error': str(e)}
+        return dict(details, ok=details.get('ok', True),
+                    latency_ms=round((time.perf_counter() - start) * 1000, 2))
+
+    def _check_database(self) -> None:
+        with self._app.app_context():
+            try:
+                db.session.execute(db.text('SELECT 1'))
+            finally:
+                db.session.remove()
+
+    def _check_redis(self) -> None:
+        self.redis.ping()
+
+    def _check_storage(self) -> None:
+        # Scratch space for uploads, then a write and delete in the blob store
+        scratch_path = os.path.join(self.storage_service.storage_path, f".health-{os.getpid()}")
+        with open(scratch_path, 'wb') as f:
+            f.write(b'ok')
+        os.remove(scratch_path)
+        key = f"health/{socket.gethostname()}-{os.getpid()}"
+        self.storage_service.backend.put_stream(key, io.BytesIO(b'ok'))
+        self.storage_service.backend.delete(key)
+
+    def _check_broker(self) -> dict:
+        # With priorities, a queue is one Redis list per priority step ('name', 'name:1', ...)
+        steps = BaseConfig.CELERY_BROKER_TRANSPORT_OPTIONS['priority_steps']
+        sep = BaseConfig.CELERY_BROKER_TRANSPORT_OPTIONS['sep']
+        pipe = self.broker.pipeline()
+        for queue in BROKER_QUEUES:
+            for step in steps:
+                pipe.llen(queue if not step else f"{queue}{sep}{step}")
+        lengths = pipe.execute()
+        depths = {
+            queue: sum(lengths[i * len(steps):(i + 1) * len(steps)])
+            for i, queue in enumerate(BROKER_QUEUES)
+        }
+        result = {'queue_depth': depths}
+        if self.max_queue_depth and max(depths.values()) > self.max_queue_depth:
+            result.update(ok=False, error=f"queue depth above {self.max_queue_depth}")
+        return result
@@ -0,0 +1,128 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+from anyio.to_thread import run_sync
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from app.config.config import BaseConfig
+from app.extensions import db
+from app.middleware.file_validation import ValidatingUploadStream
+from app.models.blob import Blob
+from app.models.document import Document
+from app.models.user import User
+from app.services.auth_cache import auth_cache
+from app.services.download_service import DownloadService
+from app.services.storage_service import StorageService
+from app.utils.error_handling import NotFoundError
+from app.utils.instrumentation import timed
+
+# asyncio driver for each database the app runs on
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+blobs = Blob.__table__
+documents = Document.__table__
+users = User.__table__
+
+class IngestStore:
+    """
+    Database side of the ASGI endpoints, on SQLAlchemy's asyncio engine and
+    the models' tables: adopting validated uploads as documents (with blob
+    reference counting as BlobService does it) and looking up downloads.
+    Storage calls, which block, run in threads, outside transactions.
+    """
+
+    def __init__(self, storage_service: StorageService):
+        self.storage_service = storage_service
+        self.engine = None
+
+    def init_app(self, app) -> None:
+        """Open an asyncio engine on the app's database, as Flask-SQLAlchemy resolved its URL."""
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        with app.app_context():
+            url = db.engine.url
+        backend = url.get_backend_name()
+        if backend not in ASYNC_DRIVERS:
+            raise ValueError(f"No asyncio driver for {backend} databases")
+        options = {} if backend == 'sqlite' else {
+            'pool_size': BaseConfig.ASGI_DB_POOL_SIZE,
+            'pool_pre_ping': True
+        }
+        self.engine = create_async_engine(url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}"), **options)
+
+    async def adopt_upload(self, stream: ValidatingUploadStream, name: str, file_type: Optional[str],
+                           metadata: Optional[dict] = None, user_id: Optional[str] = None) -> str:
+        """
+        BlobService.put_file and DocumentService.create_document for a
+        finished upload spool, in one read and one write transaction: the
+        new document holds one more reference on the blob, which is only
+        written if its content is new. Returns the document's ID.
+        """
+        digest = stream.digest
+        stored = False
+        while True:
+            async with self.engine.connect() as conn:
+                blob = (await conn.execute(
+                    select(blobs.c.id, blobs.c.path).where(blobs.c.digest == digest)
+                )).first()
+
+            if blob is None or not await run_sync(self.storage_service.has_blob, digest):
+                # New content, or a row that outlived its file: store this copy
+                if not stored:
+                    await run_sync(stream.flush)
+                    await run_sync(self.storage_service.move_to_blob, stream.path, digest)
+                    stored = True
+            document = self._document_row(name, file_type, stream.size, metadata, user_id)
+
+            try:
+                with timed('ingest.db'):
+                    async with self.engine.begin() as conn:
+                        if blob is None:
+                            document['blob_id'] = str(uuid.uuid4())
+                            document['url'] = self.storage_service.blob_key(digest)
+                            await conn.execute(blobs.insert().values(
+                                id=document['blob_id'], digest=digest, size=stream.size, path=document['url'],
+                                ref_count=1, created_at=document['created_at'], updated_at=document['created_at']
+                            ))
+                        else:
+                            updated = await conn.execute(
+                                update(blobs).where(blobs.c.id == blob.id)
+                                .values(ref_count=blobs.c.ref_count + 1, updated_at=document['created_at'])
+                            )
+                            if not updated.rowcount:
+                                # Collected since it was read; start over
+                                continue
+                            document['blob_id'], document['url'] = blob.id, blob.path
+                        await conn.execute(documents.insert().values(**document))
+            except IntegrityError:
+                # Another request stored the same content first
+                continue
+            return document['id']
+
+    @staticmethod
+    def _document_row(name: str, file_type: Optional[str], size: int, metadata: Optional[dict],
+                      user_id: Optional[str]) -> dict:
+        now = datetime.utcnow()
+        return {
+            'id': str(uuid.uuid4()), 'name': name, 'type': file_type, 'size': size, 'status': 'pending',
+            'metadata': metadata, 'user_id': user_id, 'created_at': now, 'updated_at': now
+        }
+
+    async def user_exists(self, user_id: str) -> bool:
+        """Whether the user is known; users loaded by get_current_user are not looked up again."""
+        if auth_cache.users.get(user_id) is not None:
+            return True
+        async with self.engine.connect() as conn:
+            return (await conn.execute(select(users.c.id).where(users.c.id == user_id))).first() is not None
+
+    async def get_download(self, document_id: str) -> dict:
+        """DownloadService.get_download."""
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(
+                select(documents.c.name, blobs.c.digest, blobs.c.size, blobs.c.path)
+                .join(blobs, documents.c.blob_id == blobs.c.id)
+                .where(documents.c.id == document_id)
+            )).first()
+        if row is None:
+            raise NotFoundError(f"Document {document_id} not found or has no content")
+        return DownloadService.describe(document_id, row)
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set
+from app.config.config import BaseConfig
+from app.extensions import get_async_redis, redis_client
+from app.services.job_scheduler import JobScheduler
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'job_events'
+STATUS_TTL = 24 * 60 * 60
+TERMINAL_STATUSES = {'SUCCESS', 'FAILURE', 'REVOKED'}
+# Idle event streams send a keepalive, and check the stored status, this often
+KEEPALIVE_SECONDS = 15
+
+def _status_key(job_id: str) -> str:
+    return f"job_status:{job_id}"
+
+def publish_job_event(job_id: str, status: str, redis=redis_client, **fields) -> None:
+    """
+    Record a job's latest status and push it to every API process; a final
+    status also frees the job's slot in its tenant's limits.
+    Called from tasks; failures are logged and never fail the task.
+    """
+    event = dict(fields, job_id=job_id, status=status)
+    payload = json.dumps(event)
+    try:
+        pipe = redis.pipeline()
+        pipe.set(_status_key(job_id), payload, ex=STATUS_TTL)
+        pipe.publish(CHANNEL, payload)
+        pipe.execute()
+        if status in TERMINAL_STATUSES:
+            JobScheduler(redis).job_finished(job_id)
+    except Exception as e:
+        logger.warning(f"Failed to publish event for job {job_id}: {str(e)}")
+
+def get_job_statuses(job_ids: List[str], redis=redis_client) -> Dict[str, Optional[dict]]:
+    """Latest published status of many jobs in one round trip (None if unknown)."""
+    if not job_ids:
+        return {}
+    values = redis.mget([_status_key(job_id) for job_id in job_ids])
+    return {
+        job_id: json.loads(value) if value else None
+        for job_id, value in zip(job_ids, values)
+    }
+
+_slots: Optional[asyncio.Semaphore] = None
+
+def _command_slots() -> asyncio.Semaphore:
+    # A burst of requests waits for a slot instead of opening a connection each.
+    # (redis-py 5.0's BlockingConnectionPool can deadlock when a connect fails.)
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(BaseConfig.ASGI_REDIS_MAX_CONNECTIONS)
+    return _slots
+
+async def get_job_statuses_async(job_ids: List[str], redis=None) -> Dict[str, Optional[dict]]:
+    """get_job_statuses on the asyncio Redis client, for the ASGI endpoints."""
+    if not job_ids:
+        return {}
+    async with _command_slots():
+        values = await (redis or get_async_redis()).mget([_status_key(job_id) for job_id in job_ids])
+    return {
+        job_id: json.loads(value) if value else None
+        for job_id, value in zip(job_ids, values)
+    }
+
+class BufferedProgressWriter:
+    """
+    Coalesces frequent progress updates: flush is called with the latest
+    values at most once per interval, and always for the final (100%) one.
+    """
+
+    def __init__(self, flush: Callable[[dict], None], interval: float = 1.0):
+        self._flush = flush
+        self.interval = interval
+        self._pending: Optional[dict] = None
+        self._last_flush = 0.0
+
+    def update(self, **values) -> None:
+        self._pending = values
+        if values.get('progress') == 100 or time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._pending is None:
+            return
+        values, self._pending = self._pending, None
+        self._last_flush = time.monotonic()
+        self._flush(values)
+
+class JobEventHub:
+    """
+    Fans job events out to local subscribers (e.g. SSE streams).
+
+    Each process holds a single Redis pub/sub subscription, read by one
+    background thread, however many clients are listening.
+    """
+
+    def __init__(self, redis=redis_client):
+        self.redis = redis
+        self._subscribers: Dict[str, Set[queue.Queue]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, job_id: str) -> queue.Queue:
+        events = queue.Queue(maxsize=100)
+        with self._lock:
+            self._subscribers.setdefault(job_id, set()).add(events)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen, name='job-event-hub', daemon=True)
+                self._thread.start()
+        return events
+
+    def unsubscribe(self, job_id: str, events: queue.Queue) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers:
+                subscribers.discard(events)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    def _listen(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(CHANNEL)
+                for message in pubsub.listen():
+                    self._dispatch(message['data'])
+            except Exception as e:
+                logger.warning(f"Job event subscription lost, reconnecting: {str(e)}")
+                time.sleep(1)
+            finally:
+                pubsub.close()
+
+    def _dispatch(self, data: bytes) -> None:
+        try:
+            event = json.loads(data)
+        except ValueError:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers.get(event.get('job_id'), ()))
+        for events in subscribers:
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                pass  # Slow client; streams fall back to the stored status
+
+class AsyncJobEventHub:
+    """
+    JobEventHub for the ASGI endpoints: one Redis pub/sub subscription per
+    process, read by a task on the event loop and fanned out to asyncio
+    queues, so an idle event stream costs a queue rather than a thread.
+    """
+
+    def __init__(self, redis=None):
+        self._redis = redis
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        events = asyncio.Queue(maxsize=100)
+        self._subscribers.setdefault(job_id, set()).add(events)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+        return events
+
+    def unsubscribe(self, job_id: str, events: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(job_id)
+        if subscribers:
+            subscribers.discard(events)
+            if not subscribers:
+                del self._subscribers[job_id]
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = (self._redis or get_async_redis()).pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(CHANNEL)
+                async for message in pubsub.listen():
+                    self._dispatch(message['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Job event subscription lost, reconnecting: {str(e)}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def _dispatch(self, data: bytes) -> None:
+        try:
+            event = json.loads(data)
+        except ValueError:
+            return
+        for events in list(self._subscribers.get(event.get('job_id'), ())):
+            try:
+                events.put_nowait(event)
+            except asyncio.QueueFull:
+                pass  # Slow client; streams fall back to the stored status
+
+job_event_hub = JobEventHub()
+async_job_event_hub = AsyncJobEventHub()
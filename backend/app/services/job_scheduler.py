@@ -0,0 +1,160 @@
+import math
+import time
+from typing import Dict, Optional, Tuple
+from app.config.config import BaseConfig
+from app.extensions import redis_client
+from app.utils.error_handling import RateLimitError
+
+# Operation class -> Celery queue; cheap jobs of any operation go to 'interactive'
+OPERATION_QUEUES = {
+    'merge_pdfs': 'merge',
+    'compress_pdf': 'transform',
+    'convert_to_pdf': 'transform',
+    'ocr_pdf': 'transform',
+    'split_pdf': 'transform',
+    'extract_pages': 'transform',
+    'encrypt_pdf': 'transform',
+    'decrypt_pdf': 'transform',
+    'pipeline': 'transform',
+}
+QUEUES = ('interactive', 'merge', 'transform')
+JOB_TTL = 24 * 60 * 60
+# How long a running job's slot outlives the task time limit before it lapses
+SLOT_RUN_TTL = BaseConfig.TASK_TIME_LIMIT + 60
+WAIT_SAMPLES = 1000
+
+class JobScheduler:
+    """
+    Decides where and how urgently a job runs, and admits it fairly.
+
+    Cost is estimated as pages x bytes. Cheap jobs go to the 'interactive'
+    queue, the rest to their operation's queue, so each class can be scaled
+    on its own. Within a queue, priority (0 = first, Redis broker) grows with
+    cost and with how many jobs the tenant already has in flight. Tenants
+    are limited in active jobs and submissions per minute before anything
+    is enqueued.
+
+    A job holds its tenant's slot until it reports a final state. Slots of
+    jobs that never do (a killed worker, a revoked task) lapse: JOB_TTL
+    after enqueueing, or TASK_TIME_LIMIT (plus a grace period) after the
+    job last started running.
+    """
+
+    def __init__(self, redis=redis_client):
+        self.redis = redis
+
+    @staticmethod
+    def estimate_cost(pages: Optional[int], size: Optional[int]) -> int:
+        return max(1, pages or 1) * max(1, size or 1)
+
+    def route(self, operation: str, cost: int, active_jobs: int = 0) -> Tuple[str, int]:
+        """Queue and priority (0-9) of a job."""
+        queue = 'interactive' if cost <= BaseConfig.TASK_INTERACTIVE_MAX_COST else OPERATION_QUEUES[operation]
+        # 10 kB single pages land at 0, multi-GB scans at 9
+        cost_priority = int((math.log10(cost) - 4) * 9 / 8)
+        return queue, min(9, max(0, cost_priority) + active_jobs)
+
+    def admit(self, job_id: str, tenant: str, operation: str, cost: int) -> Tuple[str, int]:
+        """
+        Check the tenant's limits and, if they allow it, record job_id as
+        enqueued; returns its (queue, priority). Raises RateLimitError when
+        the tenant has to wait, in which case nothing is counted.
+        """
+        now = time.time()
+        rate_key = self._key('rate', tenant, str(int(now // 60)))
+        active_key = self._key('active', tenant)
+
+        def claim(pipe) -> Tuple[str, int]:
+            # Reads run under WATCH; if another submission of the tenant
+            # commits first, EXEC fails and the limits are checked again
+            submitted = int(pipe.get(rate_key) or 0)
+            # Scores are the times the slots lapse
+            active = pipe.zcount(active_key, f"({now}", '+inf')
+            if submitted >= BaseConfig.USER_JOBS_PER_MINUTE:
+                raise RateLimitError(
+                    f"More than {BaseConfig.USER_JOBS_PER_MINUTE} jobs per minute; retry in {60 - int(now % 60)}s"
+                )
+            if active >= BaseConfig.USER_MAX_ACTIVE_JOBS:
+                raise RateLimitError(
+                    f"{active} jobs already queued or running (limit {BaseConfig.USER_MAX_ACTIVE_JOBS}); "
+                    f"retry when one finishes"
+                )
+            queue, priority = self.route(operation, cost, active)
+
+            pipe.multi()
+            pipe.incr(rate_key)
+            pipe.expire(rate_key, 120)
+            pipe.zremrangebyscore(active_key, 0, now)
+            pipe.hset(self._key('job', job_id), mapping={'tenant': tenant, 'queue': queue, 'enqueued_at': now})
+            pipe.expire(self._key('job', job_id), JOB_TTL)
+            pipe.zadd(active_key, {job_id: now + JOB_TTL})
+            pipe.zadd(self._key('queued', queue), {job_id: now})
+            return queue, priority
+
+        return self.redis.transaction(claim, rate_key, active_key, value_from_callable=True)
+
+    def job_started(self, job_id: str) -> None:
+        """Called by the worker: the job left its queue; record how long it waited."""
+        tenant, queue, enqueued_at = self.redis.hmget(self._key('job', job_id), ['tenant', 'queue', 'enqueued_at'])
+        if queue is None:
+            return
+        queue = queue.decode()
+        pipe = self.redis.pipeline()
+        pipe.zadd(self._key('active', tenant.decode()), {job_id: time.time() + SLOT_RUN_TTL}, xx=True)
+        pipe.zrem(self._key('queued', queue), job_id)
+        pipe.lpush(self._key('waits', queue), round(time.time() - float(enqueued_at), 3))
+        pipe.ltrim(self._key('waits', queue), 0, WAIT_SAMPLES - 1)
+        pipe.incr(self._key('started', queue))
+        pipe.execute()
+
+    def job_running(self, job_id: str) -> None:
+        """Called by the worker as a job moves on to another task, e.g. the next merge level."""
+        tenant = self.redis.hget(self._key('job', job_id), 'tenant')
+        if tenant is not None:
+            self.redis.zadd(self._key('active', tenant.decode()), {job_id: time.time() + SLOT_RUN_TTL}, xx=True)
+
+    def job_finished(self, job_id: str) -> None:
+        """Free the tenant's slot once a job reaches a final state."""
+        tenant, queue = self.redis.hmget(self._key('job', job_id), ['tenant', 'queue'])
+        if tenant is None:
+            return
+        pipe = self.redis.pipeline()
+        pipe.zrem(self._key('active', tenant.decode()), job_id)
+        pipe.zrem(self._key('queued', queue.decode()), job_id)
+        pipe.delete(self._key('job', job_id))
+        pipe.execute()
+
+    def metrics(self) -> Dict[str, dict]:
+        """Per queue: jobs waiting, age of the oldest, recent wait-time percentiles."""
+        now = time.time()
+        pipe = self.redis.pipeline()
+        for queue in QUEUES:
+            pipe.zremrangebyscore(self._key('queued', queue), 0, now - JOB_TTL)
+            pipe.zcard(self._key('queued', queue))
+            pipe.zrange(self._key('queued', queue), 0, 0, withscores=True)
+            pipe.lrange(self._key('waits', queue), 0, -1)
+            pipe.get(self._key('started', queue))
+        results = pipe.execute()
+
+        metrics = {}
+        for i, queue in enumerate(QUEUES):
+            _, depth, oldest, waits, started = results[i * 5:i * 5 + 5]
+            waits = sorted(float(wait) for wait in waits)
+            metrics[queue] = {
+                'depth': depth,
+                'oldest_wait_seconds': round(now - oldest[0][1], 3) if oldest else 0,
+                'wait_p50_seconds': self._percentile(waits, 0.50),
+                'wait_p95_seconds': self._percentile(waits, 0.95),
+                'started_total': int(started or 0),
+            }
+        return metrics
+
+    @staticmethod
+    def _percentile(values, p: float) -> Optional[float]:
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+    @staticmethod
+    def _key(*parts: str) -> str:
+        return ':'.join(('sched',) + parts)
@@ -0,0 +1,48 @@
+import json
+from typing import Dict, Iterable
+from app.config.config import BaseConfig
+from app.extensions import redis_client
+import logging
+
+logger = logging.getLogger(__name__)
+
+class OcrCache:
+    """
+    OCR results per scan image, keyed by the hash of the image's stored
+    bytes and the language. Merges and re-uploads carry images over
+    unchanged, so pages seen before are not OCRed again. Entries live in
+    Redis, shared by all workers, and expire after OCR_CACHE_TTL seconds.
+    The cache is an optimization only: Redis errors count as misses.
+    """
+
+    PREFIX = 'ocr_cache'
+
+    def __init__(self, redis=redis_client, ttl: int = BaseConfig.OCR_CACHE_TTL):
+        self.redis = redis
+        self.ttl = ttl
+
+    def get_many(self, keys: Iterable[str], language: str) -> Dict[str, dict]:
+        """Cached results of the keys that have one, in one round trip."""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        try:
+            values = self.redis.mget([self._key(language, key) for key in keys])
+        except Exception as e:
+            logger.warning(f"OCR cache lookup failed: {str(e)}")
+            return {}
+        return {key: json.loads(value) for key, value in zip(keys, values) if value}
+
+    def put_many(self, results: Dict[str, dict], language: str) -> None:
+        if not results:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for key, result in results.items():
+                pipe.set(self._key(language, key), json.dumps(result), ex=self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to cache OCR results: {str(e)}")
+
+    def _key(self, language: str, key: str) -> str:
+        return f"{self.PREFIX}:{language}:{key}"
@@ -0,0 +1,277 @@
+import io
+import json
+import mmap
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from app.config.config import BaseConfig
+from app.extensions import redis_client
+from app.services.storage_service import StorageService
+from app.utils.error_handling import NotFoundError, ValidationError
+import logging
+
+if TYPE_CHECKING:
+    from PyPDF2 import PdfReader
+
+logger = logging.getLogger(__name__)
+
+INDEX_TTL = 7 * 24 * 60 * 60
+# Keys that point back up or across the document; following them would
+# pull every page into a single-page extract
+SKIPPED_KEYS = {'/Parent', '/P', '/Dest', '/A', '/B', '/Next', '/Prev'}
+# Ranged reads closer together than this are fetched as one
+COALESCE_GAP = 64 * 1024
+
+class PageIndexService:
+    """
+    Serves single pages of stored PDFs without reading whole files.
+
+    A page-offset index is built once per blob (keyed by its SHA-256, so it
+    never goes stale) and kept in a Redis hash: for each page, the page
+    dictionary and the byte offsets of every object it needs. Extracting a
+    page is then one HGET and a few ranged reads, whatever the document size.
+    Pages that use compressed object streams fall back to a full parse,
+    whose reader is kept (for the last PAGE_READER_CACHE_SIZE blobs) so
+    the next such page of the same blob does not fetch and parse it again.
+    """
+
+    def __init__(self, storage_service: StorageService, redis=redis_client,
+                 reader_cache_size: int = BaseConfig.PAGE_READER_CACHE_SIZE):
+        self.storage_service = storage_service
+        self.redis = redis
+        self.reader_cache_size = reader_cache_size
+        # digest -> (reader, lock); a reader reads its file lazily and is not thread-safe
+        self._readers: OrderedDict = OrderedDict()
+        self._readers_lock = threading.Lock()
+
+    @staticmethod
+    def _key(digest: str) -> str:
+        return f"page_index:{digest}"
+
+    @staticmethod
+    def scan(pdf_path: str) -> dict:
+        """Build the page-offset index of a local PDF."""
+        # PDF and image libraries are imported on first use, not at API startup
+        from PyPDF2 import PdfReader
+
+        with open(pdf_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return PageIndexService._scan(PdfReader(f), data)
+
+    @staticmethod
+    def _scan(reader: 'PdfReader', data: mmap.mmap) -> dict:
+        from PyPDF2.generic import DictionaryObject
+
+        if reader.is_encrypted:
+            return {'count': len(reader.pages), 'pages': [{'fallback': True}] * len(reader.pages)}
+
+        # Byte span of each uncompressed object: its offset up to its endobj
+        offsets = {
+            num: (gen, offset)
+            for gen, entries in reader.xref.items()
+            for num, offset in entries.items()
+            if num and num not in reader.xref_objStm
+        }
+        starts = sorted(offset for _, offset in offsets.values()) + [len(data)]
+        following = {start: starts[i + 1] for i, start in enumerate(starts[:-1])}
+
+        def span(num: int) -> Optional[list]:
+            if num not in offsets:
+                return None
+            gen, start = offsets[num]
+            end = data.rfind(b'endobj', start, following[start])
+            return [num, gen, start, (end + 6 if end != -1 else following[start]) - start]
+
+        pages = []
+        for page in reader.pages:
+            page_dict = DictionaryObject({k: v for k, v in page.items() if k != '/Parent'})
+            refs = PageIndexService._references(page_dict)
+            # Parsed objects (image data included) are only needed per page;
+            # dropping them keeps the scan's memory flat however big the file
+            reader.resolved_objects.clear()
+            spans = [span(num) for num in sorted(refs)]
+            if any(s is None for s in spans):
+                pages.append({'fallback': True})
+                continue
+            stream = io.BytesIO()
+            page_dict.write_to_stream(stream, None)
+            pages.append({'page': stream.getvalue().decode('latin-1'), 'objects': spans})
+        return {'count': len(pages), 'pages': pages}
+
+    @staticmethod
+    def _references(root) -> set:
+        """Object numbers reachable from root, not following SKIPPED_KEYS."""
+        from PyPDF2.generic import ArrayObject, IndirectObject
+
+        seen = set()
+        pending = [root]
+        while pending:
+            value = pending.pop()
+            if isinstance(value, IndirectObject):
+                if value.idnum in seen:
+                    continue
+                seen.add(value.idnum)
+                pending.append(value.get_object())
+            elif isinstance(value, dict):
+                pending.extend(v for k, v in value.items() if k not in SKIPPED_KEYS)
+            elif isinstance(value, (list, ArrayObject)):
+                pending.extend(value)
+        return seen
+
+    def save(self, digest: str, index: dict) -> None:
+        key = self._key(digest)
+        mapping = {str(number): json.dumps(entry) for number, entry in enumerate(index['pages'], 1)}
+        mapping['count'] = index['count']
+        pipe = self.redis.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, INDEX_TTL)
+        pipe.execute()
+
+    def build(self, digest: str, storage_key: str) -> dict:
+        with self.storage_service.local_path(storage_key) as pdf_path:
+            index = self.scan(pdf_path)
+        self.save(digest, index)
+        return index
+
+    def get_index(self, digest: str, pdf_path: str) -> dict:
+        """The whole index of a blob already fetched to pdf_path, scanning it on first use."""
+        cached = self.redis.hgetall(self._key(digest))
+        if b'count' not in cached:
+            index = self.scan(pdf_path)
+            self.save(digest, index)
+            return index
+        self.redis.expire(self._key(digest), INDEX_TTL)
+        count = int(cached[b'count'])
+        return {'count': count, 'pages': [json.loads(cached[str(number).encode()]) for number in range(1, count + 1)]}
+
+    def get_entry(self, digest: str, storage_key: str, number: int) -> dict:
+        """Index entry of page number (1-based), building the index on first use."""
+        count, entry = self.redis.hmget(self._key(digest), ['count', str(number)])
+        if count is None:
+            index = self.build(digest, storage_key)
+            count = index['count']
+            entry = json.dumps(index['pages'][number - 1]) if 0 < number <= count else None
+        if entry is None:
+            raise NotFoundError(f"Page {number} not found; the document has {int(count)} pages")
+        self.redis.expire(self._key(digest), INDEX_TTL)
+        return json.loads(entry)
+
+    def extract_page(self, digest: str, storage_key: str, number: int) -> bytes:
+        """A standalone one-page PDF holding page number (1-based)."""
+        entry = self.get_entry(digest, storage_key, number)
+        if entry.get('fallback'):
+            return self._extract_page_parsed(digest, storage_key, number)
+
+        output = io.BytesIO()
+        output.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        xref: Dict[int, tuple] = {}
+        for (num, gen, _, _), body in zip(entry['objects'], self._read_spans(storage_key, entry['objects'])):
+            xref[num] = (output.tell(), gen)
+            output.write(body)
+            output.write(b"\n")
+
+        # New page, page tree and catalog numbered after the copied objects
+        page_num = max(xref, default=0) + 1
+        pages_num, catalog_num = page_num + 1, page_num + 2
+        page_body = entry['page'].encode('latin-1')
+        for num, body in (
+            (page_num, b"<< /Parent %d 0 R " % pages_num + page_body[2:]),
+            (pages_num, b"<< /Type /Pages /Kids [%d 0 R] /Count 1 >>" % page_num),
+            (catalog_num, b"<< /Type /Catalog /Pages %d 0 R >>" % pages_num),
+        ):
+            xref[num] = (output.tell(), 0)
+            output.write(b"%d 0 obj\n" % num + body + b"\nendobj\n")
+
+        xref_offset = output.tell()
+        size = catalog_num + 1
+        output.write(b"xref\n0 %d\n" % size)
+        for num in range(size):
+            if num in xref:
+                output.write(b"%010d %05d n \n" % xref[num])
+            else:
+                output.write(b"0000000000 65535 f \n")
+        output.write(
+            b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (size, catalog_num, xref_offset)
+        )
+        return output.getvalue()
+
+    def _read_spans(self, storage_key: str, spans: List[list]) -> List[bytes]:
+        """Read object byte spans, coalescing nearby ones into single ranged reads."""
+        order = sorted(range(len(spans)), key=lambda i: spans[i][2])
+        bodies: List[Optional[bytes]] = [None] * len(spans)
+        group: List[int] = []
+
+        def fetch(group):
+            start = spans[group[0]][2]
+            end = max(spans[i][2] + spans[i][3] for i in group)
+            data = b''.join(self.storage_service.backend.iter_range(storage_key, start, end - 1))
+            for i in group:
+                bodies[i] = data[spans[i][2] - start:spans[i][2] - start + spans[i][3]]
+
+        for i in order:
+            if group and spans[i][2] - max(spans[j][2] + spans[j][3] for j in group) > COALESCE_GAP:
+                fetch(group)
+                group = []
+            group.append(i)
+        if group:
+            fetch(group)
+        return bodies
+
+    def _extract_page_parsed(self, digest: str, storage_key: str, number: int) -> bytes:
+        from PyPDF2 import PdfWriter
+
+        reader, lock = self._reader(digest, storage_key)
+        with lock:
+            writer = PdfWriter()
+            writer.add_page(reader.pages[number - 1])
+            output = io.BytesIO()
+            writer.write(output)
+        return output.getvalue()
+
+    def _reader(self, digest: str, storage_key: str) -> Tuple['PdfReader', threading.Lock]:
+        """A parsed reader of the blob, from the cache or fetched and parsed once."""
+        from PyPDF2 import PdfReader
+
+        with self._readers_lock:
+            cached = self._readers.get(digest)
+            if cached is not None:
+                self._readers.move_to_end(digest)
+                return cached
+        with self.storage_service.local_path(storage_key) as pdf_path:
+            # The handle outlives a downloaded copy's removal; the file is
+            # closed once its reader is evicted and dropped
+            f = open(pdf_path, 'rb')
+        try:
+            cached = (PdfReader(f), threading.Lock())
+        except Exception:
+            f.close()
+            raise
+        with self._readers_lock:
+            cached = self._readers.setdefault(digest, cached)
+            self._readers.move_to_end(digest)
+            while len(self._readers) > self.reader_cache_size:
+                self._readers.popitem(last=False)
+        return cached
+
+    def thumbnail(self, digest: str, storage_key: str, number: int, width: int) -> bytes:
+        """
+        PNG preview of a page, scaled to width. Pages are not rendered: the
+        largest image on the page is used, which suits scanned documents.
+        """
+        from PIL import Image
+        from PyPDF2 import PdfReader
+
+        page = PdfReader(io.BytesIO(self.extract_page(digest, storage_key, number))).pages[0]
+        try:
+            images = [Image.open(io.BytesIO(image.data)) for image in page.images]
+        except Exception as e:
+            logger.warning(f"Failed to decode images of page {number}: {str(e)}")
+            images = []
+        if not images:
+            raise ValidationError(f"Page {number} has no image to preview")
+        image = max(images, key=lambda im: im.width * im.height)
+        image.thumbnail((width, width * image.height // image.width or 1))
+        output = io.BytesIO()
+        image.convert('RGB' if image.mode not in ('RGB', 'L') else image.mode).save(output, 'PNG', optimize=True)
+        return output.getvalue()
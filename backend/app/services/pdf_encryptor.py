@@ -0,0 +1,218 @@
+import gc
+import hashlib
+import io
+import os
+from typing import BinaryIO, Dict, Tuple
+
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from PyPDF2 import PdfReader
+from PyPDF2.generic import (
+    ArrayObject,
+    BooleanObject,
+    ByteStringObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+    TextStringObject,
+)
+
+# All permissions granted; the owner password only guards the encryption itself
+PERMISSIONS = -4
+
+
+class PdfEncryptor:
+    """
+    Write a copy of a PDF encrypted with the standard security handler,
+    AES-256 (V5, revision 6), one object at a time.
+
+    Every object keeps its number; strings are encrypted in place and stream
+    data is fed through AES-256-CBC in fixed-size chunks straight to the
+    output, so memory is bounded by the largest single stream, not the file.
+    Objects from object streams are written as plain objects and the
+    containers themselves (object and xref streams) are dropped.
+    """
+
+    HEADER = b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n"
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, user_password: str, owner_password: str):
+        self.file_key = os.urandom(32)
+        self.encrypt_dict = self._encrypt_dict(user_password.encode()[:127], owner_password.encode()[:127])
+
+    def encrypt(self, source_path: str, output: BinaryIO) -> None:
+        # Read from the open file so PyPDF2 does not buffer it whole
+        with open(source_path, 'rb') as stream:
+            self._encrypt_reader(PdfReader(stream), source_path, output)
+        # PdfReader holds reference cycles
+        gc.collect()
+
+    def _encrypt_reader(self, reader: PdfReader, source_path: str, output: BinaryIO) -> None:
+        if reader.is_encrypted:
+            raise ValueError(f"PDF is already encrypted: {source_path}")
+
+        objects = sorted(
+            {(num, gen) for gen, entries in reader.xref.items() for num in entries if num}
+            | {(num, 0) for num in reader.xref_objStm}
+        )
+        root = reader.trailer.raw_get('/Root').idnum
+        xref: Dict[int, Tuple[int, int]] = {}
+        output.write(self.HEADER)
+        for num, gen in objects:
+            obj = reader.get_object(IndirectObject(num, gen, reader))
+            if isinstance(obj, DictionaryObject) and (
+                    obj.get('/Type') in ('/ObjStm', '/XRef') or '/Linearized' in obj):
+                continue
+            if num == root:
+                # AESV3 is an extension to PDF 1.7
+                obj = DictionaryObject(obj)
+                obj[NameObject('/Extensions')] = DictionaryObject({
+                    NameObject('/ADBE'): DictionaryObject({
+                        NameObject('/BaseVersion'): NameObject('/1.7'),
+                        NameObject('/ExtensionLevel'): NumberObject(8),
+                    })
+                })
+            xref[num] = (output.tell(), gen)
+            output.write(b"%d %d obj\n" % (num, gen))
+            self._write_value(obj, output)
+            output.write(b"\nendobj\n")
+            if isinstance(obj, StreamObject):
+                # Stream data is only needed while it is written
+                reader.resolved_objects.pop((gen, num), None)
+
+        encrypt_num = max(xref, default=0) + 1
+        xref[encrypt_num] = (output.tell(), 0)
+        output.write(b"%d 0 obj\n" % encrypt_num + self._serialize(self.encrypt_dict) + b"\nendobj\n")
+
+        trailer = DictionaryObject({
+            NameObject('/Size'): NumberObject(encrypt_num + 1),
+            NameObject('/Root'): IndirectObject(root, xref[root][1], None),
+            NameObject('/Encrypt'): IndirectObject(encrypt_num, 0, None),
+            NameObject('/ID'): reader.trailer.get('/ID') or ArrayObject([ByteStringObject(os.urandom(16))] * 2),
+        })
+        info = reader.trailer.raw_get('/Info') if '/Info' in reader.trailer else None
+        if isinstance(info, IndirectObject) and info.idnum in xref:
+            trailer[NameObject('/Info')] = IndirectObject(info.idnum, info.generation, None)
+        self._write_xref(output, xref, trailer)
+
+    def _write_value(self, obj, output: BinaryIO) -> None:
+        """Write obj with its strings encrypted; stream data is encrypted chunk by chunk."""
+        if not isinstance(obj, StreamObject):
+            output.write(self._serialize(self._encrypt_strings(obj)))
+            return
+        data = obj._data
+        header = DictionaryObject(
+            (key, self._encrypt_strings(value)) for key, value in obj.items() if key != '/Length'
+        )
+        # IV plus the data padded to whole blocks
+        header[NameObject('/Length')] = NumberObject(16 + (len(data) // 16 + 1) * 16)
+        output.write(self._serialize(header))
+        output.write(b"\nstream\n")
+        iv = os.urandom(16)
+        encryptor = Cipher(algorithms.AES(self.file_key), modes.CBC(iv)).encryptor()
+        padder = padding.PKCS7(128).padder()
+        output.write(iv)
+        with memoryview(data) as view:
+            for start in range(0, len(data), self.CHUNK_SIZE):
+                output.write(encryptor.update(padder.update(view[start:start + self.CHUNK_SIZE])))
+        output.write(encryptor.update(padder.finalize()) + encryptor.finalize())
+        output.write(b"\nendstream")
+
+    def _encrypt_strings(self, value):
+        if isinstance(value, (TextStringObject, ByteStringObject)):
+            return ByteStringObject(self._encrypt_bytes(_string_bytes(value)))
+        if isinstance(value, DictionaryObject):
+            return DictionaryObject((key, self._encrypt_strings(item)) for key, item in value.items())
+        if isinstance(value, ArrayObject):
+            return ArrayObject(self._encrypt_strings(item) for item in value)
+        return value
+
+    def _encrypt_bytes(self, data: bytes) -> bytes:
+        iv = os.urandom(16)
+        padder = padding.PKCS7(128).padder()
+        encryptor = Cipher(algorithms.AES(self.file_key), modes.CBC(iv)).encryptor()
+        return iv + encryptor.update(padder.update(data) + padder.finalize()) + encryptor.finalize()
+
+    def _encrypt_dict(self, user: bytes, owner: bytes) -> DictionaryObject:
+        """The /Encrypt dictionary of revision 6 (ISO 32000-2, algorithms 8 to 10)."""
+        user_salts, owner_salts = os.urandom(16), os.urandom(16)
+        u = _hash_r6(user, user_salts[:8]) + user_salts
+        ue = _aes_no_padding(_hash_r6(user, user_salts[8:]), self.file_key)
+        o = _hash_r6(owner, owner_salts[:8], u) + owner_salts
+        oe = _aes_no_padding(_hash_r6(owner, owner_salts[8:], u), self.file_key)
+        perms_plain = (PERMISSIONS & 0xFFFFFFFF).to_bytes(4, 'little') + b"\xff\xff\xff\xffTadb" + os.urandom(4)
+        encryptor = Cipher(algorithms.AES(self.file_key), modes.ECB()).encryptor()
+        perms = encryptor.update(perms_plain) + encryptor.finalize()
+
+        return DictionaryObject({
+            NameObject('/Filter'): NameObject('/Standard'),
+            NameObject('/V'): NumberObject(5),
+            NameObject('/R'): NumberObject(6),
+            NameObject('/Length'): NumberObject(256),
+            NameObject('/CF'): DictionaryObject({
+                NameObject('/StdCF'): DictionaryObject({
+                    NameObject('/AuthEvent'): NameObject('/DocOpen'),
+                    NameObject('/CFM'): NameObject('/AESV3'),
+                    NameObject('/Length'): NumberObject(32),
+                })
+            }),
+            NameObject('/StmF'): NameObject('/StdCF'),
+            NameObject('/StrF'): NameObject('/StdCF'),
+            NameObject('/O'): ByteStringObject(o),
+            NameObject('/U'): ByteStringObject(u),
+            NameObject('/OE'): ByteStringObject(oe),
+            NameObject('/UE'): ByteStringObject(ue),
+            NameObject('/P'): NumberObject(PERMISSIONS),
+            NameObject('/Perms'): ByteStringObject(perms),
+            NameObject('/EncryptMetadata'): BooleanObject(True),
+        })
+
+    @staticmethod
+    def _serialize(obj) -> bytes:
+        buffer = io.BytesIO()
+        obj.write_to_stream(buffer, None)
+        return buffer.getvalue()
+
+    def _write_xref(self, output: BinaryIO, xref: Dict[int, Tuple[int, int]], trailer: DictionaryObject) -> None:
+        """An xref table with one subsection per run of consecutive object numbers."""
+        offset = output.tell()
+        output.write(b"xref\n0 1\n0000000000 65535 f \n")
+        nums = sorted(xref)
+        start = 0
+        for i in range(1, len(nums) + 1):
+            if i == len(nums) or nums[i] != nums[i - 1] + 1:
+                output.write(b"%d %d\n" % (nums[start], i - start))
+                output.writelines(b"%010d %05d n \n" % xref[num] for num in nums[start:i])
+                start = i
+        output.write(b"trailer\n" + self._serialize(trailer) + b"\nstartxref\n%d\n%%%%EOF\n" % offset)
+
+
+def _string_bytes(value) -> bytes:
+    if isinstance(value, ByteStringObject):
+        return bytes(value)
+    try:
+        return value.get_original_bytes()
+    except Exception:
+        # Not parsed from a file: PDF text strings are UTF-16BE with a BOM
+        return b"\xfe\xff" + value.encode('utf-16be')
+
+
+def _hash_r6(password: bytes, salt: bytes, user_key: bytes = b'') -> bytes:
+    """Algorithm 2.B: the iterated SHA-2/AES hash of a password."""
+    k = hashlib.sha256(password + salt + user_key).digest()
+    rounds = 0
+    while True:
+        k1 = (password + k + user_key) * 64
+        encryptor = Cipher(algorithms.AES(k[:16]), modes.CBC(k[16:32])).encryptor()
+        e = encryptor.update(k1) + encryptor.finalize()
+        k = (hashlib.sha256, hashlib.sha384, hashlib.sha512)[int.from_bytes(e[:16], 'big') % 3](e).digest()
+        rounds += 1
+        if rounds >= 64 and e[-1] <= rounds - 32:
+            return k[:32]
+
+
+def _aes_no_padding(key: bytes, data: bytes) -> bytes:
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(b"\x00" * 16)).encryptor()
+    return encryptor.update(data) + encryptor.finalize()
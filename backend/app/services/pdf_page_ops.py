@@ -0,0 +1,310 @@
+"""
+Per-page-range work run in worker processes.
+
+Each function takes a source file and a [start, end) page or frame range,
+writes that range as a standalone PDF part and returns the number of pages
+it processed. Functions are module-level so the page pool (billiard) can
+pickle them.
+"""
+import hashlib
+import io
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.filters import _xobj_to_image
+from PyPDF2.generic import (
+    ArrayObject,
+    BooleanObject,
+    ContentStream,
+    DecodedStreamObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+)
+
+JPEG_FILTERS = {'/DCTDecode', '/JPXDecode', '/JBIG2Decode', '/CCITTFaxDecode'}
+IMAGE_MODES = {'/DeviceRGB': 'RGB', '/DeviceGray': 'L'}
+# Resource name of the font of OCR text layers
+OCR_FONT = '/FOcr'
+# Page key set on pages given a text layer; they are not OCRed again. Kept on
+# the page itself, as resource dictionaries are often shared between pages
+OCR_MARKER = '/FileOpsOCR'
+# How deep to follow form XObjects drawn by a page when looking for its scan
+MAX_FORM_DEPTH = 3
+
+
+def page_count(source_path: str) -> int:
+    return len(PdfReader(source_path).pages)
+
+
+def frame_count(source_path: str) -> int:
+    with Image.open(source_path) as image:
+        return getattr(image, 'n_frames', 1)
+
+
+def compress_page_range(source_path: str, start: int, end: int, output_path: str,
+                        image_quality: int) -> int:
+    """Recompress images as JPEG and deflate content streams for pages [start, end)."""
+    reader = PdfReader(source_path)
+    writer = PdfWriter()
+    for index in range(start, end):
+        page = writer.add_page(reader.pages[index])
+        compress_page(writer, page, image_quality)
+    with open(output_path, 'wb') as output_file:
+        writer.write(output_file)
+    return end - start
+
+
+def compress_page(writer: PdfWriter, page, image_quality: int = 75) -> None:
+    """Recompress one added page's images as JPEG and deflate its content stream."""
+    _recompress_images(page, image_quality)
+    contents = page.get_contents()
+    if contents is not None:
+        # compress_content_streams() would leave a direct stream object
+        # in the page, which PyPDF2 3.0 writes out invalid
+        page[NameObject('/Contents')] = writer._add_object(contents.flate_encode())
+
+
+def convert_frame_range(source_path: str, start: int, end: int, output_path: str) -> int:
+    """Render image frames [start, end) as PDF pages."""
+    _render_frames(source_path, start, end, output_path)
+    return end - start
+
+
+# Pipeline steps applied page by page, called as step(writer, page, **params)
+PAGE_STEPS = {
+    'compress_pdf': compress_page,
+}
+
+
+def run_pipeline_range(segments: List[Tuple[str, str, int, int]], output_path: str,
+                       steps: List[dict]) -> Tuple[int, Dict[str, float]]:
+    """
+    Run page-level pipeline steps over one range of pages and write it as a
+    part. The range is given as segments (source_path, kind, start, end),
+    kind 'pdf' for pages or 'image' for frames, so a range can span the
+    inputs of a merge. Every step works on the same page objects in memory.
+    Returns the number of pages and the seconds spent per step.
+    """
+    timings: Dict[str, float] = defaultdict(float)
+    writer = PdfWriter()
+    pages = 0
+    for source_path, kind, start, end in segments:
+        started = time.perf_counter()
+        if kind == 'image':
+            # Frames become PDF pages in memory, never as a file
+            buffer = io.BytesIO()
+            _render_frames(source_path, start, end, buffer)
+            source_pages = list(PdfReader(buffer).pages)
+            timings['convert_to_pdf'] += time.perf_counter() - started
+        else:
+            reader = PdfReader(source_path)
+            if reader.is_encrypted:
+                raise ValueError(f"Cannot process encrypted PDF: {source_path}")
+            source_pages = [reader.pages[index] for index in range(start, end)]
+            timings['read'] += time.perf_counter() - started
+
+        for source_page in source_pages:
+            started = time.perf_counter()
+            page = writer.add_page(source_page)
+            timings['read'] += time.perf_counter() - started
+            for step in steps:
+                started = time.perf_counter()
+                PAGE_STEPS[step['operation']](writer, page, **step.get('params', {}))
+                timings[step['operation']] += time.perf_counter() - started
+            pages += 1
+
+    started = time.perf_counter()
+    with open(output_path, 'wb') as output_file:
+        writer.write(output_file)
+    timings['write'] += time.perf_counter() - started
+    return pages, dict(timings)
+
+
+def ocr_page_keys(source_path: str, start: int, end: int) -> List[Optional[str]]:
+    """OCR cache key of each page in [start, end), or None for pages with nothing to OCR."""
+    reader = PdfReader(source_path)
+    keys = []
+    for index in range(start, end):
+        image = _scan_image(reader.pages[index])
+        keys.append(_image_key(image) if image is not None else None)
+    return keys
+
+
+def ocr_page_range(source_path: str, start: int, end: int, output_path: str, language: str,
+                   known: Dict[int, dict]) -> Tuple[int, Dict[str, dict]]:
+    """
+    Give pages [start, end) an invisible text layer from OCR of their scan
+    image. known holds cached results by page index; those pages are not
+    OCRed. Returns the number of pages and the new results by cache key.
+    """
+    reader = PdfReader(source_path)
+    writer = PdfWriter()
+    font_ref = None
+    recognized = {}
+    for index in range(start, end):
+        page = writer.add_page(reader.pages[index])
+        image = _scan_image(page)
+        if image is None:
+            continue
+        result = known.get(index)
+        if result is None:
+            result = _recognize(image, language)
+            recognized[_image_key(image)] = result
+        if result['words']:
+            if font_ref is None:
+                font_ref = writer._add_object(DictionaryObject({
+                    NameObject('/Type'): NameObject('/Font'),
+                    NameObject('/Subtype'): NameObject('/Type1'),
+                    NameObject('/BaseFont'): NameObject('/Helvetica'),
+                    NameObject('/Encoding'): NameObject('/WinAnsiEncoding'),
+                }))
+            _add_text_layer(writer, page, result, font_ref)
+    with open(output_path, 'wb') as output_file:
+        writer.write(output_file)
+    return end - start, recognized
+
+
+def _scan_image(page):
+    """The largest image a page draws, taken to be its scan; None if it draws none or was OCRed already."""
+    if page.get(OCR_MARKER):
+        return None
+    largest, largest_area = None, 0
+    for image in _drawn_images(page.get_contents(), page.get('/Resources'), page.pdf, MAX_FORM_DEPTH):
+        area = int(image.get('/Width', 0)) * int(image.get('/Height', 0))
+        if area > largest_area:
+            largest, largest_area = image, area
+    return largest
+
+
+def _drawn_images(contents, resources, pdf, depth: int):
+    """Image XObjects painted by the Do operators of contents, including those inside drawn forms."""
+    resources = resources.get_object() if resources else {}
+    xobjects = resources.get('/XObject')
+    if contents is None or not xobjects:
+        return
+    xobjects = xobjects.get_object()
+    if not isinstance(contents, ContentStream):
+        contents = ContentStream(contents, pdf)
+    for operands, operator in contents.operations:
+        if operator != b'Do' or not operands or operands[0] not in xobjects:
+            continue
+        xobject = xobjects[operands[0]].get_object()
+        if xobject.get('/Subtype') == '/Image':
+            yield xobject
+        elif xobject.get('/Subtype') == '/Form' and depth > 0:
+            # A form without resources of its own uses those of the page
+            yield from _drawn_images(xobject, xobject.get('/Resources') or resources, pdf, depth - 1)
+
+
+def _image_key(image) -> str:
+    # The stored bytes, as copied unchanged by merges and re-uploads
+    digest = hashlib.sha256(image._data)
+    digest.update(b'%d:%d' % (int(image['/Width']), int(image['/Height'])))
+    return digest.hexdigest()
+
+
+def _recognize(image, language: str) -> dict:
+    """OCR one image: its size and its words as [text, left, top, width, height] in pixels."""
+    # Only OCR jobs need it, and it needs the tesseract binary
+    import pytesseract
+
+    _, data = _xobj_to_image(image)
+    with Image.open(io.BytesIO(data)) as pixels:
+        width, height = pixels.size
+        try:
+            found = pytesseract.image_to_data(pixels, lang=language, output_type=pytesseract.Output.DICT)
+        except Exception as e:
+            # pytesseract's exceptions cannot be pickled back out of a pool process
+            raise RuntimeError(f"OCR failed: {str(e)}") from None
+    words = [
+        [text, found['left'][i], found['top'][i], found['width'][i], found['height'][i]]
+        for i, text in enumerate(found['text'])
+        if text.strip() and float(found['conf'][i]) >= 0
+    ]
+    return {'width': width, 'height': height, 'words': words}
+
+
+def _add_text_layer(writer: PdfWriter, page, result: dict, font_ref: IndirectObject) -> None:
+    """Lay OCRed words over the page as invisible text (render mode 3), the scan stretched over the MediaBox."""
+    left, bottom = float(page.mediabox.left), float(page.mediabox.bottom)
+    page_width, page_height = float(page.mediabox.width), float(page.mediabox.height)
+    scale_x, scale_y = page_width / result['width'], page_height / result['height']
+    operations = [b'Q', b'BT', b'3 Tr']
+    for text, x, y, width, height in result['words']:
+        size = max(1.0, height * scale_y)
+        # Stretch each word to its box; Helvetica averages about half an em per character
+        stretch = 100 * width * scale_x / (size * 0.5 * len(text))
+        escaped = text.encode('cp1252', 'replace').replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+        operations.append(b'%s %.2f Tf %.1f Tz 1 0 0 1 %.2f %.2f Tm (%s) Tj' % (
+            OCR_FONT.encode(), size, stretch, left + x * scale_x, bottom + page_height - (y + height) * scale_y, escaped
+        ))
+    operations.append(b'ET')
+
+    # The page's own content runs inside q/Q, so its graphics state cannot move the text
+    contents = page.get('/Contents')
+    refs = []
+    if contents is not None:
+        resolved = contents.get_object()
+        if isinstance(resolved, ArrayObject):
+            refs = list(resolved)
+        else:
+            refs = [contents if isinstance(contents, IndirectObject) else writer._add_object(resolved)]
+    prefix, text_layer = DecodedStreamObject(), DecodedStreamObject()
+    prefix.set_data(b'q')
+    text_layer.set_data(b'\n'.join(operations))
+    page[NameObject('/Contents')] = ArrayObject(
+        [writer._add_object(prefix)] + refs + [writer._add_object(text_layer)]
+    )
+
+    # Resources may be shared with other pages; add the font to this page's own copy
+    resources = DictionaryObject(page['/Resources'].get_object()) if '/Resources' in page else DictionaryObject()
+    fonts = DictionaryObject(resources['/Font'].get_object()) if '/Font' in resources else DictionaryObject()
+    fonts[NameObject(OCR_FONT)] = font_ref
+    resources[NameObject('/Font')] = fonts
+    page[NameObject('/Resources')] = resources
+    page[NameObject(OCR_MARKER)] = BooleanObject(True)
+
+
+def _render_frames(source_path: str, start: int, end: int, output) -> None:
+    frames = []
+    with Image.open(source_path) as image:
+        for index in range(start, end):
+            image.seek(index)
+            frame = image.convert('RGB') if image.mode not in ('RGB', 'L') else image.copy()
+            frames.append(frame)
+    frames[0].save(output, 'PDF', save_all=True, append_images=frames[1:])
+
+
+def _recompress_images(page, image_quality: int) -> None:
+    resources = page.get('/Resources')
+    xobjects = resources.get_object().get('/XObject') if resources else None
+    if not xobjects:
+        return
+    for ref in xobjects.get_object().values():
+        image = ref.get_object()
+        if image.get('/Subtype') != '/Image':
+            continue
+        filters = image.get('/Filter')
+        filters = filters if isinstance(filters, list) else [filters]
+        mode = IMAGE_MODES.get(image.get('/ColorSpace'))
+        if (mode is None or image.get('/BitsPerComponent') != 8
+                or '/SMask' in image or JPEG_FILTERS.intersection(filters)):
+            continue
+        try:
+            width, height = int(image['/Width']), int(image['/Height'])
+            pixels = Image.frombytes(mode, (width, height), image.get_data())
+        except Exception:
+            continue  # Leave images we cannot decode untouched
+
+        buffer = io.BytesIO()
+        pixels.save(buffer, 'JPEG', quality=image_quality, optimize=True)
+        if buffer.tell() < len(image._data):
+            image._data = buffer.getvalue()
+            image.decoded_self = None
+            image[NameObject('/Filter')] = NameObject('/DCTDecode')
+            if '/DecodeParms' in image:
+                del image['/DecodeParms']
@@ -1,28 +1,348 @@
 import os
+import queue
+import tempfile
+import time
+from collections import defaultdict
+from functools import lru_cache
+from billiard.einfo import ExceptionWithTraceback
+from billiard.pool import Pool
 from PyPDF2 import PdfMerger
-from typing import List
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from werkzeug.utils import secure_filename
+from app.config.config import BaseConfig
+from app.services import pdf_page_ops
+from app.services.pdf_encryptor import PdfEncryptor
+from app.services.pdf_splitter import PdfSplitter
+from app.services.pdf_stream_merger import StreamingPdfMerger
+from app.utils.instrumentation import timed_stage
+
+# Pipeline steps run over the assembled output file, in order, after the page steps
+DOCUMENT_STEPS = ('linearize',)
+
+# Called with (pages_done, total_pages) as page ranges finish
+ProgressCallback = Callable[[int, int], None]
+
+@lru_cache(maxsize=None)
+def get_page_pool() -> Pool:
+    """
+    Process pool for page-range work, started once per (worker) process and
+    reused by every job instead of forking fresh processes per task.
+
+    billiard's pool, not concurrent.futures: Celery's prefork children are
+    daemonic, and multiprocessing refuses to start processes from those.
+    A pool process that dies (e.g. OOM) is replaced; its call fails with
+    WorkerLostError.
+    """
+    return Pool(processes=BaseConfig.PDF_WORKERS or os.cpu_count() or 1)
+
+def shutdown_page_pool() -> None:
+    if get_page_pool.cache_info().currsize:
+        get_page_pool().terminate()
+    get_page_pool.cache_clear()
+
+def run_in_page_pool(calls: Iterable[Tuple[Callable, tuple]]) -> Iterator[Tuple[int, object]]:
+    """
+    Run (function, args) calls in the page pool and yield (index, result)
+    for each as it finishes. A call's exception is raised as it was raised.
+    """
+    pool = get_page_pool()
+    finished = queue.Queue()
+    results = [
+        pool.apply_async(function, args,
+                         callback=lambda _, i=i: finished.put(i),
+                         error_callback=lambda _, i=i: finished.put(i))
+        for i, (function, args) in enumerate(calls)
+    ]
+    for _ in results:
+        i = finished.get()
+        try:
+            yield i, results[i].get()
+        except ExceptionWithTraceback as e:
+            # How billiard reports a call whose pool process was lost
+            raise e.exc from None
 
 class PdfService:
     @staticmethod
-    def merge_pdfs(pdf_files: List[str], output_filename: str) -> str:
+    @timed_stage('pdf.merge_pdfs')
+    def merge_pdfs(pdf_files: List[str], output_filename: str, streaming: bool = True) -> str:
         """
-        Merge multiple PDF files into one
+        Merge multiple PDF files into one.
+
+        The streaming merger keeps memory bounded by the largest input;
+        pass streaming=False to use PyPDF2's PdfMerger instead.
         """
+        output_path = f"storage/{secure_filename(output_filename)}"
+        if streaming:
+            return PdfService._merge_streaming(pdf_files, output_path)
+
         merger = PdfMerger()
-        
+
         try:
             # Add each PDF to the merger
             for pdf_file in pdf_files:
                 merger.append(pdf_file)
-            
+
             # Write the merged PDF
-            output_path = f"storage/{secure_filename(output_filename)}"
             with open(output_path, "wb") as output_file:
                 merger.write(output_file)
-            
+
             return output_path
         except Exception as e:
             raise Exception(f"Failed to merge PDFs: {str(e)}")
         finally:
-            merger.close() 
\ No newline at end of file
+            merger.close()
+
+    @staticmethod
+    def _merge_streaming(pdf_files: List[str], output_path: str) -> str:
+        try:
+            with open(output_path, "wb") as output_file:
+                merger = StreamingPdfMerger(output_file)
+                for pdf_file in pdf_files:
+                    merger.append(pdf_file)
+                merger.close()
+            return output_path
+        except Exception as e:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise Exception(f"Failed to merge PDFs: {str(e)}")
+
+    @staticmethod
+    @timed_stage('pdf.linearize')
+    def linearize(pdf_path: str) -> str:
+        """
+        Rewrite a PDF in place as linearized ("fast web view"), so viewers
+        can show the first page before the rest has downloaded.
+        """
+        # Only needed for linearized output
+        import pikepdf
+
+        tmp_path = f"{pdf_path}.linearized"
+        try:
+            with pikepdf.open(pdf_path) as pdf:
+                pdf.save(tmp_path, linearize=True)
+            os.replace(tmp_path, pdf_path)
+            return pdf_path
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise Exception(f"Failed to linearize PDF: {str(e)}")
+
+    @staticmethod
+    @timed_stage('pdf.encrypt_pdf')
+    def encrypt_pdf(source_path: str, output_filename: str, password: str,
+                    owner_password: Optional[str] = None) -> str:
+        """
+        Password-protect a PDF with the standard security handler, AES-256
+        (revision 6), streaming it object by object (PdfEncryptor).
+        Without owner_password, the user password is the owner password too.
+        """
+        output_path = f"storage/{secure_filename(output_filename)}"
+        try:
+            with open(output_path, "wb") as output:
+                PdfEncryptor(password, owner_password or password).encrypt(source_path, output)
+            return output_path
+        except Exception as e:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise Exception(f"Failed to encrypt PDF: {str(e)}")
+
+    @staticmethod
+    @timed_stage('pdf.decrypt_pdf')
+    def decrypt_pdf(source_path: str, output_filename: str, password: str = '') -> str:
+        """
+        Remove the password protection of a PDF, given its user or owner
+        password. qpdf reads objects from the file as it writes them.
+        """
+        import pikepdf
+
+        output_path = f"storage/{secure_filename(output_filename)}"
+        try:
+            with pikepdf.open(source_path, password=password) as pdf:
+                pdf.save(output_path, encryption=False, compress_streams=False)
+            return output_path
+        except pikepdf.PasswordError:
+            raise Exception('Failed to decrypt PDF: wrong password')
+        except Exception as e:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise Exception(f"Failed to decrypt PDF: {str(e)}")
+
+    @staticmethod
+    @timed_stage('pdf.compress_pdf')
+    def compress_pdf(source_path: str, output_filename: str, image_quality: int = 75,
+                     progress: Optional[ProgressCallback] = None) -> str:
+        """
+        Compress a PDF page-parallel: images are recompressed as JPEG and
+        content streams deflated per page range in a process pool, then the
+        parts are reassembled with identical streams stored once.
+        """
+        total = pdf_page_ops.page_count(source_path)
+        return PdfService._run_page_ranges(
+            pdf_page_ops.compress_page_range, source_path, total, output_filename,
+            (image_quality,), progress
+        )
+
+    @staticmethod
+    @timed_stage('pdf.convert_to_pdf')
+    def convert_to_pdf(source_path: str, output_filename: str,
+                       progress: Optional[ProgressCallback] = None) -> str:
+        """Convert an image (every frame of a multi-page TIFF/GIF) to PDF, frames in parallel."""
+        try:
+            total = pdf_page_ops.frame_count(source_path)
+        except Exception as e:
+            raise Exception(f"Unsupported file for conversion: {str(e)}")
+        return PdfService._run_page_ranges(
+            pdf_page_ops.convert_frame_range, source_path, total, output_filename,
+            (), progress
+        )
+
+    @staticmethod
+    @timed_stage('pdf.ocr_pdf')
+    def ocr_pdf(source_path: str, output_filename: str, language: str = BaseConfig.OCR_LANGUAGE,
+                progress: Optional[ProgressCallback] = None, cache=None) -> str:
+        """
+        Make scanned pages searchable: each page's scan image is OCRed with
+        Tesseract in the page pool and the words laid over it as invisible
+        text. With cache (an OcrCache), pages whose image was OCRed before
+        reuse that result, and new results are added to it.
+        """
+        output_path = f"storage/{secure_filename(output_filename)}"
+        total = pdf_page_ops.page_count(source_path)
+        range_size = BaseConfig.OCR_PAGE_RANGE_SIZE
+        ranges = [(start, min(start + range_size, total)) for start in range(0, total, range_size)]
+
+        with tempfile.TemporaryDirectory() as part_dir:
+            part_paths = [os.path.join(part_dir, f"part_{i}.pdf") for i in range(len(ranges))]
+            done = 0
+            # Keys first, so the whole document needs one cache lookup
+            part_keys = dict(run_in_page_pool(
+                (pdf_page_ops.ocr_page_keys, (source_path, start, end)) for start, end in ranges
+            ))
+            keys = [key for i in range(len(ranges)) for key in part_keys[i]]
+            cached = cache.get_many((key for key in keys if key), language) if cache else {}
+            calls = [
+                (pdf_page_ops.ocr_page_range, (
+                    source_path, start, end, part_path, language,
+                    {index: cached[keys[index]] for index in range(start, end) if keys[index] in cached}
+                ))
+                for (start, end), part_path in zip(ranges, part_paths)
+            ]
+            for _, (pages, recognized) in run_in_page_pool(calls):
+                if cache:
+                    cache.put_many(recognized, language)
+                done += pages
+                if progress:
+                    progress(done, total)
+            return PdfService._merge_streaming(part_paths, output_path)
+
+    @staticmethod
+    @timed_stage('pdf.split_pdf')
+    def split_pdf(source_path: str, index: dict, parts: List[List[int]], output_prefix: str,
+                  progress: Optional[ProgressCallback] = None) -> List[str]:
+        """
+        Write each part (a list of 1-based page numbers) of a PDF to its own
+        file in storage/, by byte copy from the source's page-offset index
+        (PdfSplitter). Returns the output paths, in the order of parts.
+        """
+        output_paths = []
+        total = sum(len(numbers) for numbers in parts)
+        done = 0
+        try:
+            with PdfSplitter(source_path, index) as splitter:
+                for i, numbers in enumerate(parts):
+                    output_paths.append(f"storage/{secure_filename(f'{output_prefix}_{i}.pdf')}")
+                    splitter.write(numbers, output_paths[-1])
+                    done += len(numbers)
+                    if progress:
+                        progress(done, total)
+            return output_paths
+        except Exception as e:
+            for path in output_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise Exception(f"Failed to split PDF: {str(e)}")
+
+    @staticmethod
+    @timed_stage('pdf.run_pipeline')
+    def run_pipeline(source_paths: List[str], page_steps: List[dict], document_steps: List[dict],
+                     output_filename: str, images: bool = False,
+                     progress: Optional[ProgressCallback] = None) -> Tuple[str, Dict[str, float]]:
+        """
+        Run several operations as one job: the pages of all sources (image
+        frames if images) go through every page step in memory, page ranges
+        in parallel, then the parts are assembled once and the document steps
+        run on the result. Only the final output is written to storage/.
+        Returns the output path and seconds per step; page-step times are
+        summed over the pool processes.
+        """
+        output_path = f"storage/{secure_filename(output_filename)}"
+        started = time.perf_counter()
+        counts = [
+            pdf_page_ops.frame_count(path) if images else pdf_page_ops.page_count(path)
+            for path in source_paths
+        ]
+        kind = 'image' if images else 'pdf'
+        # The pages of all sources in order, cut into ranges that may span sources
+        pages = [(path, index) for path, count in zip(source_paths, counts) for index in range(count)]
+        total = len(pages)
+        range_size = BaseConfig.PDF_PAGE_RANGE_SIZE
+        ranges = []
+        for start in range(0, total, range_size):
+            segments = []
+            for path, index in pages[start:start + range_size]:
+                if segments and segments[-1][0] == path:
+                    segments[-1][3] = index + 1
+                else:
+                    segments.append([path, kind, index, index + 1])
+            ranges.append([tuple(segment) for segment in segments])
+        timings: Dict[str, float] = defaultdict(float)
+        timings['open'] = time.perf_counter() - started
+
+        with tempfile.TemporaryDirectory() as part_dir:
+            part_paths = [os.path.join(part_dir, f"part_{i}.pdf") for i in range(len(ranges))]
+            done = 0
+            started = time.perf_counter()
+            calls = [
+                (pdf_page_ops.run_pipeline_range, (segments, part_path, page_steps))
+                for segments, part_path in zip(ranges, part_paths)
+            ]
+            for _, (pages_done, part_timings) in run_in_page_pool(calls):
+                for name, seconds in part_timings.items():
+                    timings[name] += seconds
+                done += pages_done
+                if progress:
+                    progress(done, total)
+            timings['pages_wall'] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            PdfService._merge_streaming(part_paths, output_path)
+            timings['assemble'] = time.perf_counter() - started
+
+        for step in document_steps:
+            if step['operation'] not in DOCUMENT_STEPS:
+                raise ValueError(f"Unknown document step: {step['operation']}")
+            started = time.perf_counter()
+            getattr(PdfService, step['operation'])(output_path, **step.get('params', {}))
+            timings[step['operation']] += time.perf_counter() - started
+        return output_path, dict(timings)
+
+    @staticmethod
+    def _run_page_ranges(worker: Callable, source_path: str, total: int, output_filename: str,
+                         worker_args: tuple, progress: Optional[ProgressCallback]) -> str:
+        """Fan page ranges of source_path out to a process pool and merge the parts in order."""
+        output_path = f"storage/{secure_filename(output_filename)}"
+        range_size = BaseConfig.PDF_PAGE_RANGE_SIZE
+        ranges = [(start, min(start + range_size, total)) for start in range(0, total, range_size)]
+
+        with tempfile.TemporaryDirectory() as part_dir:
+            part_paths = [os.path.join(part_dir, f"part_{i}.pdf") for i in range(len(ranges))]
+            done = 0
+            calls = [
+                (worker, (source_path, start, end, part_path) + worker_args)
+                for (start, end), part_path in zip(ranges, part_paths)
+            ]
+            for _, pages in run_in_page_pool(calls):
+                done += pages
+                if progress:
+                    progress(done, total)
+            return PdfService._merge_streaming(part_paths, output_path)
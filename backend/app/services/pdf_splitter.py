@@ -0,0 +1,120 @@
+import mmap
+import re
+from typing import Dict, List, Optional, Tuple
+
+PAGE_RANGE_PATTERN = re.compile(r'^\s*(\d+)?\s*(-)?\s*(\d+)?\s*$')
+
+def parse_page_ranges(spec: str, count: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    Parse a page selection such as '1-3,7,10-' into 1-based inclusive
+    (first, last) ranges. Without count only the syntax is checked and an
+    open end is returned as None; with it, ranges must lie within the document.
+    """
+    if not isinstance(spec, str) or not spec.strip():
+        raise ValueError('Page ranges must be a non-empty string such as 1-3,7,10-')
+    ranges = []
+    for item in spec.split(','):
+        match = PAGE_RANGE_PATTERN.match(item)
+        if not match or not (match.group(1) or match.group(3)) or (match.group(3) and not match.group(2)):
+            raise ValueError(f"Invalid page range: {item.strip()!r}")
+        first = int(match.group(1) or 1)
+        last = first if not match.group(2) else (int(match.group(3)) if match.group(3) else count)
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f"Invalid page range: {item.strip()!r}")
+        if count is not None and last > count:
+            raise ValueError(f"Page range {item.strip()} is past the last page ({count})")
+        ranges.append((first, last))
+    return ranges
+
+class PdfSplitter:
+    """
+    Writes page subsets of a PDF without parsing it, from its page-offset
+    index (PageIndexService.scan): each part is the byte spans of only the
+    objects its pages reach, copied from a memory map of the source, plus a
+    new page tree and catalog. Objects keep their numbers and the xref lists
+    just the ones copied, so nothing is rewritten; memory is bounded by the
+    index, not the file. Parts with pages the index could not map (object
+    streams, encryption) are written with PyPDF2 from one shared reader.
+    """
+
+    HEADER = b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n"
+
+    def __init__(self, pdf_path: str, index: dict):
+        self.pdf_path = pdf_path
+        self.index = index
+        self._file = open(pdf_path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._reader = None
+
+    def __enter__(self) -> 'PdfSplitter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._reader = None
+        self._data.close()
+        self._file.close()
+
+    def write(self, numbers: List[int], output_path: str) -> None:
+        """Write the pages numbered numbers (1-based, in that order) to output_path."""
+        entries = [self.index['pages'][number - 1] for number in numbers]
+        if any(entry.get('fallback') for entry in entries):
+            self._write_parsed(numbers, output_path)
+            return
+
+        xref: Dict[int, tuple] = {}
+        with open(output_path, 'wb') as output, memoryview(self._data) as data:
+            output.write(self.HEADER)
+            for entry in entries:
+                for num, gen, start, length in entry['objects']:
+                    if num not in xref:
+                        xref[num] = (output.tell(), gen)
+                        output.write(data[start:start + length])
+                        output.write(b"\n")
+
+            # New pages, page tree and catalog numbered after the copied objects
+            first_page = max(xref, default=0) + 1
+            pages_num = first_page + len(entries)
+            catalog_num = pages_num + 1
+            bodies = [
+                b"<< /Parent %d 0 R " % pages_num + entry['page'].encode('latin-1')[2:]
+                for entry in entries
+            ]
+            bodies.append(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+                b" ".join(b"%d 0 R" % (first_page + i) for i in range(len(entries))), len(entries)
+            ))
+            bodies.append(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_num)
+            for num, body in enumerate(bodies, first_page):
+                xref[num] = (output.tell(), 0)
+                output.write(b"%d 0 obj\n" % num + body + b"\nendobj\n")
+            self._write_xref(output, xref, catalog_num)
+
+    @staticmethod
+    def _write_xref(output, xref: Dict[int, tuple], root: int) -> None:
+        """An xref table with one subsection per run of consecutive object numbers."""
+        offset = output.tell()
+        output.write(b"xref\n0 1\n0000000000 65535 f \n")
+        nums = sorted(xref)
+        start = 0
+        for i in range(1, len(nums) + 1):
+            if i == len(nums) or nums[i] != nums[i - 1] + 1:
+                output.write(b"%d %d\n" % (nums[start], i - start))
+                output.writelines(b"%010d %05d n \n" % xref[num] for num in nums[start:i])
+                start = i
+        output.write(
+            b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (nums[-1] + 1, root, offset)
+        )
+
+    def _write_parsed(self, numbers: List[int], output_path: str) -> None:
+        from PyPDF2 import PdfReader, PdfWriter
+
+        if self._reader is None:
+            self._reader = PdfReader(self.pdf_path)
+        writer = PdfWriter()
+        for number in numbers:
+            writer.add_page(self._reader.pages[number - 1])
+        with open(output_path, 'wb') as output:
+            writer.write(output)
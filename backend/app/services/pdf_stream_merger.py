@@ -0,0 +1,282 @@
+import gc
+import hashlib
+import io
+from typing import BinaryIO, Dict, List, Optional, Set, Tuple
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+    TextStringObject,
+)
+
+
+class StreamingPdfMerger:
+    """
+    Merge PDFs by writing objects to the output as soon as they are copied.
+
+    Only one input is parsed at a time. Pages and everything they reference
+    (fonts, images, XObjects, annotations) are serialized straight to the
+    output file, so peak memory depends on the largest single input rather
+    than on the number of inputs. Identical streams are written once and
+    shared across inputs.
+
+    Bookmarks, form fields and named destinations of every input are
+    carried over to the output catalog. Only the top-level bookmarks and the
+    destination names are held until close().
+    """
+
+    HEADER = b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n"
+
+    def __init__(self, output: BinaryIO):
+        self.output = output
+        self.offsets: List[Optional[int]] = [None]
+        self.page_refs: List[int] = []
+        self.stream_digests: Dict[bytes, int] = {}
+        # Top-level bookmarks as (number, clone), chained when closing
+        self.outline_items: List[Tuple[int, DictionaryObject]] = []
+        self.outline_count = 0
+        self.fields: List[int] = []
+        self.form_defaults = DictionaryObject()
+        self.dests: Dict[str, object] = {}
+        self.pages_ref = self._reserve()
+        self.catalog_ref = self._reserve()
+        self.outlines_ref: Optional[int] = None
+        self.output.write(self.HEADER)
+
+    def append(self, pdf_file: str) -> None:
+        """Copy every page of pdf_file into the output."""
+        # Read from the open file rather than a path so PyPDF2 does not
+        # buffer the whole input in memory
+        with open(pdf_file, 'rb') as stream:
+            self._append_reader(PdfReader(stream), pdf_file)
+        # PdfReader holds reference cycles; free it before the next input
+        gc.collect()
+
+    def _append_reader(self, reader: PdfReader, pdf_file: str) -> None:
+        if reader.is_encrypted:
+            raise ValueError(f"Cannot merge encrypted PDF: {pdf_file}")
+
+        # Per-input state, dropped together with the reader
+        self._copied: Dict[int, int] = {}
+        self._pending: Dict[int, int] = {}
+        self._in_progress: Set[int] = set()
+        self._page_numbers: Dict[int, int] = {}
+
+        pages = list(reader.pages)
+        for page in pages:
+            number = self._reserve()
+            self._page_numbers[page.indirect_reference.idnum] = number
+            self.page_refs.append(number)
+
+        for page in pages:
+            number = self._page_numbers[page.indirect_reference.idnum]
+            clone = DictionaryObject()
+            for key, value in page.items():
+                if key == '/Parent':
+                    clone[key] = IndirectObject(self.pages_ref, 0, None)
+                else:
+                    clone[key] = self._remap(value)
+            self._write_object(number, self._serialize(clone))
+
+        # Widgets and bookmark targets were copied with the pages, so the
+        # catalog entries below resolve to the same output objects
+        root = reader.trailer['/Root']
+        self._collect_dests(root)
+        self._collect_fields(root)
+        self._collect_outline(root)
+
+        del self._copied, self._pending, self._in_progress, self._page_numbers
+
+    def close(self) -> None:
+        """Write the page tree, catalog, xref table and trailer."""
+        pages = DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): ArrayObject(
+                IndirectObject(number, 0, None) for number in self.page_refs
+            ),
+            NameObject('/Count'): NumberObject(len(self.page_refs)),
+        })
+        self._write_object(self.pages_ref, self._serialize(pages))
+
+        catalog = DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): IndirectObject(self.pages_ref, 0, None),
+        })
+        if self.outline_items:
+            self._write_outline()
+            catalog[NameObject('/Outlines')] = IndirectObject(self.outlines_ref, 0, None)
+        if self.fields:
+            form = DictionaryObject(self.form_defaults)
+            form[NameObject('/Fields')] = ArrayObject(
+                IndirectObject(number, 0, None) for number in self.fields
+            )
+            catalog[NameObject('/AcroForm')] = form
+        if self.dests:
+            # Name tree leaves must be sorted by key
+            names = ArrayObject()
+            for name in sorted(self.dests):
+                names.extend([TextStringObject(name), self.dests[name]])
+            catalog[NameObject('/Names')] = DictionaryObject({
+                NameObject('/Dests'): DictionaryObject({NameObject('/Names'): names}),
+            })
+        self._write_object(self.catalog_ref, self._serialize(catalog))
+
+        xref_offset = self.output.tell()
+        self.output.write(f"xref\n0 {len(self.offsets)}\n".encode())
+        self.output.write(b"0000000000 65535 f \n")
+        for offset in self.offsets[1:]:
+            self.output.write(f"{offset:010d} 00000 n \n".encode())
+        self.output.write(
+            f"trailer\n<< /Size {len(self.offsets)} /Root {self.catalog_ref} 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n".encode()
+        )
+
+    def _collect_dests(self, root: DictionaryObject) -> None:
+        """Add the input's named destinations; the first input to use a name keeps it."""
+        dests = []
+        if '/Dests' in root:
+            # PDF 1.1 style dictionary of names
+            dests.extend(root['/Dests'].get_object().items())
+        names = root['/Names'] if '/Names' in root else {}
+        nodes = [names['/Dests']] if '/Dests' in names else []
+        while nodes:
+            node = nodes.pop().get_object()
+            if '/Kids' in node:
+                nodes.extend(node['/Kids'])
+            leaves = node['/Names'] if '/Names' in node else []
+            dests.extend(zip(leaves[::2], leaves[1::2]))
+        for name, dest in dests:
+            name = str(name).lstrip('/') if isinstance(name, NameObject) else str(name)
+            if name not in self.dests:
+                self.dests[name] = self._remap(dest)
+
+    def _collect_fields(self, root: DictionaryObject) -> None:
+        """Add the input's top-level form fields."""
+        if '/AcroForm' not in root:
+            return
+        form = root['/AcroForm']
+        if '/Fields' in form:
+            self.fields.extend(self._copy(ref) for ref in form['/Fields'])
+        for key in ('/NeedAppearances', '/DA', '/DR', '/SigFlags', '/Q'):
+            if key in form and key not in self.form_defaults:
+                self.form_defaults[NameObject(key)] = self._remap(form.raw_get(key))
+
+    def _collect_outline(self, root: DictionaryObject) -> None:
+        """Copy the input's bookmarks below the output outline root."""
+        if '/Outlines' not in root or '/First' not in root['/Outlines']:
+            return
+        if self.outlines_ref is None:
+            self.outlines_ref = self._reserve()
+        # References to the input's root now point at the output's
+        if isinstance(root.raw_get('/Outlines'), IndirectObject):
+            self._copied[root.raw_get('/Outlines').idnum] = self.outlines_ref
+        ref = root['/Outlines'].raw_get('/First')
+        while ref is not None:
+            item = ref.get_object()
+            # Written in close(), once the neighbours in other inputs are known
+            number = self._reserve()
+            self._copied[ref.idnum] = number
+            clone = DictionaryObject()
+            for key, value in item.items():
+                if key not in ('/Parent', '/Prev', '/Next'):
+                    clone[key] = self._remap(item.raw_get(key))
+            self.outline_items.append((number, clone))
+            # Each item counts, plus its descendants when it is open
+            self.outline_count += 1 + max(0, int(item['/Count']) if '/Count' in item else 0)
+            ref = item.raw_get('/Next') if '/Next' in item else None
+
+    def _write_outline(self) -> None:
+        numbers = [number for number, _ in self.outline_items]
+        for index, (number, clone) in enumerate(self.outline_items):
+            clone[NameObject('/Parent')] = IndirectObject(self.outlines_ref, 0, None)
+            if index > 0:
+                clone[NameObject('/Prev')] = IndirectObject(numbers[index - 1], 0, None)
+            if index < len(numbers) - 1:
+                clone[NameObject('/Next')] = IndirectObject(numbers[index + 1], 0, None)
+            self._write_object(number, self._serialize(clone))
+        outlines = DictionaryObject({
+            NameObject('/Type'): NameObject('/Outlines'),
+            NameObject('/First'): IndirectObject(numbers[0], 0, None),
+            NameObject('/Last'): IndirectObject(numbers[-1], 0, None),
+            NameObject('/Count'): NumberObject(self.outline_count),
+        })
+        self._write_object(self.outlines_ref, self._serialize(outlines))
+
+    def _reserve(self) -> int:
+        self.offsets.append(None)
+        return len(self.offsets) - 1
+
+    def _write_object(self, number: int, data: bytes) -> None:
+        self.offsets[number] = self.output.tell()
+        self.output.write(f"{number} 0 obj\n".encode())
+        self.output.write(data)
+        self.output.write(b"\nendobj\n")
+
+    @staticmethod
+    def _serialize(obj) -> bytes:
+        buffer = io.BytesIO()
+        obj.write_to_stream(buffer, None)
+        return buffer.getvalue()
+
+    def _remap(self, value):
+        """Return value with every indirect reference pointing into the output."""
+        if isinstance(value, IndirectObject):
+            return IndirectObject(self._copy(value), 0, None)
+        if isinstance(value, DictionaryObject):
+            return DictionaryObject(
+                (key, self._remap(item)) for key, item in value.items()
+            )
+        if isinstance(value, ArrayObject):
+            return ArrayObject(self._remap(item) for item in value)
+        return value
+
+    def _copy(self, ref: IndirectObject) -> int:
+        """Copy the object behind ref (children first) and return its new number."""
+        key = ref.idnum
+        if key in self._page_numbers:
+            return self._page_numbers[key]
+        if key in self._copied:
+            return self._copied[key]
+        if key in self._in_progress:
+            # Reference cycle: fix the number now, write the object when done
+            if key not in self._pending:
+                self._pending[key] = self._reserve()
+            return self._pending[key]
+
+        obj = ref.get_object()
+        if isinstance(obj, DictionaryObject) and obj.get('/Type') == '/Pages':
+            # Page tree nodes of the input are replaced by the output tree
+            return self.pages_ref
+
+        self._in_progress.add(key)
+        if isinstance(obj, StreamObject):
+            clone = StreamObject()
+            for name, item in obj.items():
+                if name != '/Length':
+                    clone[name] = self._remap(item)
+            clone._data = obj._data
+        else:
+            clone = self._remap(obj)
+        self._in_progress.discard(key)
+
+        data = self._serialize(clone)
+        if key in self._pending:
+            number = self._pending.pop(key)
+        elif isinstance(obj, StreamObject):
+            digest = hashlib.sha256(data).digest()
+            if digest in self.stream_digests:
+                self._copied[key] = self.stream_digests[digest]
+                return self._copied[key]
+            number = self._reserve()
+            self.stream_digests[digest] = number
+        else:
+            number = self._reserve()
+
+        self._write_object(number, data)
+        self._copied[key] = number
+        return number
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import time
+from typing import List, Optional
+from app.config.config import BaseConfig
+from app.extensions import redis_client
+from app.models.blob import Blob
+from app.services.blob_service import BlobService
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ResultCache:
+    """
+    Operation results keyed by (operation, ordered input digests, params).
+
+    Entries live in Redis and point at an output blob; the cache holds one
+    reference on each blob it remembers, so cached outputs survive blob GC
+    until they are evicted. Eviction is least-recently-used and keeps the
+    total size of cached outputs under RESULT_CACHE_MAX_BYTES.
+    """
+
+    PREFIX = 'result_cache'
+
+    def __init__(self, blob_service: BlobService, redis=redis_client,
+                 max_bytes: int = BaseConfig.RESULT_CACHE_MAX_BYTES):
+        self.blob_service = blob_service
+        self.redis = redis
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def make_key(operation: str, input_digests: List[str], params: Optional[dict] = None) -> str:
+        payload = json.dumps([operation, input_digests, params or {}], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Blob]:
+        """
+        Return the cached output blob with a new reference taken for the
+        caller, or None on a miss.
+        """
+        blob_id = self.redis.hget(self._key('entry', key), 'blob_id')
+        blob = self.blob_service.acquire(blob_id.decode()) if blob_id else None
+        if blob is not None and not self.blob_service.storage_service.has_blob(blob.digest):
+            self.blob_service.release([blob.id])
+            blob = None
+        if blob is None:
+            if blob_id:
+                # The blob's row or file is gone; forget the entry rather than return it again
+                self._drop(key)
+            self.redis.incr(self._key('misses'))
+            return None
+        pipe = self.redis.pipeline()
+        pipe.zadd(self._key('lru'), {key: time.time()})
+        pipe.incr(self._key('hits'))
+        pipe.execute()
+        return blob
+
+    def put(self, key: str, blob: Blob) -> None:
+        """Remember blob as the result for key, then evict down to the size bound."""
+        if blob.size > self.max_bytes:
+            return
+        if not self.blob_service.acquire(blob.id):
+            return
+        # Claimed with HSETNX: of concurrent puts for one key, only the first keeps its reference
+        if not self.redis.hsetnx(self._key('entry', key), 'blob_id', blob.id):
+            self.blob_service.release([blob.id])
+            return
+        pipe = self.redis.pipeline()
+        pipe.hset(self._key('entry', key), 'size', blob.size)
+        pipe.zadd(self._key('lru'), {key: time.time()})
+        pipe.incrby(self._key('bytes'), blob.size)
+        pipe.execute()
+        self._evict()
+
+    def stats(self) -> dict:
+        hits, misses, evictions, size = self.redis.mget(
+            self._key('hits'), self._key('misses'), self._key('evictions'), self._key('bytes')
+        )
+        return {
+            'hits': int(hits or 0),
+            'misses': int(misses or 0),
+            'evictions': int(evictions or 0),
+            'entries': self.redis.zcard(self._key('lru')),
+            'bytes': int(size or 0),
+            'max_bytes': self.max_bytes
+        }
+
+    def _evict(self) -> None:
+        released = []
+        while int(self.redis.get(self._key('bytes')) or 0) > self.max_bytes:
+            oldest = self.redis.zpopmin(self._key('lru'))
+            if not oldest:
+                break
+            key = oldest[0][0].decode()
+            entry = self.redis.hgetall(self._key('entry', key))
+            pipe = self.redis.pipeline()
+            pipe.delete(self._key('entry', key))
+            pipe.decrby(self._key('bytes'), int(entry.get(b'size', 0)))
+            pipe.incr(self._key('evictions'))
+            pipe.execute()
+            if b'blob_id' in entry:
+                released.append(entry[b'blob_id'].decode())
+        if released:
+            logger.info(f"Result cache evicted {len(released)} entries")
+            self.blob_service.release(released)
+
+    def _drop(self, key: str) -> None:
+        """Remove one entry and the cache's reference on its blob, if still there."""
+        # Whoever removes the key from the LRU index does the rest, as in _evict
+        if not self.redis.zrem(self._key('lru'), key):
+            return
+        entry = self.redis.hgetall(self._key('entry', key))
+        pipe = self.redis.pipeline()
+        pipe.delete(self._key('entry', key))
+        pipe.decrby(self._key('bytes'), int(entry.get(b'size', 0)))
+        pipe.execute()
+        if b'blob_id' in entry:
+            self.blob_service.release([entry[b'blob_id'].decode()])
+
+    def _key(self, *parts: str) -> str:
+        return ':'.join((self.PREFIX,) + parts)
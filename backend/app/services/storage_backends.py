@@ -0,0 +1,371 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional
+
+from app.config.config import BaseConfig
+
+class StorageBackend:
+    """
+    Where stored files live. Keys are relative paths such as
+    'blobs/ab/cd/<sha256>'; callers never see backend-specific locations.
+    """
+
+    BLOCK_SIZE = 64 * 1024
+    # Limits on multipart objects: every part but the last is at least MIN_PART_SIZE
+    MIN_PART_SIZE = 1
+    MAX_PARTS = 10000
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def size(self, key: str) -> int:
+        raise NotImplementedError
+
+    def put_stream(self, key: str, stream: BinaryIO) -> None:
+        """Store the rest of stream under key."""
+        raise NotImplementedError
+
+    def put_file(self, key: str, file_path: str) -> None:
+        """Store a local file under key; the local file is consumed."""
+        raise NotImplementedError
+
+    def iter_range(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Yield the bytes of key from start up to and including end."""
+        raise NotImplementedError
+
+    @contextmanager
+    def local_path(self, key: str) -> Iterator[str]:
+        """Yield a local filesystem path holding the content of key."""
+        raise NotImplementedError
+
+    def open(self, key: str) -> BinaryIO:
+        """A seekable read-only file over key, read through ranged requests as it is used."""
+        return io.BufferedReader(RangeReader(self, key, self.size(key)), self.BLOCK_SIZE)
+
+    def copy(self, key: str, new_key: str) -> None:
+        """Store the content of key under new_key as well, without passing it through this process."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    # Multipart objects, for chunked uploads: any process can store a part,
+    # so the chunks of one upload may arrive at different API replicas
+
+    def start_parts(self, key: str) -> str:
+        """Begin a multipart object; returns the handle the other part calls take."""
+        raise NotImplementedError
+
+    def put_part(self, key: str, handle: str, number: int, file_path: str) -> str:
+        """
+        Store a local file as part number (from 1), replacing an earlier
+        one; returns the part's token for join_parts. The file is consumed.
+        """
+        raise NotImplementedError
+
+    def join_parts(self, key: str, handle: str, tokens: List[str]) -> str:
+        """
+        Store the parts, in order (their tokens from put_part), as key and
+        return the SHA-256 hex digest of the joined content.
+        """
+        raise NotImplementedError
+
+    def abort_parts(self, key: str, handle: str) -> None:
+        """Discard the parts of a multipart object that will not be joined, or the object they were joined into."""
+        raise NotImplementedError
+
+    def presigned_url(self, key: str, download_name: str, expires_in: int) -> Optional[str]:
+        """A time-limited URL clients can fetch key from directly, if the backend has one."""
+        return None
+
+class LocalStorageBackend(StorageBackend):
+    """Files on a local (or mounted) filesystem."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.root.mkdir(exist_ok=True)
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    def exists(self, key: str) -> bool:
+        return self.path(key).exists()
+
+    def size(self, key: str) -> int:
+        return self.path(key).stat().st_size
+
+    def put_stream(self, key: str, stream: BinaryIO) -> None:
+        # Write next to the target and rename so readers never see partial files
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.parent / f".{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                for block in iter(lambda: stream.read(self.BLOCK_SIZE), b''):
+                    f.write(block)
+            os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def put_file(self, key: str, file_path: str) -> None:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(file_path, path)
+
+    def iter_range(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        with open(self.path(key), 'rb') as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                block = f.read(self.BLOCK_SIZE if remaining is None else min(self.BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                if remaining is not None:
+                    remaining -= len(block)
+                yield block
+
+    @contextmanager
+    def local_path(self, key: str) -> Iterator[str]:
+        yield str(self.path(key))
+
+    def copy(self, key: str, new_key: str) -> None:
+        # A second link to the same file: nothing is copied
+        path = self.path(new_key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.parent / f".{uuid.uuid4().hex}.tmp"
+        os.link(self.path(key), tmp_path)
+        os.replace(tmp_path, path)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def _parts_dir(self, key: str) -> Path:
+        return self.root / f"{key}.parts"
+
+    def start_parts(self, key: str) -> str:
+        self._parts_dir(key).mkdir(parents=True, exist_ok=True)
+        return ''
+
+    def put_part(self, key: str, handle: str, number: int, file_path: str) -> str:
+        os.replace(file_path, self._parts_dir(key) / str(number))
+        return str(number)
+
+    def join_parts(self, key: str, handle: str, tokens: List[str]) -> str:
+        # The parts are hashed as they are joined, in the one pass over them
+        parts_dir = self._parts_dir(key)
+        tmp_path = parts_dir / 'joined'
+        digest = hashlib.sha256()
+        with open(tmp_path, 'wb') as output:
+            for token in tokens:
+                with open(parts_dir / token, 'rb') as part:
+                    for block in iter(lambda: part.read(self.BLOCK_SIZE), b''):
+                        digest.update(block)
+                        output.write(block)
+        os.replace(tmp_path, self.path(key))
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        return digest.hexdigest()
+
+    def abort_parts(self, key: str, handle: str) -> None:
+        shutil.rmtree(self._parts_dir(key), ignore_errors=True)
+        self.delete(key)
+
+class S3StorageBackend(StorageBackend):
+    """
+    An S3-compatible bucket (AWS S3, or MinIO via endpoint_url).
+
+    One client per process keeps a pool of HTTP connections; large uploads
+    and downloads are split into parts transferred concurrently.
+    """
+
+    MIN_PART_SIZE = 5 * 1024 * 1024
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, region: Optional[str] = None,
+                 access_key: Optional[str] = None, secret_key: Optional[str] = None,
+                 max_pool_connections: int = 32, part_size: int = 8 * 1024 * 1024,
+                 max_concurrency: int = 8):
+        # boto3 takes ~0.1s to import; only processes using S3 pay for it
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config as BotoConfig
+
+        self.bucket = bucket
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            config=BotoConfig(
+                max_pool_connections=max_pool_connections,
+                retries={'max_attempts': 5, 'mode': 'adaptive'}
+            )
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=max_concurrency,
+            use_threads=True
+        )
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def size(self, key: str) -> int:
+        return self.client.head_object(Bucket=self.bucket, Key=key)['ContentLength']
+
+    def put_stream(self, key: str, stream: BinaryIO) -> None:
+        self.client.upload_fileobj(stream, self.bucket, key, Config=self.transfer_config)
+
+    def put_file(self, key: str, file_path: str) -> None:
+        self.client.upload_file(file_path, self.bucket, key, Config=self.transfer_config)
+        os.remove(file_path)
+
+    def iter_range(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        response = self.client.get_object(Bucket=self.bucket, Key=key, Range=byte_range)
+        body = response['Body']
+        try:
+            yield from body.iter_chunks(self.BLOCK_SIZE)
+        finally:
+            body.close()
+
+    @contextmanager
+    def local_path(self, key: str) -> Iterator[str]:
+        # Parts are fetched with concurrent ranged GETs into worker-local scratch
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(key)[1] or '.bin')
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, key, path, Config=self.transfer_config)
+            yield path
+        finally:
+            os.remove(path)
+
+    def copy(self, key: str, new_key: str) -> None:
+        # Server-side; large objects are copied in parts (UploadPartCopy)
+        self.client.copy({'Bucket': self.bucket, 'Key': key}, self.bucket, new_key, Config=self.transfer_config)
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def start_parts(self, key: str) -> str:
+        return self.client.create_multipart_upload(Bucket=self.bucket, Key=key)['UploadId']
+
+    def put_part(self, key: str, handle: str, number: int, file_path: str) -> str:
+        # Parts live in the bucket, not on the replica that received them
+        try:
+            with open(file_path, 'rb') as f:
+                response = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=handle,
+                                                   PartNumber=number, Body=f)
+        finally:
+            os.remove(file_path)
+        return response['ETag']
+
+    def join_parts(self, key: str, handle: str, tokens: List[str]) -> str:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=handle,
+                MultipartUpload={'Parts': [{'ETag': token, 'PartNumber': i + 1} for i, token in enumerate(tokens)]}
+            )
+        except ClientError as e:
+            # Joined by an earlier attempt that failed afterwards
+            if e.response['Error']['Code'] != 'NoSuchUpload' or not self.exists(key):
+                raise
+        # S3 only has checksums of the parts: the content is hashed as it
+        # streams past, and nothing is written locally
+        digest = hashlib.sha256()
+        for block in self.iter_range(key):
+            digest.update(block)
+        return digest.hexdigest()
+
+    def abort_parts(self, key: str, handle: str) -> None:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=handle)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchUpload':
+                raise
+        self.delete(key)
+
+    def presigned_url(self, key: str, download_name: str, expires_in: int) -> Optional[str]:
+        # Signed locally; no request is made to the object store
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={
+                'Bucket': self.bucket,
+                'Key': key,
+                'ResponseContentDisposition': f'attachment; filename="{download_name}"'
+            },
+            ExpiresIn=expires_in
+        )
+
+class RangeReader(io.RawIOBase):
+    """Seekable raw file over a stored object; every read is one ranged request."""
+
+    def __init__(self, backend: StorageBackend, key: str, size: int):
+        self.backend = backend
+        self.key = key
+        self.length = size
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.length}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        end = min(self.position + len(buffer), self.length)
+        if end <= self.position:
+            return 0
+        offset = 0
+        for block in self.backend.iter_range(self.key, self.position, end - 1):
+            buffer[offset:offset + len(block)] = block
+            offset += len(block)
+        self.position += offset
+        return offset
+
+@lru_cache(maxsize=None)
+def get_storage_backend() -> StorageBackend:
+    """The configured backend, created once per process."""
+    if BaseConfig.STORAGE_BACKEND == 's3':
+        return S3StorageBackend(
+            BaseConfig.AWS_S3_BUCKET,
+            endpoint_url=BaseConfig.AWS_S3_ENDPOINT_URL,
+            region=BaseConfig.AWS_REGION,
+            access_key=BaseConfig.AWS_ACCESS_KEY_ID,
+            secret_key=BaseConfig.AWS_SECRET_ACCESS_KEY,
+            max_pool_connections=BaseConfig.S3_MAX_POOL_CONNECTIONS,
+            part_size=BaseConfig.S3_PART_SIZE,
+            max_concurrency=BaseConfig.S3_MAX_CONCURRENCY
+        )
+    return LocalStorageBackend(BaseConfig.UPLOAD_FOLDER)
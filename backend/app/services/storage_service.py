@@ -1,13 +1,35 @@
+import hashlib
 import os
+import tempfile
+from contextlib import ExitStack, contextmanager
+from functools import cached_property
 from pathlib import Path
 from werkzeug.utils import secure_filename
-from typing import BinaryIO, List
+from typing import BinaryIO, List, Optional, Tuple
+from app.services.storage_backends import StorageBackend, get_storage_backend
+from app.utils.instrumentation import timed, timed_stage
 
 class StorageService:
-    def __init__(self):
-        self.storage_path = Path('storage')
-        self.storage_path.mkdir(exist_ok=True)
+    BLOCK_SIZE = 64 * 1024
 
+    def __init__(self, backend: Optional[StorageBackend] = None):
+        # Nothing is created until first use, so building one at import is free
+        self._backend = backend
+
+    @property
+    def backend(self) -> StorageBackend:
+        if self._backend is None:
+            self._backend = get_storage_backend()
+        return self._backend
+
+    @cached_property
+    def storage_path(self) -> Path:
+        """Scratch space for uploads in progress and task outputs"""
+        path = Path('storage')
+        path.mkdir(exist_ok=True)
+        return path
+
+    @timed_stage('storage.upload')
     def upload_file(self, file: BinaryIO, filename: str) -> str:
         """Upload a file to local storage"""
         try:
@@ -18,6 +40,88 @@ class StorageService:
         except Exception as e:
             raise Exception(f"Failed to save file: {str(e)}")
 
+    @timed_stage('storage.spool_range')
+    def spool_range(self, stream: BinaryIO, length: int, checksum: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Copy exactly length bytes from stream into a new scratch file and
+        return its path and the SHA-256 hex digest of the bytes. With
+        checksum, the digest must match it, or nothing is kept.
+        """
+        digest = hashlib.sha256()
+        remaining = length
+        fd, path = tempfile.mkstemp(dir=self.storage_path, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while remaining:
+                    block = stream.read(min(self.BLOCK_SIZE, remaining))
+                    if not block:
+                        raise ValueError(f"Expected {length} bytes, got {length - remaining}")
+                    f.write(block)
+                    digest.update(block)
+                    remaining -= len(block)
+            if checksum and checksum.lower() != digest.hexdigest():
+                raise ValueError('Checksum mismatch')
+        except BaseException:
+            os.remove(path)
+            raise
+        return path, digest.hexdigest()
+
+    def hash_stream(self, stream: BinaryIO) -> Tuple[str, int]:
+        """Return the SHA-256 hex digest and size of a stream, read block by block"""
+        digest = hashlib.sha256()
+        size = 0
+        for block in iter(lambda: stream.read(self.BLOCK_SIZE), b''):
+            digest.update(block)
+            size += len(block)
+        return digest.hexdigest(), size
+
+    def blob_key(self, digest: str) -> str:
+        """Sharded key of a content-addressed blob: blobs/ab/cd/abcd..."""
+        return f"blobs/{digest[:2]}/{digest[2:4]}/{digest}"
+
+    def has_blob(self, digest: str) -> bool:
+        return self.backend.exists(self.blob_key(digest))
+
+    @timed_stage('storage.write_blob')
+    def write_blob(self, stream: BinaryIO, digest: str) -> str:
+        """Store a stream as a blob and return its key"""
+        key = self.blob_key(digest)
+        try:
+            self.backend.put_stream(key, stream)
+        except Exception as e:
+            raise Exception(f"Failed to save file: {str(e)}")
+        return key
+
+    @timed_stage('storage.move_to_blob')
+    def move_to_blob(self, file_path: str, digest: str) -> str:
+        """Store an already written local file as a blob, consuming it, and return its key"""
+        key = self.blob_key(digest)
+        self.backend.put_file(key, file_path)
+        return key
+
+    @timed_stage('storage.copy_to_blob')
+    def copy_to_blob(self, key: str, digest: str) -> str:
+        """Store an object already in the backend as a blob too, and return the blob's key"""
+        blob_key = self.blob_key(digest)
+        self.backend.copy(key, blob_key)
+        return blob_key
+
+    @timed_stage('storage.delete_blob')
+    def delete_blob(self, digest: str) -> None:
+        self.backend.delete(self.blob_key(digest))
+
+    @contextmanager
+    def local_path(self, key: str):
+        """
+        Context manager yielding a local path for a stored key; remote
+        objects are downloaded to worker-local scratch for the duration
+        """
+        with ExitStack() as stack:
+            # Only getting the file is timed, not what the caller does with it
+            with timed('storage.fetch'):
+                path = stack.enter_context(self.backend.local_path(key))
+            yield path
+
     def get_file_path(self, filename: str) -> str:
         """Get local file path"""
         return str(self.storage_path / secure_filename(filename))
@@ -0,0 +1,192 @@
+import json
+import logging
+import time
+import uuid
+from typing import List, Optional
+from werkzeug.utils import secure_filename
+from app.config.config import BaseConfig
+from app.extensions import redis_client
+from app.middleware.file_validation import allowed_file
+from app.services.storage_service import StorageService
+from app.utils.error_handling import NotFoundError, ValidationError
+
+logger = logging.getLogger(__name__)
+
+class UploadService:
+    """
+    Resumable chunked uploads.
+
+    A session fixes the file size and chunk size up front; every chunk is
+    stored as one part of a multipart object in the storage backend (an
+    S3 multipart upload), joined when the upload completes. Session
+    metadata and the received chunks' part tokens live in Redis, so any
+    API replica can accept any chunk without a shared disk. The joined
+    object is validated and adopted as a blob in the backend itself.
+
+    Sessions that are never completed expire; their parts are discarded
+    by abort_expired, which each new session runs a batch of.
+    """
+
+    SESSION_TTL = 24 * 60 * 60
+    # Sorted set of open sessions' partial files, scored by when they expire
+    EXPIRING_KEY = 'uploads:expiring'
+
+    def __init__(self, storage_service: StorageService, redis=redis_client):
+        self.storage_service = storage_service
+        self.redis = redis
+
+    def create_upload(self, filename: str, size: int, chunk_size: Optional[int] = None) -> dict:
+        """Start an upload session and its multipart object."""
+        if not filename or not allowed_file(filename):
+            raise ValidationError('Invalid file type. Only PDF files are allowed')
+        if size <= 0 or size > BaseConfig.MAX_UPLOAD_SIZE:
+            raise ValidationError(f'File size must be between 1 and {BaseConfig.MAX_UPLOAD_SIZE} bytes')
+        chunk_size = chunk_size or BaseConfig.UPLOAD_CHUNK_SIZE
+        backend = self.storage_service.backend
+        # Only a single chunk may be smaller than the backend's minimum part size
+        min_chunk_size = 1 if size <= chunk_size else backend.MIN_PART_SIZE
+        if chunk_size < min_chunk_size or chunk_size > BaseConfig.MAX_CONTENT_LENGTH:
+            raise ValidationError(
+                f'Chunk size must be between {min_chunk_size} and {BaseConfig.MAX_CONTENT_LENGTH} bytes'
+            )
+        if -(-size // chunk_size) > backend.MAX_PARTS:
+            raise ValidationError(f'At most {backend.MAX_PARTS} chunks per upload')
+
+        upload_id = str(uuid.uuid4())
+        key = f"uploads/{upload_id}"
+        session = {
+            'upload_id': upload_id,
+            'filename': secure_filename(filename),
+            'key': key,
+            'handle': backend.start_parts(key),
+            'size': size,
+            'chunk_size': chunk_size,
+            'total_chunks': -(-size // chunk_size),
+        }
+        self.abort_expired()
+        pipe = self.redis.pipeline()
+        pipe.set(self._key(upload_id), json.dumps(session), ex=self.SESSION_TTL)
+        pipe.zadd(self.EXPIRING_KEY, {self._staged(session): time.time() + self.SESSION_TTL})
+        pipe.execute()
+        return self._status(session)
+
+    def get_upload(self, upload_id: str) -> dict:
+        """Return the session with the byte ranges still missing."""
+        return self._status(self._session(upload_id))
+
+    def write_chunk(self, upload_id: str, offset: int, stream, length: Optional[int],
+                    checksum: Optional[str]) -> dict:
+        """
+        Store one chunk at offset, verifying its SHA-256 if given. A chunk
+        that fails verification leaves what was stored there before.
+        """
+        session = self._session(upload_id)
+        if offset % session['chunk_size'] or offset >= session['size']:
+            raise ValidationError(f"Offset must be a multiple of {session['chunk_size']} below {session['size']}")
+        expected = min(session['chunk_size'], session['size'] - offset)
+        if length is not None and length != expected:
+            raise ValidationError(f'Chunk at offset {offset} must be {expected} bytes')
+
+        try:
+            path, digest = self.storage_service.spool_range(stream, expected, checksum)
+        except ValueError as e:
+            raise ValidationError(f"{str(e)} for chunk at offset {offset}")
+        index = offset // session['chunk_size']
+        token = self.storage_service.backend.put_part(session['key'], session['handle'], index + 1, path)
+
+        parts_key = self._key(upload_id, 'parts')
+        pipe = self.redis.pipeline()
+        pipe.hset(parts_key, index, token)
+        pipe.expire(parts_key, self.SESSION_TTL)
+        pipe.expire(self._key(upload_id), self.SESSION_TTL)
+        pipe.zadd(self.EXPIRING_KEY, {self._staged(session): time.time() + self.SESSION_TTL})
+        pipe.execute()
+        return {'offset': offset, 'length': expected, 'sha256': digest}
+
+    def complete_upload(self, upload_id: str) -> dict:
+        """
+        Join the parts once every chunk has arrived and return the session
+        with the joined object's SHA-256 digest. The session (and object,
+        at session['key']) stay until close_upload, so a completion that
+        fails later on can be retried.
+        """
+        session = self._session(upload_id)
+        if 'digest' in session:
+            return session
+        tokens = self.redis.hgetall(self._key(upload_id, 'parts'))
+        if self._missing_ranges(session, {int(index) for index in tokens}):
+            raise ValidationError('Upload is incomplete')
+        session['digest'] = self.storage_service.backend.join_parts(
+            session['key'], session['handle'],
+            [tokens[str(index).encode()].decode() for index in range(session['total_chunks'])]
+        )
+        self.redis.set(self._key(upload_id), json.dumps(session), keepttl=True)
+        return session
+
+    def close_upload(self, upload_id: str) -> None:
+        """
+        Drop a session once its content is kept elsewhere (or rejected),
+        with its joined object. Best effort: what is left behind is removed
+        by abort_expired.
+        """
+        try:
+            session = self._session(upload_id)
+            pipe = self.redis.pipeline()
+            pipe.delete(self._key(upload_id), self._key(upload_id, 'parts'))
+            pipe.zrem(self.EXPIRING_KEY, self._staged(session))
+            pipe.execute()
+            self.storage_service.backend.abort_parts(session['key'], session['handle'])
+        except Exception as e:
+            logger.warning(f"Failed to close upload {upload_id}: {str(e)}")
+
+    def abort_expired(self, limit: int = 100) -> int:
+        """Discard the stored parts of up to limit expired sessions; return how many."""
+        aborted = 0
+        for member in self.redis.zrangebyscore(self.EXPIRING_KEY, '-inf', time.time(), start=0, num=limit):
+            # Whichever replica removes the entry discards the parts
+            if self.redis.zrem(self.EXPIRING_KEY, member):
+                staged = json.loads(member)
+                self.storage_service.backend.abort_parts(staged['key'], staged['handle'])
+                aborted += 1
+        return aborted
+
+    def _session(self, upload_id: str) -> dict:
+        raw = self.redis.get(self._key(upload_id))
+        if raw is None:
+            raise NotFoundError(f"Upload {upload_id} not found")
+        return json.loads(raw)
+
+    def _status(self, session: dict) -> dict:
+        received = {int(i) for i in self.redis.hkeys(self._key(session['upload_id'], 'parts'))}
+        return {
+            'upload_id': session['upload_id'],
+            'filename': session['filename'],
+            'size': session['size'],
+            'chunk_size': session['chunk_size'],
+            'missing': self._missing_ranges(session, received),
+        }
+
+    @staticmethod
+    def _missing_ranges(session: dict, received: set) -> List[dict]:
+        """Coalesce missing chunks into [offset, offset + length) ranges."""
+        ranges = []
+        for index in range(session['total_chunks']):
+            if index in received:
+                continue
+            offset = index * session['chunk_size']
+            length = min(session['chunk_size'], session['size'] - offset)
+            if ranges and ranges[-1]['offset'] + ranges[-1]['length'] == offset:
+                ranges[-1]['length'] += length
+            else:
+                ranges.append({'offset': offset, 'length': length})
+        return ranges
+
+    @staticmethod
+    def _staged(session: dict) -> str:
+        """A session's entry in EXPIRING_KEY: what is needed to clean up after it."""
+        return json.dumps({'upload_id': session['upload_id'], 'key': session['key'], 'handle': session['handle']},
+                          sort_keys=True)
+
+    @staticmethod
+    def _key(upload_id: str, suffix: str = '') -> str:
+        return f"upload:{upload_id}:{suffix}" if suffix else f"upload:{upload_id}"
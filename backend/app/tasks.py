@@ -1,8 +1,39 @@
-from celery import shared_task
+from celery import chord, shared_task
+from celery.exceptions import Ignore
+from sqlalchemy.orm import load_only
+from werkzeug.utils import secure_filename
+from app.config.config import BaseConfig
+from app.extensions import redis_client
 from app.services.pdf_service import PdfService
-from app.services.document_service import DocumentService
+from app.services.document_service import ENCRYPTION_PARAMS, SPLIT_OPERATIONS, DocumentService
+from app.services.blob_service import BlobService
+from app.services.encryption_service import EncryptionService
+from app.services.storage_service import StorageService
+from app.services.result_cache import ResultCache
+from app.services.ocr_cache import OcrCache
+from app.services.page_index import PageIndexService
+from app.services.job_events import BufferedProgressWriter, publish_job_event
+from app.services.job_scheduler import JobScheduler
 from app.models.document import Document
+from app.utils.instrumentation import STAGE_SECONDS, timed
+import logging
+import math
 import os
+import time
+import uuid
+from contextlib import ExitStack
+from functools import lru_cache
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=None)
+def get_blob_service() -> BlobService:
+    """
+    One per worker process, reused by every task: the storage client and
+    its connection pool are built once. Cleared at fork by app.worker.
+    """
+    return BlobService(StorageService())
 
 @shared_task(bind=True)
 def process_document(self, document_id: str, operation: str, params: dict = None):
@@ -10,44 +41,465 @@ def process_document(self, document_id: str, operation: str, params: dict = None
     Process a document with progress updates
     """
     try:
-        document = Document.query.get(document_id)
-        if not document:
-            raise ValueError(f"Document {document_id} not found")
+        # Feeds the per-queue wait-time metrics
+        JobScheduler().job_started(self.request.id)
+    except Exception as e:
+        logger.warning(f"Failed to record start of job {self.request.id}: {str(e)}")
 
-        if operation == 'merge_pdfs':
-            # Update status
-            document.status = 'processing'
-            document.save()
-
-            # Process files
-            pdf_service = PdfService()
-            output_path = pdf_service.merge_pdfs(
-                params.get('pdf_paths', []),
-                params.get('output_filename')
-            )
+    try:
+        if operation not in ('merge_pdfs', 'compress_pdf', 'convert_to_pdf', 'ocr_pdf', *SPLIT_OPERATIONS,
+                             *ENCRYPTION_PARAMS):
+            raise ValueError(f"Unknown operation: {operation}")
+
+        if operation in SPLIT_OPERATIONS:
+            # The document itself is only read, so its status is left alone
+            progress, report_progress = _page_progress(self)
+            child_ids = _split_document(document_id, operation, params or {}, report_progress)
+            progress.flush()
+            # Thousands of ids are too many for an event; the parts are listed by parent_id
+            publish_job_event(self.request.id, 'SUCCESS', progress=100, document_id=document_id,
+                              document_count=len(child_ids))
+            return {'status': 'completed', 'progress': 100, 'document_ids': child_ids}
 
-            # Update document with result
-            document.url = output_path
-            document.status = 'completed'
-            document.save()
+        # One conditional UPDATE instead of load + save; a duplicate delivery
+        # of a job that already finished stops here
+        if not Document.transition_status(document_id, ['pending', 'processing'], 'processing'):
+            raise ValueError(f"Document {document_id} not found or already processed")
 
-            # Clean up input files
-            for pdf_path in params.get('pdf_paths', []):
-                try:
-                    os.remove(pdf_path)
-                except Exception:
-                    pass  # Ignore cleanup errors
+        if operation == 'merge_pdfs':
+            pdf_keys = params.get('pdf_keys', [])
+            fan_in = BaseConfig.MERGE_FAN_IN
+            if len(pdf_keys) > fan_in:
+                # Large batch: merge groups in parallel, then merge the parts.
+                # The chord takes over this task's id, so the job id stays valid.
+                params = dict(params, total_merges=_count_tree_merges(len(pdf_keys), fan_in))
+                items = [{'key': key, 'blob_id': None} for key in pdf_keys]
+                return self.replace(_merge_tree_level_signature(document_id, items, params, self.request.id, False))
 
+            blob_service = get_blob_service()
+            _merge_into_document(document_id, pdf_keys, params, blob_service, self.request.id)
+            publish_job_event(self.request.id, 'SUCCESS', progress=100, document_id=document_id)
             return {'status': 'completed', 'progress': 100}
 
         else:
-            raise ValueError(f"Unknown operation: {operation}")
+            progress, report_progress = _page_progress(self)
+
+            source_key, previous_blob_id, source_type, source_metadata = Document.query.with_entities(
+                Document.url, Document.blob_id, Document.type, Document.metadata_
+            ).filter(Document.id == document_id).one()
+            blob_service = get_blob_service()
+            if operation in ENCRYPTION_PARAMS:
+                output_path, output_type, encryption = _run_encryption(
+                    operation, params or {}, source_key, source_type, source_metadata or {},
+                    f"{document_id}_{operation}", blob_service
+                )
+                # An envelope is opaque: there are no pages to index
+                blob, metadata = _store_output(output_path, {}, blob_service, index=encryption != 'envelope')
+                if encryption:
+                    metadata['encryption'] = encryption
+                if encryption == 'envelope':
+                    metadata['encrypted_type'] = source_type
+                _complete_document(document_id, blob, blob_service, type=output_type, metadata_=metadata)
+            else:
+                # Pages are processed in parallel across the worker's cores
+                options = {'image_quality': int(params['image_quality'])} if params and params.get('image_quality') else {}
+                if operation == 'ocr_pdf':
+                    options = {'language': (params or {}).get('language') or BaseConfig.OCR_LANGUAGE,
+                               'cache': OcrCache()}
+                with blob_service.storage_service.local_path(source_key) as source_path:
+                    output_path = getattr(PdfService, operation)(
+                        source_path,
+                        f"{document_id}_{operation}.pdf",
+                        progress=report_progress,
+                        **options
+                    )
+                progress.flush()
+
+                # Point the document at the result and drop its previous content
+                blob, metadata = _store_output(output_path, params or {}, blob_service)
+                _complete_document(document_id, blob, blob_service, type='pdf', metadata_=metadata)
+            if previous_blob_id:
+                blob_service.release([previous_blob_id])
+                collect_garbage.delay()
 
+            publish_job_event(self.request.id, 'SUCCESS', progress=100, document_id=document_id)
+            return {'status': 'completed', 'progress': 100}
+
+    except Ignore:
+        # Raised by self.replace once the tree merge has been scheduled
+        raise
     except Exception as e:
-        # Update document status on error
-        if document:
-            document.status = 'failed'
-            document.save()
+        # Update document status on error, unless it already finished
+        if operation not in SPLIT_OPERATIONS:
+            Document.transition_status(document_id, ['pending', 'processing'], 'failed')
+        publish_job_event(self.request.id, 'FAILURE', document_id=document_id, error=str(e))
         
         # Re-raise as task failure
-        raise Exception(f"Processing failed: {str(e)}") 
\ No newline at end of file
+        raise Exception(f"Processing failed: {str(e)}")
+
+@shared_task(bind=True)
+def process_pipeline(self, document_id: str, plan: dict, params: dict):
+    """
+    Run a planned multi-step pipeline (DocumentService.plan_pipeline) over
+    the inputs in one pass and store only the final output in the document
+    """
+    try:
+        JobScheduler().job_started(self.request.id)
+    except Exception as e:
+        logger.warning(f"Failed to record start of job {self.request.id}: {str(e)}")
+
+    blob_service = get_blob_service()
+    try:
+        if not Document.transition_status(document_id, ['pending', 'processing'], 'processing'):
+            raise ValueError(f"Document {document_id} not found or already processed")
+
+        progress, report_progress = _page_progress(self)
+        timings = {}
+        with ExitStack() as stack:
+            started = time.perf_counter()
+            source_paths = [
+                stack.enter_context(blob_service.storage_service.local_path(key))
+                for key in params['input_keys']
+            ]
+            timings['fetch'] = time.perf_counter() - started
+            output_path, step_timings = PdfService.run_pipeline(
+                source_paths,
+                plan['page_steps'],
+                plan['document_steps'],
+                f"{document_id}_pipeline.pdf",
+                images=plan['images'],
+                progress=report_progress
+            )
+            timings.update(step_timings)
+        progress.flush()
+
+        started = time.perf_counter()
+        blob, metadata = _store_output(output_path, {}, blob_service)
+        _complete_document(document_id, blob, blob_service, type='pdf',
+                           metadata_=dict(metadata, pipeline=plan['operations']))
+        timings['store'] = time.perf_counter() - started
+
+        timings = {name: round(seconds, 4) for name, seconds in timings.items()}
+        for name, seconds in timings.items():
+            STAGE_SECONDS.labels(f"pipeline.{name}").observe(seconds)
+        publish_job_event(self.request.id, 'SUCCESS', progress=100, document_id=document_id, timings=timings)
+        return {'status': 'completed', 'progress': 100, 'timings': timings}
+
+    except Exception as e:
+        Document.transition_status(document_id, ['pending', 'processing'], 'failed')
+        publish_job_event(self.request.id, 'FAILURE', document_id=document_id, error=str(e))
+        raise Exception(f"Processing failed: {str(e)}")
+    finally:
+        # Drop the references the API took on the inputs
+        blob_service.release(params.get('input_blob_ids', []))
+        collect_garbage.delay()
+
+@shared_task
+def collect_garbage():
+    """
+    Delete stored blobs that no document or running job references
+    """
+    return get_blob_service().collect_garbage()
+
+def _merge_into_document(document_id: str, pdf_keys: List[str], params: dict, blob_service: BlobService,
+                         job_id: str, part_blob_ids: List[str] = ()) -> None:
+    """
+    Merge stored inputs into the document's final output and release what
+    the job held: its inputs and, for a tree merge, the last level's parts.
+    """
+    try:
+        # Inputs are fetched from the storage backend into local scratch
+        with ExitStack() as stack:
+            pdf_paths = [
+                stack.enter_context(blob_service.storage_service.local_path(key))
+                for key in pdf_keys
+            ]
+            output_path = PdfService.merge_pdfs(
+                pdf_paths,
+                params.get('output_filename')
+            )
+    finally:
+        _release_job_inputs(job_id, params.get('input_blob_ids', []), blob_service)
+        blob_service.release(_take_merge_parts(job_id, part_blob_ids))
+        collect_garbage.delay()
+
+    # Store the result and update the document
+    blob, metadata = _store_output(output_path, params, blob_service)
+    _complete_document(document_id, blob, blob_service, metadata_=metadata)
+
+    if params.get('cache_key'):
+        ResultCache(blob_service).put(params['cache_key'], blob)
+
+def _run_encryption(operation: str, params: dict, source_key: str, source_type: str, metadata: dict,
+                    output_name: str, blob_service: BlobService):
+    """
+    Encrypt or decrypt a stored document as params (passwords sealed by
+    DocumentService.prepare_encryption) and its current encryption say.
+    Returns the output path, the document's new type and its encryption.
+    """
+    encryption_service = EncryptionService()
+    password = lambda name: encryption_service.unseal(params[name]) if params.get(name) else None
+    envelope = (params.get('mode') == 'envelope') if operation == 'encrypt_pdf' else metadata.get('encryption') == 'envelope'
+
+    if envelope:
+        # Streamed from storage chunk by chunk; the file is never fetched whole
+        output_path = f"storage/{secure_filename(output_name)}.{'enc' if operation == 'encrypt_pdf' else 'bin'}"
+        blocks = blob_service.storage_service.backend.iter_range(source_key)
+        try:
+            with timed(f"crypto.{operation}"), open(output_path, 'wb') as output:
+                if operation == 'encrypt_pdf':
+                    encryption_service.encrypt_stream(blocks, output)
+                    return output_path, 'encrypted', 'envelope'
+                encryption_service.decrypt_stream(blocks, output)
+                return output_path, metadata.get('encrypted_type') or 'pdf', None
+        except Exception:
+            os.remove(output_path)
+            raise
+
+    with blob_service.storage_service.local_path(source_key) as source_path:
+        if operation == 'encrypt_pdf':
+            output_path = PdfService.encrypt_pdf(source_path, f"{output_name}.pdf", password('password'),
+                                                 password('owner_password'))
+            return output_path, 'pdf', 'aes-256'
+        return PdfService.decrypt_pdf(source_path, f"{output_name}.pdf", password('password') or ''), 'pdf', None
+
+def _split_document(document_id: str, operation: str, params: dict, report_progress) -> List[str]:
+    """
+    Write the parts of a split_pdf or extract_pages job straight from the
+    source's page index and register them as child documents in one
+    INSERT. Returns the new documents' ids, in part order.
+    """
+    document = Document.query.options(load_only(
+        Document.name, Document.user_id, Document.blob_id, Document.metadata_
+    )).filter(Document.id == document_id).first()
+    if not document or not document.blob_id:
+        raise ValueError(f"Document {document_id} not found or has no content")
+
+    blob_service = get_blob_service()
+    # Held for the job, so replacing the document's content cannot remove the file mid-split
+    source = blob_service.acquire(document.blob_id)
+    if not source:
+        raise ValueError(f"Content of document {document_id} is gone")
+    try:
+        with blob_service.storage_service.local_path(source.path) as source_path:
+            index = PageIndexService(blob_service.storage_service).get_index(source.digest, source_path)
+            parts = DocumentService.plan_split(operation, params, index['count'])
+            output_paths = PdfService.split_pdf(
+                source_path, index, parts, f"{document_id}_{operation}", progress=report_progress
+            )
+    finally:
+        blob_service.release([source.id])
+
+    blobs = blob_service.put_paths(output_paths)
+    stem = os.path.splitext(document.name)[0]
+    rows = [
+        {
+            'name': f"{stem}_{_describe_pages(numbers).replace(',', '_')}.pdf",
+            'type': 'pdf',
+            'size': blob.size,
+            'status': 'completed',
+            'url': blob.path,
+            'blob_id': blob.id,
+            'user_id': document.user_id,
+            'parent_id': document_id,
+            'metadata': {'sha256': blob.digest, 'page_count': len(numbers), 'pages': _describe_pages(numbers)},
+        }
+        for numbers, blob in zip(parts, blobs)
+    ]
+    try:
+        return Document.bulk_create(rows)
+    except Exception:
+        blob_service.release([blob.id for blob in blobs])
+        raise
+
+def _describe_pages(numbers: List[int]) -> str:
+    """Page numbers as ranges, e.g. [1, 2, 3, 7] as '1-3,7'."""
+    ranges = []
+    for number in numbers:
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ','.join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+def _page_progress(task):
+    """A buffered progress writer for a page-parallel job and its (pages_done, total_pages) callback."""
+    def flush_progress(meta):
+        task.update_state(state='PROGRESS', meta=meta)
+        publish_job_event(task.request.id, 'PROGRESS', **meta)
+
+    progress = BufferedProgressWriter(flush_progress)
+
+    def report_progress(pages_done, total_pages):
+        progress.update(
+            progress=int(pages_done * 100 / total_pages),
+            pages_done=pages_done,
+            total_pages=total_pages
+        )
+
+    return progress, report_progress
+
+def _store_output(output_path: str, params: dict, blob_service: BlobService, index: bool = True):
+    """
+    Store a task's output PDF, linearized if asked for, with its page index
+    unless index is False. Returns the blob and the document metadata known
+    from writing it.
+    """
+    if params.get('linearize'):
+        PdfService.linearize(output_path)
+    try:
+        # Built while the file is still local, so previews never fetch it whole
+        index = PageIndexService.scan(output_path) if index else None
+    except Exception as e:
+        logger.warning(f"Failed to index pages of {output_path}: {str(e)}")
+        index = None
+    blob = blob_service.put_path(output_path)
+    metadata = {'sha256': blob.digest}
+    if index:
+        PageIndexService(blob_service.storage_service).save(blob.digest, index)
+        metadata['page_count'] = index['count']
+    return blob, metadata
+
+def _complete_document(document_id: str, blob, blob_service: BlobService, **values) -> None:
+    """Hand the output blob's reference to the document in the same UPDATE that completes it."""
+    if not Document.transition_status(document_id, 'processing', 'completed', blob_id=blob.id,
+                                      url=blob.path, size=blob.size, **values):
+        blob_service.release([blob.id])
+        raise ValueError(f"Document {document_id} is no longer processing")
+
+def _release_job_inputs(job_id: str, blob_ids: List[str], blob_service: BlobService) -> None:
+    """
+    Drop the references the API took on a job's inputs, once per job: the
+    final merge and every error callback of a tree merge may try.
+    """
+    if blob_ids and redis_client.set(f"inputs_released:{job_id}", 1, nx=True, ex=24 * 60 * 60):
+        blob_service.release(blob_ids)
+
+def _add_merge_part(job_id: str, blob_id: str) -> None:
+    """Record an intermediate part of a tree merge, so a failed merge can release it."""
+    key = f"merge_parts:{job_id}"
+    pipe = redis_client.pipeline()
+    pipe.sadd(key, blob_id)
+    pipe.expire(key, 24 * 60 * 60)
+    pipe.execute()
+
+def _take_merge_parts(job_id: str, blob_ids=None) -> List[str]:
+    """
+    Remove intermediate parts (all of them if blob_ids is None) from the
+    job's record and return those that were still in it: whoever takes a
+    part releases it, so each is released exactly once.
+    """
+    key = f"merge_parts:{job_id}"
+    if blob_ids is None:
+        pipe = redis_client.pipeline()
+        pipe.smembers(key)
+        pipe.delete(key)
+        return [blob_id.decode() for blob_id in pipe.execute()[0]]
+    blob_ids = [blob_id for blob_id in blob_ids if blob_id]
+    if not blob_ids:
+        return []
+    pipe = redis_client.pipeline()
+    for blob_id in blob_ids:
+        pipe.srem(key, blob_id)
+    return [blob_id for blob_id, removed in zip(blob_ids, pipe.execute()) if removed]
+
+def _count_tree_merges(inputs: int, fan_in: int) -> int:
+    """Number of merge tasks a tree merge runs, including the final one."""
+    merges = 1
+    while inputs > fan_in:
+        inputs = math.ceil(inputs / fan_in)
+        merges += inputs
+    return merges
+
+def _merge_tree_level_signature(document_id: str, items: List[dict], params: dict,
+                                job_id: str, release_inputs: bool):
+    """One level of a tree merge: a chord of group merges feeding merge_tree_level."""
+    fan_in = BaseConfig.MERGE_FAN_IN
+    groups = [items[i:i + fan_in] for i in range(0, len(items), fan_in)]
+    return chord(
+        [merge_group.s(group, release_inputs, job_id, params['total_merges']).set(queue='merge') for group in groups],
+        merge_tree_level.s(document_id, params, job_id).set(queue='merge')
+    ).on_error(merge_tree_failed.s(document_id, params.get('input_blob_ids', []), job_id).set(queue='merge'))
+
+def _report_tree_progress(task, job_id: str, total_merges: int) -> None:
+    key = f"merge_progress:{job_id}"
+    done = redis_client.incr(key)
+    redis_client.expire(key, 24 * 60 * 60)
+    meta = {'progress': min(99, int(done * 100 / total_merges))}
+    task.update_state(task_id=job_id, state='PROGRESS', meta=meta)
+    publish_job_event(job_id, 'PROGRESS', **meta)
+
+def _job_running(job_id: str) -> None:
+    """Keep the job's scheduler slot while its later tasks run."""
+    try:
+        JobScheduler().job_running(job_id)
+    except Exception as e:
+        logger.warning(f"Failed to record progress of job {job_id}: {str(e)}")
+
+@shared_task(bind=True)
+def merge_group(self, items: List[dict], release_inputs: bool, job_id: str, total_merges: int):
+    """
+    Merge one group of a tree merge into an intermediate blob
+    """
+    _job_running(job_id)
+    blob_service = get_blob_service()
+    try:
+        with ExitStack() as stack:
+            pdf_paths = [
+                stack.enter_context(blob_service.storage_service.local_path(item['key']))
+                for item in items
+            ]
+            output_path = PdfService.merge_pdfs(pdf_paths, f"{uuid.uuid4().hex}_part.pdf")
+    finally:
+        if release_inputs:
+            # Intermediate parts from the previous level are no longer needed
+            blob_service.release(_take_merge_parts(job_id, [item['blob_id'] for item in items]))
+
+    blob = blob_service.put_path(output_path)
+    _add_merge_part(job_id, blob.id)
+    _report_tree_progress(self, job_id, total_merges)
+    return {'key': blob.path, 'blob_id': blob.id}
+
+@shared_task(bind=True)
+def merge_tree_level(self, parts: List[dict], document_id: str, params: dict, job_id: str):
+    """
+    Chord callback: merge the parts of the previous level, in order, either
+    into the final document or, if there are still too many, into another level
+    """
+    _job_running(job_id)
+    if len(parts) > BaseConfig.MERGE_FAN_IN:
+        return self.replace(_merge_tree_level_signature(document_id, parts, params, job_id, True))
+
+    blob_service = get_blob_service()
+    try:
+        _merge_into_document(
+            document_id,
+            [part['key'] for part in parts],
+            params,
+            blob_service,
+            job_id,
+            [part['blob_id'] for part in parts]
+        )
+    except Exception as e:
+        Document.transition_status(document_id, ['pending', 'processing'], 'failed')
+        publish_job_event(job_id, 'FAILURE', document_id=document_id, error=str(e))
+        raise Exception(f"Processing failed: {str(e)}")
+    finally:
+        redis_client.delete(f"merge_progress:{job_id}")
+    publish_job_event(job_id, 'SUCCESS', progress=100, document_id=document_id)
+    return {'status': 'completed', 'progress': 100}
+
+@shared_task
+def merge_tree_failed(request, exc, traceback, document_id: str, input_blob_ids: List[str], job_id: str):
+    """
+    Error callback of a tree merge level: fail the document and release its
+    inputs and the parts merged so far. self.replace carries it into later
+    levels, so it can run more than once for a job; every release is guarded.
+    """
+    blob_service = get_blob_service()
+    Document.transition_status(document_id, ['pending', 'processing'], 'failed')
+    _release_job_inputs(job_id, input_blob_ids, blob_service)
+    # Parts of the failed group's siblings, and of earlier levels not yet merged
+    blob_service.release(_take_merge_parts(job_id))
+    collect_garbage.delay()
+    publish_job_event(job_id, 'FAILURE', document_id=document_id, error=str(exc))
@@ -1,6 +1,7 @@
 from typing import Type, Dict, Any
 from functools import wraps
 from flask import jsonify
+from werkzeug.exceptions import HTTPException
 import logging
 import traceback
 
@@ -23,6 +24,18 @@ class NotFoundError(AppError):
     def __init__(self, message: str):
         super().__init__(message, 'NOT_FOUND', 404)
 
+class InvalidFileError(AppError):
+    def __init__(self, message: str):
+        super().__init__(message, 'INVALID_FILE', 400)
+
+class FileTooLargeError(AppError):
+    def __init__(self, message: str):
+        super().__init__(message, 'FILE_TOO_LARGE', 413)
+
+class RateLimitError(AppError):
+    def __init__(self, message: str):
+        super().__init__(message, 'RATE_LIMITED', 429)
+
 class AuthenticationError(AppError):
     def __init__(self, message: str):
         super().__init__(message, 'AUTHENTICATION_ERROR', 401)
@@ -32,6 +45,9 @@ def handle_errors(f):
     def wrapper(*args, **kwargs):
         try:
             return f(*args, **kwargs)
+        except HTTPException:
+            # e.g. 413 from the request body limit; left to the registered error handlers
+            raise
         except AppError as e:
             logger.error(f"Application error: {str(e)}")
             return jsonify({
@@ -0,0 +1,270 @@
+"""
+Timing for the hot paths, exported as Prometheus metrics, plus a trace ID
+carried from each API request into the tasks it queues, and an opt-in
+sampling profiler that keeps profiles of slow requests.
+
+With several processes (Celery's prefork pool, gunicorn workers) set
+PROMETHEUS_MULTIPROC_DIR so each process's samples are shared through it.
+"""
+import cProfile
+import contextvars
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from typing import Optional
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+    start_http_server
+)
+from app.config.config import BaseConfig
+
+logger = logging.getLogger(__name__)
+
+TRACE_HEADER = 'X-Trace-Id'
+_TRACE_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{8,64}$')
+
+# From a few milliseconds (Redis, commits) to minutes (large jobs)
+BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'API request handling time, until the response is returned',
+    ['method', 'endpoint', 'status'], buckets=BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    'stage_duration_seconds', 'Time spent in an instrumented stage (storage, PDF, database, Celery)',
+    ['stage'], buckets=BUCKETS
+)
+STAGE_ERRORS = Counter('stage_errors_total', 'Instrumented stages that raised', ['stage'])
+TASK_SECONDS = Histogram(
+    'task_duration_seconds', 'Celery task run time', ['task', 'state'], buckets=BUCKETS
+)
+TASK_QUEUE_SECONDS = Histogram(
+    'task_queue_wait_seconds', 'Time from enqueue until a worker starts the task',
+    ['task', 'queue'], buckets=BUCKETS
+)
+
+_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('trace_id', default=None)
+
+def get_trace_id() -> Optional[str]:
+    """Trace ID of the request or task being handled, if any"""
+    return _trace_id.get()
+
+def _accept_trace_id(value: Optional[str]) -> str:
+    """A caller's trace ID if it looks like one, else a new one"""
+    if value and _TRACE_ID_PATTERN.match(value):
+        return value
+    return uuid.uuid4().hex
+
+@contextmanager
+def trace(value: Optional[str] = None):
+    """Handle a request under the caller's trace ID (or a new one) for the block; yields it"""
+    trace_id = _accept_trace_id(value)
+    token = _trace_id.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        _trace_id.reset(token)
+
+@contextmanager
+def timed(stage: str):
+    """Time a block into stage_duration_seconds; failures are also counted"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+def timed_stage(stage: str):
+    """Decorator form of timed()"""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def metrics_response():
+    """Body and content type for /metrics, across processes when multiprocess mode is on"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def start_metrics_server(port: int) -> None:
+    """
+    Serve /metrics on its own port, for processes without an HTTP API
+    (Celery workers). Call before forking: samples left in the multiprocess
+    directory by an earlier run are cleared.
+    """
+    directory = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith('.db'):
+                os.remove(os.path.join(directory, name))
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        start_http_server(port, registry=registry)
+    else:
+        start_http_server(port)
+
+class SamplingProfiler:
+    """
+    Profiles one request in every `every` with cProfile and writes the
+    profile to `directory` if the request took at least `slow_ms`.
+    At most one request is profiled at a time per process; others in
+    flight meanwhile are simply not sampled.
+    """
+
+    def __init__(self, every: int = BaseConfig.PROFILE_SAMPLE_EVERY,
+                 slow_ms: float = BaseConfig.PROFILE_SLOW_MS,
+                 directory: str = BaseConfig.PROFILE_DIR):
+        self.every = every
+        self.slow_ms = slow_ms
+        self.directory = directory
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if self.every <= 0 or next(self._counter) % self.every:
+            return None
+        if not self._lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def finish(self, profile: cProfile.Profile, elapsed: float, name: str) -> Optional[str]:
+        """Stop profiling; returns the path written, if the request was slow"""
+        try:
+            profile.disable()
+        finally:
+            self._lock.release()
+        if elapsed * 1000 < self.slow_ms:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(
+            self.directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{name}-{int(elapsed * 1000)}ms.prof"
+        )
+        try:
+            profile.dump_stats(path)
+        except OSError as e:
+            logger.warning(f"Failed to write profile {path}: {str(e)}")
+            return None
+        logger.info(f"Slow request profiled ({elapsed * 1000:.0f} ms): {path}")
+        return path
+
+profiler = SamplingProfiler()
+
+def init_app(app) -> None:
+    """Request timing, trace IDs and sampled profiling for every route, and /metrics"""
+    from flask import Response, g, request
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        body, content_type = metrics_response()
+        return Response(body, content_type=content_type)
+
+    @app.before_request
+    def start_request():
+        g.trace_id = _accept_trace_id(request.headers.get(TRACE_HEADER))
+        g.trace_token = _trace_id.set(g.trace_id)
+        g.request_started = time.perf_counter()
+        g.profile = profiler.start()
+
+    @app.after_request
+    def finish_request(response):
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        # Streamed bodies (downloads, job events) are sent after this point
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_SECONDS.labels(request.method, endpoint, response.status_code).observe(elapsed)
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profiler.finish(profile, elapsed, f"{endpoint}-{g.trace_id}")
+        response.headers[TRACE_HEADER] = g.trace_id
+        return response
+
+    @app.teardown_request
+    def end_trace(exc=None):
+        # A request that failed before after_request must not leave the profiler busy
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profiler.finish(profile, 0, '')
+        token = g.pop('trace_token', None)
+        if token is not None:
+            _trace_id.reset(token)
+
+@lru_cache(maxsize=None)
+def instrument_sqlalchemy() -> None:
+    """Time every commit, on any session"""
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    @event.listens_for(Session, 'before_commit')
+    def before_commit(session):
+        session.info['commit_started'] = time.perf_counter()
+
+    @event.listens_for(Session, 'after_commit')
+    def after_commit(session):
+        started = session.info.pop('commit_started', None)
+        if started is not None:
+            STAGE_SECONDS.labels('db.commit').observe(time.perf_counter() - started)
+
+@lru_cache(maxsize=None)
+def instrument_celery() -> None:
+    """Enqueue and run times of tasks, with the trace ID passed along in the message headers"""
+    from celery.signals import after_task_publish, before_task_publish, task_postrun, task_prerun
+
+    publishing = threading.local()
+    running = {}
+
+    @before_task_publish.connect(weak=False)
+    def add_trace_headers(headers=None, **kwargs):
+        if headers is not None:
+            headers.setdefault('trace_id', get_trace_id() or uuid.uuid4().hex)
+            headers['enqueued_at'] = time.time()
+        publishing.started = time.perf_counter()
+
+    @after_task_publish.connect(weak=False)
+    def record_publish(**kwargs):
+        started = getattr(publishing, 'started', None)
+        if started is not None:
+            STAGE_SECONDS.labels('celery.enqueue').observe(time.perf_counter() - started)
+            publishing.started = None
+
+    @task_prerun.connect(weak=False)
+    def start_task(task_id=None, task=None, **kwargs):
+        request = task.request
+        # Eager tasks are not published, so they inherit the caller's trace
+        token = _trace_id.set(_accept_trace_id(request.get('trace_id') or get_trace_id()))
+        running[task_id] = (time.perf_counter(), token)
+        enqueued_at = request.get('enqueued_at')
+        if enqueued_at:
+            queue = (request.delivery_info or {}).get('routing_key') or 'unknown'
+            TASK_QUEUE_SECONDS.labels(task.name, queue).observe(max(0, time.time() - enqueued_at))
+
+    @task_postrun.connect(weak=False)
+    def finish_task(task_id=None, task=None, state=None, **kwargs):
+        started, token = running.pop(task_id, (None, None))
+        if started is not None:
+            TASK_SECONDS.labels(task.name, state or 'UNKNOWN').observe(time.perf_counter() - started)
+            try:
+                _trace_id.reset(token)
+            except ValueError:
+                # Set in a different context; the next task sets its own
+                pass
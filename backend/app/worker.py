@@ -0,0 +1,84 @@
+"""
+Celery worker entry point: celery -A app.worker worker
+
+The parent process builds the Flask app and imports the PDF and image
+libraries once, before forking, so every pool process starts with them
+loaded. Each child then replaces what must not be shared across a fork
+(database and Redis connections, boto3 clients) and keeps its own for all
+the tasks it runs.
+
+Workers use the default prefork pool. Its children are daemonic, so the
+page pool each one starts for page-parallel work (pdf_service.get_page_pool)
+is billiard's, which allows that; multiprocessing and concurrent.futures
+pools fail there with "daemonic processes are not allowed to have children".
+"""
+import logging
+
+from celery.signals import task_failure, task_postrun, task_revoked, worker_process_init, worker_process_shutdown
+from PIL import Image
+import PyPDF2  # noqa: F401  (preloaded for the pool processes)
+
+from app import create_app
+from app.config.config import BaseConfig
+from app.extensions import db, get_celery, redis_client
+from app.services.job_events import publish_job_event
+from app.services.job_scheduler import JobScheduler
+from app.services.pdf_service import get_page_pool, shutdown_page_pool
+from app.services.storage_backends import get_storage_backend
+from app.utils.instrumentation import start_metrics_server
+from app import tasks  # noqa: F401  (registers the tasks)
+
+logger = logging.getLogger(__name__)
+
+flask_app = create_app()
+# The Celery app itself, not the lazy proxy, for `celery -A app.worker`
+celery = get_celery()
+# Load every Pillow format plugin now rather than on each child's first image
+Image.init()
+
+if BaseConfig.WORKER_METRICS_PORT:
+    # Served by the parent; the pool processes' samples reach it through
+    # PROMETHEUS_MULTIPROC_DIR, which must be set for a prefork worker
+    start_metrics_server(BaseConfig.WORKER_METRICS_PORT)
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Per child, right after fork."""
+    # Inherited connections belong to the parent; drop them without closing
+    with flask_app.app_context():
+        db.engine.dispose(close=False)
+    redis_client.connection_pool.reset()
+    get_storage_backend.cache_clear()
+    tasks.get_blob_service.cache_clear()
+    # The page pool is started on first use, by this process
+    get_page_pool.cache_clear()
+
+    # One app context for the life of the process, so tasks can use models
+    flask_app.app_context().push()
+
+    # Build the storage client and open a pooled DB connection up front
+    tasks.get_blob_service()
+    db.session.execute(db.text('SELECT 1'))
+    db.session.remove()
+
+@task_postrun.connect
+def release_session(**kwargs):
+    """Return the task's DB connection to the pool and drop its identity map."""
+    db.session.remove()
+
+@task_failure.connect
+def free_failed_job(task_id=None, **kwargs):
+    """Free the job's scheduler slot even if the task died before reporting its failure."""
+    try:
+        JobScheduler().job_finished(task_id)
+    except Exception as e:
+        logger.warning(f"Failed to free slot of job {task_id}: {str(e)}")
+
+@task_revoked.connect
+def free_revoked_job(request=None, **kwargs):
+    """A revoked job never runs (or is stopped); report it, which frees its slot."""
+    publish_job_event(request.id, 'REVOKED')
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    shutdown_page_pool()
@@ -0,0 +1,90 @@
+"""
+Per-request cost of authentication: verifying the bearer token and
+loading the user, with and without the per-process auth caches.
+
+Usage (from backend/):
+    python -m benchmarks.auth_benchmark --requests 20000 --users 100
+
+Requests go through a Flask test client to a route behind require_auth
+that returns get_current_user(), so routing and response building are
+included; the route with no auth at all is timed as the floor. Needs
+Redis at REDIS_URL (revocation checks on cache misses); without
+DATABASE_URL a throwaway SQLite file is used.
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=100)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+
+    import jwt
+    from flask import Flask, jsonify
+    from app.config.config import BaseConfig
+    from app.extensions import db
+    from app.middleware import auth
+    from app.models.user import User
+    from app.services.auth_cache import AuthCache
+
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=os.environ['DATABASE_URL'])
+    db.init_app(app)
+
+    @app.route('/open')
+    def open_route():
+        return jsonify({})
+
+    @app.route('/me')
+    @auth.require_auth
+    def me():
+        return jsonify(auth.get_current_user())
+
+    try:
+        with app.app_context():
+            db.create_all()
+            users = [User(email=f"bench{i}@example.com", name=f"Bench {i}") for i in range(args.users)]
+            db.session.add_all(users)
+            db.session.commit()
+            now = int(time.time())
+            tokens = [
+                jwt.encode({'sub': user.id, 'iat': now, 'exp': now + 3600}, BaseConfig.SECRET_KEY, algorithm='HS256')
+                for user in users
+            ]
+
+        client = app.test_client()
+        # The same few tokens come back again and again, as with job polling
+        sequence = [random.choice(tokens) for _ in range(args.requests)]
+
+        def run(label: str, path: str):
+            start = time.perf_counter()
+            for token in sequence:
+                response = client.get(path, headers={'Authorization': f"Bearer {token}"})
+                assert response.status_code == 200, response.get_data(as_text=True)
+            per_request = (time.perf_counter() - start) / len(sequence)
+            print(f"{label:<26} {per_request * 1e6:8.1f} us/request")
+            return per_request
+
+        print(f"{args.requests} requests, {args.users} users")
+        floor = run('no auth', '/open')
+        auth.auth_cache = AuthCache(token_cache_size=0, user_cache_size=0)
+        uncached = run('auth, no caches', '/me')
+        auth.auth_cache = AuthCache()
+        cached = run('auth, cached', '/me')
+        print(f"auth overhead: {(uncached - floor) * 1e6:.1f} us uncached, "
+              f"{(cached - floor) * 1e6:.1f} us cached")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Load-test document downloads against a running API: many concurrent
+clients fetching the whole file, random byte ranges, or revalidating with
+If-None-Match.
+
+Usage (from backend/):
+    python -m benchmarks.download_benchmark --url http://localhost:5001 --concurrency 64 --requests 2000
+    python -m benchmarks.download_benchmark --document-id <id> --mode range
+
+Without --document-id a synthetic PDF is uploaded first. Run it once per
+DOWNLOAD_MODE (stream, accel behind nginx, presign) to compare them; with
+presign the redirect to the object store is followed.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.synthetic import make_pdf
+
+
+def upload(base_url: str, pages: int, image_kb: int) -> str:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = make_pdf(os.path.join(tmp, 'download_bench.pdf'), pages=pages, image_kb=image_kb)
+        with open(path, 'rb') as f:
+            content = f.read()
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"download_bench.pdf\"\r\n"
+        f"Content-Type: application/pdf\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    request = urllib.request.Request(
+        f"{base_url}/api/documents/upload",
+        data=body,
+        headers={'Content-Type': f"multipart/form-data; boundary={boundary}"}
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())['document_id']
+
+
+def fetch(url: str, headers: dict) -> tuple:
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+            received = 0
+            for block in iter(lambda: response.read(64 * 1024), b''):
+                received += len(block)
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status, received = e.code, 0
+    return status, received, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', default='http://localhost:5001')
+    parser.add_argument('--document-id')
+    parser.add_argument('--mode', choices=['full', 'range', 'conditional'], default='full')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--range-kb', type=int, default=256)
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--image-kb', type=int, default=512)
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip('/')
+    document_id = args.document_id or upload(base_url, args.pages, args.image_kb)
+    url = f"{base_url}/api/documents/{document_id}/download"
+
+    # One plain request to learn the size and ETag
+    with urllib.request.urlopen(url) as response:
+        size = len(response.read())
+        etag = response.headers.get('ETag')
+
+    def headers_for_request(_):
+        if args.mode == 'conditional':
+            return {'If-None-Match': etag}
+        if args.mode == 'range':
+            length = min(args.range_kb * 1024, size)
+            start = random.randint(0, size - length)
+            return {'Range': f"bytes={start}-{start + length - 1}"}
+        return {}
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda i: fetch(url, headers_for_request(i)), range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(result[2] for result in results)
+    received = sum(result[1] for result in results)
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print(json.dumps({
+        'mode': args.mode,
+        'document_bytes': size,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'statuses': dict(Counter(result[0] for result in results)),
+        'requests_per_second': round(args.requests / elapsed, 1),
+        'mb_per_second': round(received / elapsed / 1e6, 1),
+        'p50_ms': round(percentile(0.50), 1),
+        'p95_ms': round(percentile(0.95), 1),
+        'p99_ms': round(percentile(0.99), 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Encryption throughput in MB/s of wall time and per core (MB per CPU
+second), with the peak resident memory above the starting point:
+envelope encryption at rest over the storage backend's block stream, and
+PDF-standard AES-256 over a synthetic scan (encrypted by
+PdfEncryptor, decrypted by pikepdf).
+
+Usage (from backend/):
+    python -m benchmarks.encryption_benchmark --size-mb 512
+    ENCRYPTION_CHUNK_SIZE=4194304 python -m benchmarks.encryption_benchmark --size-mb 256 --pdf-mb 256
+
+Runs on local files only; no database, Redis or worker needed.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.pipeline_benchmark import RssSampler
+from benchmarks.synthetic import make_pdf
+
+
+def measure(label: str, size: int, fn):
+    baseline = RssSampler.tree_rss(os.getpid())
+    with RssSampler(os.getpid(), interval=0.005) as sampler:
+        wall, cpu = time.perf_counter(), time.process_time()
+        fn()
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    mb = size / 1e6
+    print(f"{label:<20} {mb:8.0f} MB  {wall:7.2f} s  {mb / wall:8.1f} MB/s  {mb / cpu:8.1f} MB/s/core  "
+          f"peak RSS +{max(0, sampler.peak - baseline) / 2 ** 20:6.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=256, help='size of the file for envelope encryption')
+    parser.add_argument('--pdf-mb', type=int, default=128, help='approximate size of the PDF')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    sys.path.insert(0, os.getcwd())
+    os.chdir(workdir)
+    os.makedirs('storage')
+
+    from app.config.config import BaseConfig
+    from app.services.encryption_service import EncryptionService
+    from app.services.pdf_service import PdfService
+    from app.services.storage_backends import LocalStorageBackend
+
+    try:
+        backend = LocalStorageBackend(os.path.join(workdir, 'store'))
+        with open(backend.path('plain'), 'wb') as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+        size = os.path.getsize(backend.path('plain'))
+        service = EncryptionService()
+        print(f"chunk size {BaseConfig.ENCRYPTION_CHUNK_SIZE // 1024} KiB")
+
+        def encrypt():
+            with open(backend.path('sealed'), 'wb') as output:
+                service.encrypt_stream(backend.iter_range('plain'), output)
+
+        def decrypt():
+            with open(backend.path('opened'), 'wb') as output:
+                service.decrypt_stream(backend.iter_range('sealed'), output)
+
+        measure('envelope encrypt', size, encrypt)
+        measure('envelope decrypt', size, decrypt)
+        assert os.path.getsize(backend.path('opened')) == size
+
+        pdf = make_pdf(os.path.join(workdir, 'source.pdf'), pages=max(1, args.pdf_mb * 4), image_kb=256, seed=1)
+        size = os.path.getsize(pdf)
+        measure('pdf aes-256 encrypt', size, lambda: PdfService.encrypt_pdf(pdf, 'encrypted.pdf', 'secret'))
+        measure('pdf aes-256 decrypt', size,
+                lambda: PdfService.decrypt_pdf('storage/encrypted.pdf', 'decrypted.pdf', 'secret'))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+"""
+Slow-client load test of the two ways to serve the API, one process each
+as a pod runs it: the WSGI app (wsgi:app, gunicorn gthread) and the ASGI
+app (asgi:app, uvicorn), whose upload, job status and download endpoints
+are async.
+
+Phases, against each server in turn:
+    slow-upload    --connections uploads at once, each body trickled in over --trickle seconds
+    event-streams  --connections job event streams, each held open for --hold seconds
+    fast           --concurrency clients reading job statuses and downloading, back to back
+During the two slow phases a probe sends a batch job status read every
+1/--probe-rate seconds: its latency is what every other client sees while
+the slow connections are open. Each phase reports completed and failed
+requests, latency percentiles, the probe's, and the server's peak RSS and
+CPU time (per request, for the fast phase).
+
+Usage (from backend/):
+    python -m benchmarks.ingest_benchmark
+    python -m benchmarks.ingest_benchmark --servers asgi --connections 5000
+    DATABASE_URL=postgresql://... REDIS_URL=redis://localhost:6379/0 python -m benchmarks.ingest_benchmark
+
+Without REDIS_URL, a fakeredis TCP server runs in this process (it drops
+some connections under bursts; use a real Redis for error counts); without
+DATABASE_URL, each server gets a temporary SQLite database. The load is
+generated from this process (asyncio, one connection per request), so on
+a small machine it competes with the server for CPU.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from benchmarks.pipeline_benchmark import RssSampler, Stats
+from benchmarks.synthetic import make_pdf
+
+HOST = '127.0.0.1'
+
+
+def process_tree(pid: int) -> List[int]:
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def cpu_seconds(pid: int) -> float:
+    """User plus system CPU time of a process and its children."""
+    total = 0
+    for current in process_tree(pid):
+        try:
+            with open(f"/proc/{current}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError):
+            continue
+    return total / os.sysconf('SC_CLK_TCK')
+
+
+class Server:
+    """One API server in a subprocess, run from workdir."""
+
+    def __init__(self, kind: str, port: int, env: dict, workdir: str, threads: int):
+        if kind == 'wsgi':
+            command = ['gunicorn', '--bind', f"{HOST}:{port}", '--worker-class', 'gthread', '--workers', '1',
+                       '--threads', str(threads), '--worker-connections', '20000', '--backlog', '4096',
+                       '--timeout', '300', 'wsgi:app']
+        else:
+            command = ['uvicorn', 'asgi:app', '--host', HOST, '--port', str(port), '--backlog', '4096',
+                       '--no-access-log', '--log-level', 'warning']
+        self.kind = kind
+        self.port = port
+        self.log = open(os.path.join(workdir, f"{kind}.log"), 'wb')
+        self.process = subprocess.Popen([sys.executable, '-m'] + command, cwd=workdir, env=env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout: float = 60) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.kind} server exited; see {self.log.name}")
+            try:
+                status, _ = asyncio.run(request(self.port, 'GET', '/api/livez', timeout=2))
+                if status == 200:
+                    return
+            except (OSError, asyncio.TimeoutError):
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"{self.kind} server did not start; see {self.log.name}")
+
+    def stop(self) -> None:
+        self.process.terminate()
+        try:
+            self.process.wait(30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+async def request(port: int, method: str, path: str, body: bytes = b'', headers: Optional[dict] = None,
+                  pieces: int = 1, trickle: float = 0.0, hold: Optional[float] = None,
+                  timeout: float = 60.0):
+    """
+    One request on its own connection; the body is sent in pieces spread
+    over trickle seconds. With hold, the response is an event stream: the
+    first event is read and the connection then kept open for hold seconds.
+    Returns (status, body).
+    """
+    async def exchange():
+        reader, writer = await asyncio.open_connection(HOST, port)
+        try:
+            head = [f"{method} {path} HTTP/1.1", f"Host: {HOST}", 'Connection: close']
+            head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+            if body or method in ('POST', 'PUT'):
+                head.append(f"Content-Length: {len(body)}")
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode())
+            step = max(1, -(-len(body) // pieces))
+            for offset in range(0, len(body), step):
+                if offset:
+                    await asyncio.sleep(trickle / pieces)
+                writer.write(body[offset:offset + step])
+                await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            while (await reader.readline()) not in (b'\r\n', b''):
+                pass
+            if hold is None:
+                return status, await reader.read()
+            first = await reader.readuntil(b'\n\n')
+            await asyncio.sleep(hold)
+            return status, first
+        finally:
+            writer.close()
+
+    return await asyncio.wait_for(exchange(), timeout)
+
+
+async def timed_request(stats: Stats, *args, **kwargs) -> Optional[bytes]:
+    start = time.perf_counter()
+    try:
+        status, data = await request(*args, **kwargs)
+    except (OSError, ValueError, IndexError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        stats.record(time.perf_counter() - start, ok=False)
+        return None
+    stats.record(time.perf_counter() - start, ok=status == 200)
+    return data if status == 200 else None
+
+
+def multipart(content: bytes, filename: str):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: application/pdf\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return body, {'Content-Type': f"multipart/form-data; boundary={boundary}"}
+
+
+async def with_probe(args, port: int, probe: Stats, job_ids: List[str], work):
+    """Run work while sending a batch status read every 1/probe_rate seconds."""
+    body = json.dumps({'job_ids': job_ids}).encode()
+    headers = {'Content-Type': 'application/json'}
+    done = asyncio.Event()
+
+    async def send():
+        pending = []
+        while not done.is_set():
+            pending.append(asyncio.create_task(
+                timed_request(probe, port, 'POST', '/api/jobs/status', body, headers, timeout=args.timeout)
+            ))
+            await asyncio.sleep(1 / args.probe_rate)
+        await asyncio.gather(*pending)
+
+    prober = asyncio.create_task(send())
+    try:
+        await work()
+    finally:
+        done.set()
+        await prober
+
+
+def phase(server: Server, name: str, work) -> Dict[str, dict]:
+    """Run the coroutine function work(stats) and summarize it with the server's RSS and CPU."""
+    stats = {name: Stats(), 'probe': Stats()}
+    print(f"  {server.kind}: {name}...", file=sys.stderr)
+    cpu = cpu_seconds(server.process.pid)
+    with RssSampler(server.process.pid, interval=0.1) as sampler:
+        start = time.perf_counter()
+        asyncio.run(work(stats))
+        wall = time.perf_counter() - start
+    cpu = cpu_seconds(server.process.pid) - cpu
+    results = {}
+    for stage, stage_stats in stats.items():
+        if not stage_stats.latencies:
+            continue
+        stage_stats.wall = wall
+        summary = stage_stats.summary()
+        summary['peak_rss_mb'] = round(sampler.peak / 1e6, 1) if stage == name else None
+        summary['cpu_s'] = round(cpu, 2) if stage == name else None
+        summary['cpu_ms_per_request'] = round(cpu * 1000 / summary['count'], 2) if stage == name else None
+        results[f"{name}:{stage}" if stage == 'probe' else name] = summary
+    return results
+
+
+def run_server(args, kind: str, port: int, env: dict, workdir: str, pdf: bytes) -> Dict[str, dict]:
+    import redis
+
+    env = dict(env)
+    if 'DATABASE_URL' not in os.environ:
+        env['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, kind + '.db')}"
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'wsgi', 'init-db'], cwd=workdir, env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+
+    # Jobs to read: running ones, so event streams stay open
+    client = redis.Redis.from_url(env['REDIS_URL'])
+    prefix = f"bench-{kind}-{uuid.uuid4().hex[:8]}"
+    job_ids = [f"{prefix}-{i}" for i in range(max(args.connections, args.batch))]
+    client.mset({f"job_status:{job_id}": json.dumps({'job_id': job_id, 'status': 'PROGRESS', 'progress': 50})
+                 for job_id in job_ids})
+    batch = job_ids[:args.batch]
+
+    server = Server(kind, port, env, workdir, args.wsgi_threads)
+    try:
+        server.wait_ready()
+        results = {}
+
+        # Distinct content per upload, so none is deduplicated
+        uploads = [multipart(pdf + f"% {uuid.uuid4().hex}\n".encode(), f"slow_{i}.pdf")
+                   for i in range(args.connections)]
+
+        async def slow_uploads(stats):
+            await with_probe(args, port, stats['probe'], batch, lambda: asyncio.gather(*(
+                timed_request(stats['slow-upload'], port, 'POST', '/api/documents/upload', body, headers,
+                              pieces=args.pieces, trickle=args.trickle, timeout=args.timeout)
+                for body, headers in uploads
+            )))
+
+        async def event_streams(stats):
+            await with_probe(args, port, stats['probe'], batch, lambda: asyncio.gather(*(
+                timed_request(stats['event-streams'], port, 'GET', f"/api/jobs/{job_id}/events",
+                              hold=args.hold, timeout=args.timeout + args.hold)
+                for job_id in job_ids[:args.connections]
+            )))
+
+        document_ids = []
+
+        async def fast(stats):
+            body = json.dumps({'job_ids': batch}).encode()
+            headers = {'Content-Type': 'application/json'}
+            for i in range(args.concurrency):
+                upload, upload_headers = multipart(pdf + f"% {uuid.uuid4().hex}\n".encode(), f"fast_{i}.pdf")
+                status, data = await request(port, 'POST', '/api/documents/upload', upload, upload_headers)
+                document_ids.append(json.loads(data)['document_id'])
+            deadline = time.perf_counter() + args.seconds
+
+            async def client(i):
+                while time.perf_counter() < deadline:
+                    await timed_request(stats['fast'], port, 'POST', '/api/jobs/status', body, headers,
+                                        timeout=args.timeout)
+                    await timed_request(stats['fast'], port, 'GET', f"/api/documents/{document_ids[i]}/download",
+                                        timeout=args.timeout)
+
+            await asyncio.gather(*(client(i) for i in range(args.concurrency)))
+
+        for name, work in (('slow-upload', slow_uploads), ('event-streams', event_streams), ('fast', fast)):
+            if name in args.phases:
+                results.update(phase(server, name, work))
+        return results
+    finally:
+        server.stop()
+        client.delete(*[f"job_status:{job_id}" for job_id in job_ids])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', default='wsgi,asgi', help='comma-separated: wsgi, asgi')
+    parser.add_argument('--phases', default='slow-upload,event-streams,fast')
+    parser.add_argument('--connections', type=int, default=1000, help='slow connections at once')
+    parser.add_argument('--trickle', type=float, default=5.0, help='seconds to send each slow upload')
+    parser.add_argument('--pieces', type=int, default=10, help='pieces each slow upload is sent in')
+    parser.add_argument('--hold', type=float, default=10.0, help='seconds each event stream is held open')
+    parser.add_argument('--probe-rate', type=float, default=20.0, help='probe status reads per second')
+    parser.add_argument('--batch', type=int, default=20, help='job IDs per status read')
+    parser.add_argument('--concurrency', type=int, default=16, help='clients in the fast phase')
+    parser.add_argument('--seconds', type=float, default=10.0, help='length of the fast phase')
+    parser.add_argument('--timeout', type=float, default=60.0, help='client timeout per request')
+    parser.add_argument('--wsgi-threads', type=int, default=32, help='gunicorn gthread threads')
+    parser.add_argument('--pages', type=int, default=4)
+    parser.add_argument('--image-kb', type=int, default=8)
+    parser.add_argument('--port', type=int, default=18700)
+    args = parser.parse_args()
+    args.phases = args.phases.split(',')
+
+    # A connection per request, thousands at once
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    backend_dir = os.getcwd()
+    workdir = tempfile.mkdtemp()
+    fake_redis = None
+    try:
+        env = dict(os.environ, PYTHONPATH=backend_dir)
+        if 'REDIS_URL' not in os.environ:
+            from fakeredis import TcpFakeServer
+
+            # socketserver's default backlog of 5 resets connection bursts
+            fake_redis = type('FakeRedisServer', (TcpFakeServer,), {'request_queue_size': 1024})((HOST, args.port + 99))
+            threading.Thread(target=fake_redis.serve_forever, daemon=True).start()
+            env['REDIS_URL'] = f"redis://{HOST}:{args.port + 99}/0"
+        env.setdefault('CELERY_BROKER_URL', env['REDIS_URL'])
+        env.setdefault('CELERY_RESULT_BACKEND', env['REDIS_URL'])
+
+        with open(make_pdf(os.path.join(workdir, 'input.pdf'), args.pages, args.image_kb, seed=1), 'rb') as f:
+            pdf = f.read()
+        results = {}
+        for i, kind in enumerate(args.servers.split(',')):
+            results[kind] = run_server(args, kind, args.port + i, env, workdir, pdf)
+    finally:
+        if fake_redis is not None:
+            fake_redis.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{args.connections} slow connections (uploads of {len(pdf) // 1024} KB over {args.trickle}s, "
+          f"event streams held {args.hold}s), probe {args.probe_rate}/s, fast phase {args.concurrency} clients "
+          f"x {args.seconds}s, gunicorn gthread {args.wsgi_threads} threads")
+    columns = ('count', 'errors', 'p50_ms', 'p95_ms', 'p99_ms', 'throughput_per_s', 'peak_rss_mb', 'cpu_s',
+               'cpu_ms_per_request')
+    print(f"{'server':<8}{'phase':<22}" + ''.join(f"{column:>{len(column) + 2}}" for column in columns))
+    for kind, phases in results.items():
+        for name, summary in phases.items():
+            print(f"{kind:<8}{name:<22}" + ''.join(
+                f"{'-' if summary[column] is None else summary[column]:>{len(column) + 2}}" for column in columns
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Time document listing against a seeded table: the old full scan versus
+keyset pages, filtered pages and sparse field selection.
+
+Usage (from backend/):
+    python -m benchmarks.listing_benchmark --rows 1000000
+    DATABASE_URL=postgresql://... python -m benchmarks.listing_benchmark --rows 1000000 --reuse
+
+Without DATABASE_URL a throwaway SQLite file is used.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+
+def seed(db, Document, rows: int, batch: int = 10000) -> None:
+    statuses = ['pending', 'processing', 'completed', 'failed']
+    types = ['pdf', 'png', 'jpg']
+    users = [str(uuid.uuid4()) for _ in range(1000)]
+    start = datetime.utcnow() - timedelta(days=365)
+    for offset in range(0, rows, batch):
+        db.session.execute(Document.__table__.insert(), [
+            {
+                'id': str(uuid.uuid4()),
+                'name': f"document_{offset + i}.pdf",
+                'status': random.choice(statuses),
+                'type': random.choice(types),
+                'size': random.randint(1000, 50_000_000),
+                'user_id': random.choice(users),
+                'url': f"blobs/{uuid.uuid4().hex}",
+                'created_at': start + timedelta(seconds=offset + i),
+                'updated_at': start + timedelta(seconds=offset + i),
+            }
+            for i in range(min(batch, rows - offset))
+        ])
+        db.session.commit()
+
+
+def timed(label: str, fn, repeat: int = 5) -> None:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"{label:<40} median {timings[len(timings) // 2] * 1000:9.2f} ms   rows {result}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--reuse', action='store_true', help='Skip seeding an already seeded database')
+    parser.add_argument('--skip-full-scan', action='store_true', help='Skip the unpaginated baseline')
+    args = parser.parse_args()
+
+    if not os.getenv('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp()}/listing_benchmark.db"
+
+    from app import create_app
+    from app.extensions import db
+    from app.models.document import Document
+    from app.services.document_service import DocumentService
+
+    app = create_app()
+    with app.app_context():
+        if not args.reuse:
+            start = time.perf_counter()
+            seed(db, Document, args.rows)
+            print(f"Seeded {args.rows} rows in {time.perf_counter() - start:.1f}s")
+
+        service = DocumentService(None)
+
+        def page(**kwargs):
+            documents, _ = service.list_documents(limit=args.limit, **kwargs)
+            return len([doc.to_dict(kwargs.get('fields')) for doc in documents])
+
+        # A cursor halfway through the table, to show deep pages cost the same
+        middle = Document.query.order_by(Document.created_at.desc(), Document.id.desc()) \
+            .offset(args.rows // 2).first()
+        deep_cursor = service._encode_cursor(middle)
+
+        if not args.skip_full_scan:
+            timed('full scan (previous behaviour)', lambda: len([
+                doc.to_dict() for doc in Document.query.order_by(Document.created_at.desc()).all()
+            ]), repeat=1)
+        timed('offset page at 50%', lambda: len(
+            Document.query.order_by(Document.created_at.desc()).offset(args.rows // 2).limit(args.limit).all()
+        ))
+        timed('keyset first page', page)
+        timed('keyset page at 50%', lambda: page(cursor=deep_cursor))
+        timed('keyset page, status filter', lambda: page(status='failed'))
+        timed('keyset page, id,name,status only', lambda: page(fields=['id', 'name', 'status']))
+
+
+if __name__ == '__main__':
+    main()
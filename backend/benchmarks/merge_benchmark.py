@@ -0,0 +1,69 @@
+"""
+Compare peak memory and throughput of the streaming merger against PdfMerger.
+
+Usage (from backend/):
+    python -m benchmarks.merge_benchmark --files 10 --pages 20 --image-kb 512
+
+Each mode runs in a fresh subprocess so ru_maxrss reflects only that merge.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import make_pdf
+
+
+def run_merge(streaming: bool, inputs, output_dir) -> dict:
+    from app.services.pdf_service import PdfService
+
+    os.makedirs('storage', exist_ok=True)
+    output_name = f"bench_{'streaming' if streaming else 'pdfmerger'}.pdf"
+    start = time.perf_counter()
+    output_path = PdfService.merge_pdfs(inputs, output_name, streaming=streaming)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(output_path)
+    os.remove(output_path)
+    return {
+        'mode': 'streaming' if streaming else 'pdfmerger',
+        'seconds': round(elapsed, 3),
+        'input_mb': round(sum(os.path.getsize(p) for p in inputs) / 1e6, 1),
+        'output_mb': round(size / 1e6, 1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--image-kb', type=int, default=512)
+    parser.add_argument('--child', choices=['streaming', 'pdfmerger'], help=argparse.SUPPRESS)
+    parser.add_argument('inputs', nargs='*', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_merge(args.child == 'streaming', args.inputs, None)))
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        inputs = [
+            make_pdf(os.path.join(workdir, f"input_{i}.pdf"), args.pages, args.image_kb)
+            for i in range(args.files)
+        ]
+        for mode in ('pdfmerger', 'streaming'):
+            result = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.merge_benchmark', '--child', mode, *inputs],
+                check=True, capture_output=True, text=True,
+            )
+            stats = json.loads(result.stdout.strip().splitlines()[-1])
+            stats['mb_per_s'] = round(stats['input_mb'] / max(stats['seconds'], 1e-9), 1)
+            print(json.dumps(stats))
+
+
+if __name__ == '__main__':
+    main()
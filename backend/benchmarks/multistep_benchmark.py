@@ -0,0 +1,129 @@
+"""
+A multi-step workflow (merge, then compress, optionally linearize) run as
+separate chained jobs versus as one pipeline job.
+
+Chained, every job fetches its input from storage, parses it, writes its
+whole output back and updates the document before the next job starts.
+The pipeline fetches the inputs once, runs the steps over the pages in
+one pass and stores only the final output.
+
+Usage (from backend/):
+    python -m benchmarks.multistep_benchmark --inputs 3 --pages 8 --runs 5
+    python -m benchmarks.multistep_benchmark --linearize   # needs pikepdf
+
+Tasks run eagerly in this process, so broker round trips and queue waits
+between chained jobs, which the pipeline also saves, are not included.
+Needs Redis at REDIS_URL; without DATABASE_URL a throwaway SQLite file is
+used.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks.synthetic import make_pdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--inputs', type=int, default=3)
+    parser.add_argument('--pages', type=int, default=8, help='pages per input')
+    parser.add_argument('--image-kb', type=int, default=256)
+    parser.add_argument('--image-quality', type=int, default=60)
+    parser.add_argument('--linearize', action='store_true')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    sources = [
+        make_pdf(os.path.join(workdir, f"input_{i}.pdf"), pages=args.pages, image_kb=args.image_kb, seed=i)
+        for i in range(args.inputs)
+    ]
+    # Scratch and local storage go to the temporary directory
+    sys.path.insert(0, os.getcwd())
+    os.chdir(workdir)
+
+    from app import create_app, tasks
+    from app.extensions import celery, db
+    from app.models.blob import Blob
+    from app.models.document import Document
+    from app.services.document_service import DocumentService
+    from app.services.pdf_service import shutdown_page_pool
+
+    app = create_app()
+    celery.conf.update(task_always_eager=True, task_eager_propagates=True,
+                       result_backend='cache+memory://')
+    steps = ['merge_pdfs', {'operation': 'compress_pdf', 'params': {'image_quality': args.image_quality}}]
+    if args.linearize:
+        steps.append('linearize')
+
+    try:
+        with app.app_context():
+            db.create_all()
+            blob_service = tasks.get_blob_service()
+            blobs = [blob_service.put_path(shutil.copy(source, f"copy_{i}.pdf")) for i, source in enumerate(sources)]
+            blob_ids = [blob.id for blob in blobs]
+            blob_keys = [blob.path for blob in blobs]
+            plan = DocumentService.plan_pipeline(steps, len(blobs))
+
+            def new_output():
+                # Each job takes over one reference per input, as the API gives it
+                Blob.query.filter(Blob.id.in_(blob_ids)).update({Blob.ref_count: Blob.ref_count + 1})
+                db.session.commit()
+                return Document(name='merged.pdf', type='pdf', status='pending').save().id
+
+            def chained():
+                document_id = new_output()
+                tasks.process_document.apply(args=(document_id, 'merge_pdfs', {
+                    'pdf_keys': blob_keys, 'input_blob_ids': blob_ids,
+                    'output_filename': f"{document_id}_merged.pdf"
+                })).get()
+                # A finished document is not processed again; reopen it for the next step
+                Document.transition_status(document_id, 'completed', 'pending')
+                tasks.process_document.apply(args=(document_id, 'compress_pdf', {
+                    'image_quality': args.image_quality, 'linearize': args.linearize
+                })).get()
+                return document_id, None
+
+            def pipeline():
+                document_id = new_output()
+                result = tasks.process_pipeline.apply(args=(document_id, plan, {
+                    'input_keys': blob_keys, 'input_blob_ids': blob_ids
+                })).get()
+                return document_id, result['timings']
+
+            print(f"{' -> '.join(plan['operations'])}: {args.inputs} inputs x {args.pages} pages "
+                  f"x {args.image_kb} KB, {args.runs} runs")
+            results = {}
+            step_timings = defaultdict(list)
+            for label, workflow in (('chained', chained), ('pipeline', pipeline)):
+                workflow()  # warm-up: page pool, connections
+                durations, sizes = [], []
+                for _ in range(args.runs):
+                    start = time.perf_counter()
+                    document_id, timings = workflow()
+                    durations.append(time.perf_counter() - start)
+                    document = db.session.get(Document, document_id)
+                    assert document.status == 'completed', document.status
+                    sizes.append(document.size)
+                    for name, seconds in (timings or {}).items():
+                        step_timings[name].append(seconds)
+                results[label] = statistics.median(durations)
+                print(f"{label:<9} median {results[label] * 1000:8.1f} ms   "
+                      f"min {min(durations) * 1000:8.1f} ms   output {sizes[-1] / 1024:8.0f} KB")
+            print(f"pipeline is {results['chained'] / results['pipeline']:.2f}x the speed of chained jobs")
+            print('pipeline step timings, median (page steps summed over pool processes):')
+            for name, values in step_timings.items():
+                print(f"  {name:<15} {statistics.median(values) * 1000:8.1f} ms")
+    finally:
+        shutdown_page_pool()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+OCR throughput, in pages per second and per pool process, with an empty
+cache, for a re-upload of the same file and for a merge that contains the
+already OCRed pages plus as many new ones.
+
+Usage (from backend/):
+    python -m benchmarks.ocr_benchmark --pages 16
+    PDF_WORKERS=4 python -m benchmarks.ocr_benchmark --pages 32 --dpi 300
+
+Needs the tesseract binary and Redis at REDIS_URL (the OCR cache; entries
+are written under a separate prefix and removed afterwards).
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import make_scan_pdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=16)
+    parser.add_argument('--dpi', type=int, default=150)
+    parser.add_argument('--language', default='eng')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    scanned = make_scan_pdf(os.path.join(workdir, 'scan.pdf'), pages=args.pages, dpi=args.dpi, seed=1)
+    other = make_scan_pdf(os.path.join(workdir, 'other.pdf'), pages=args.pages, dpi=args.dpi, seed=2)
+    # Outputs go to storage/ under the temporary directory
+    sys.path.insert(0, os.getcwd())
+    os.chdir(workdir)
+    os.makedirs('storage')
+
+    from app.config.config import BaseConfig
+    from app.services import pdf_page_ops
+    from app.services.ocr_cache import OcrCache
+    from app.services.pdf_service import PdfService, get_page_pool, shutdown_page_pool
+
+    cache = OcrCache()
+    cache.PREFIX = f"ocr_cache_benchmark_{os.getpid()}"
+    workers = BaseConfig.PDF_WORKERS or os.cpu_count() or 1
+    merged = PdfService.merge_pdfs([scanned, other], 'merged.pdf')
+
+    def run(label: str, source: str):
+        total = pdf_page_ops.page_count(source)
+        keys = [key for key in pdf_page_ops.ocr_page_keys(source, 0, total) if key]
+        hits = len(cache.get_many(keys, args.language))
+        start = time.perf_counter()
+        PdfService.ocr_pdf(source, f"{label}_ocr.pdf", language=args.language, cache=cache)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<10} {total:5d} pages  {hits:5d} cached  {elapsed:7.2f} s  "
+              f"{total / elapsed:7.2f} pages/s  {total / elapsed / workers:7.2f} pages/s/process")
+
+    try:
+        print(f"{args.pages}-page scans at {args.dpi} dpi, {workers} pool processes")
+        # Start the pool processes before timing
+        list(get_page_pool().map(abs, range(workers * 4)))
+        run('cold', scanned)
+        run('re-upload', scanned)
+        run('merge', merged)
+    finally:
+        keys = list(cache.redis.scan_iter(f"{cache.PREFIX}:*"))
+        if keys:
+            cache.redis.delete(*keys)
+        shutdown_page_pool()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Time-to-first-page for a large document: parsing the whole PDF to pull out
+one page versus extracting it through the cached page-offset index.
+
+Usage (from backend/):
+    python -m benchmarks.page_preview_benchmark --pages 500 --image-kb 256
+
+Needs Redis at REDIS_URL for the index; files are kept in a temporary
+local storage root.
+"""
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.synthetic import make_pdf
+
+
+def timed(label: str, fn, repeat: int = 5) -> None:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"{label:<40} median {timings[len(timings) // 2] * 1000:9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--image-kb', type=int, default=256)
+    args = parser.parse_args()
+
+    from PyPDF2 import PdfReader, PdfWriter
+    from app.services.page_index import PageIndexService
+    from app.services.storage_backends import LocalStorageBackend
+    from app.services.storage_service import StorageService
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = make_pdf(os.path.join(tmp, 'source.pdf'), pages=args.pages, image_kb=args.image_kb)
+        print(f"document: {args.pages} pages, {os.path.getsize(source) / 1e6:.1f} MB")
+        key = 'bench/source.pdf'
+        backend = LocalStorageBackend(os.path.join(tmp, 'root'))
+        os.makedirs(os.path.dirname(backend.path(key)), exist_ok=True)
+        shutil.copy(source, backend.path(key))
+        service = PageIndexService(StorageService(backend))
+        digest = f"bench-{os.getpid()}"
+
+        def full_parse(number):
+            reader = PdfReader(source)
+            writer = PdfWriter()
+            writer.add_page(reader.pages[number - 1])
+            writer.write(io.BytesIO())
+
+        timed('full parse, first page', lambda: full_parse(1))
+        timed('full parse, last page', lambda: full_parse(args.pages))
+        timed('index build (once per document)', lambda: service.build(digest, key), repeat=1)
+        timed('indexed, first page', lambda: service.extract_page(digest, key, 1))
+        timed('indexed, last page', lambda: service.extract_page(digest, key, args.pages))
+        service.redis.delete(service._key(digest))
+
+
+if __name__ == '__main__':
+    main()
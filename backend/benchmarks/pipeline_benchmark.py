@@ -0,0 +1,402 @@
+"""
+End-to-end load test of the document pipeline: upload, process, merge,
+job polling and download, each run as its own phase at a fixed
+concurrency. For every stage it reports p50/p95/p99 latency, throughput
+and the server's peak RSS during that phase; for jobs, time per page.
+
+Usage (from backend/):
+    # Everything in this process: temporary SQLite, fakeredis, inline jobs
+    python -m benchmarks.pipeline_benchmark --redis fake --celery eager
+
+    # Jobs on an in-process Celery worker (memory broker), local Postgres and Redis
+    DATABASE_URL=postgresql://... python -m benchmarks.pipeline_benchmark --celery worker --workers 4
+
+    # A running deployment; RSS is sampled when the server's PID is given
+    python -m benchmarks.pipeline_benchmark --url http://localhost:5001 --server-pid 1234
+
+    # Record a baseline, then fail (exit 1) on regressions against it
+    python -m benchmarks.pipeline_benchmark --json baseline.json
+    python -m benchmarks.pipeline_benchmark --compare baseline.json --tolerance 0.2
+
+Inputs are synthetic PDFs generated from --seed, so every run sends the
+same bytes; each document is distinct, so neither blob deduplication nor
+the merge result cache short-circuits the work. In-process runs lift the
+per-tenant job limits; against a deployment, 429 responses are retried
+and counted.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from benchmarks.synthetic import make_pdf
+
+_worker = None
+
+TERMINAL = {'SUCCESS', 'FAILURE', 'REVOKED'}
+
+
+class Stats:
+    """Latencies and errors of one stage."""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.retries = 0
+        self.wall = 0.0
+        self.peak_rss: Optional[int] = None
+        self.per_page: List[float] = []
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool = True) -> None:
+        with self._lock:
+            self.latencies.append(seconds)
+            self.errors += 0 if ok else 1
+
+    @staticmethod
+    def percentile(values: List[float], p: float) -> Optional[float]:
+        if not values:
+            return None
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+    def summary(self) -> dict:
+        ms = lambda value: None if value is None else round(value * 1000, 1)
+        return {
+            'count': len(self.latencies),
+            'errors': self.errors,
+            'retries': self.retries,
+            'p50_ms': ms(self.percentile(self.latencies, 0.50)),
+            'p95_ms': ms(self.percentile(self.latencies, 0.95)),
+            'p99_ms': ms(self.percentile(self.latencies, 0.99)),
+            'throughput_per_s': round(len(self.latencies) / self.wall, 2) if self.wall else None,
+            'peak_rss_mb': round(self.peak_rss / 1e6, 1) if self.peak_rss else None,
+            'ms_per_page_p50': ms(self.percentile(self.per_page, 0.50)),
+        }
+
+
+class RssSampler:
+    """Peak resident memory of a process and its children, sampled from /proc."""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.02):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def tree_rss(pid: int) -> int:
+        total = 0
+        pending = [pid]
+        while pending:
+            current = pending.pop()
+            try:
+                with open(f"/proc/{current}/status") as f:
+                    total += next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmRSS:'))
+                for task in os.listdir(f"/proc/{current}/task"):
+                    with open(f"/proc/{current}/task/{task}/children") as f:
+                        pending.extend(int(child) for child in f.read().split())
+            except (OSError, StopIteration):
+                continue
+        return total
+
+    def __enter__(self):
+        if self.pid and os.path.exists(f"/proc/{self.pid}"):
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.tree_rss(self.pid))
+            self._stop.wait(self.interval)
+
+
+class Client:
+    """HTTP calls to the API, timed into the stage they belong to."""
+
+    def __init__(self, base_url: str, token: Optional[str] = None):
+        self.base_url = base_url.rstrip('/')
+        self.headers = {'Authorization': f"Bearer {token}"} if token else {}
+
+    def request(self, stats: Stats, method: str, path: str, body: bytes = None,
+                content_type: str = None, retries: int = 50) -> Optional[bytes]:
+        headers = dict(self.headers)
+        if content_type:
+            headers['Content-Type'] = content_type
+        for _ in range(retries):
+            start = time.perf_counter()
+            try:
+                request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+                with urllib.request.urlopen(request, timeout=300) as response:
+                    data = response.read()
+                stats.record(time.perf_counter() - start)
+                return data
+            except urllib.error.HTTPError as e:
+                if e.code == 429:
+                    # Tenant limits: back off without counting the attempt as a result
+                    stats.retries += 1
+                    time.sleep(0.5)
+                    continue
+                stats.record(time.perf_counter() - start, ok=False)
+                return None
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                stats.record(time.perf_counter() - start, ok=False)
+                return None
+        stats.record(0, ok=False)
+        return None
+
+    def post_json(self, stats: Stats, path: str, payload: dict) -> Optional[dict]:
+        data = self.request(stats, 'POST', path, json.dumps(payload).encode(), 'application/json')
+        return json.loads(data) if data else None
+
+    def post_files(self, stats: Stats, path: str, field: str, paths: List[str]) -> Optional[dict]:
+        boundary = uuid.uuid4().hex
+        body = b''
+        for file_path in paths:
+            with open(file_path, 'rb') as f:
+                content = f.read()
+            body += (
+                f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; "
+                f"filename=\"{os.path.basename(file_path)}\"\r\nContent-Type: application/pdf\r\n\r\n"
+            ).encode() + content + b"\r\n"
+        body += f"--{boundary}--\r\n".encode()
+        data = self.request(stats, 'POST', path, body, f"multipart/form-data; boundary={boundary}")
+        return json.loads(data) if data else None
+
+
+def run_phase(name: str, items, work, concurrency: int, stats: Dict[str, Stats], server_pid: Optional[int]):
+    """Run work(item) for every item at the given concurrency; returns the results in order."""
+    print(f"  {name} ({len(items)})...", file=sys.stderr)
+    with RssSampler(server_pid) as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(work, items))
+        wall = time.perf_counter() - start
+    for stage in stats.values():
+        if stage.wall == 0 and stage.latencies:
+            stage.wall = wall
+            stage.peak_rss = sampler.peak or None
+    return results
+
+
+def start_in_process(args, workdir: str) -> str:
+    """Build the app in this process and serve it on a local port; returns its URL."""
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    # The harness is a handful of tenants submitting far faster than real users
+    os.environ.setdefault('USER_JOBS_PER_MINUTE', '1000000')
+    os.environ.setdefault('USER_MAX_ACTIVE_JOBS', '1000000')
+    if args.redis == 'fake':
+        import fakeredis
+        import redis
+
+        fake_server = fakeredis.FakeServer()
+        redis.Redis.from_url = classmethod(lambda cls, *a, **kw: fakeredis.FakeRedis(server=fake_server))
+
+    from werkzeug.serving import make_server
+    from app import create_app, tasks
+    from app.extensions import db, get_celery
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+
+    celery = get_celery()
+    celery.conf.update(broker_url='memory://', result_backend='cache+memory://',
+                       task_always_eager=args.celery == 'eager', task_eager_propagates=False)
+    if args.celery == 'worker':
+        from celery.contrib.testing.worker import start_worker
+        from celery.signals import task_postrun, task_prerun
+
+        contexts = threading.local()
+
+        # Pool threads have no Flask app context of their own
+        @task_prerun.connect(weak=False)
+        def push_context(**kwargs):
+            contexts.context = app.app_context()
+            contexts.context.push()
+
+        @task_postrun.connect(weak=False)
+        def pop_context(**kwargs):
+            db.session.remove()
+            contexts.context.pop()
+
+        # Held at module level: a collected context manager stops its worker
+        global _worker
+        _worker = start_worker(celery, pool='threads', concurrency=args.workers, perform_ping_check=False,
+                               queues='interactive,merge,transform,celery', shutdown_timeout=60)
+        _worker.__enter__()
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def run(args, base_url: str, inputs: List[str], merge_sets: List[List[str]]) -> Dict[str, dict]:
+    stats = {name: Stats() for name in ('upload', 'process', 'merge', 'poll', 'job', 'download')}
+    server_pid = args.server_pid or (None if args.url else os.getpid())
+    tokens = make_tokens(args)
+    client_for = lambda i: Client(base_url, tokens[i % len(tokens)] if tokens else None)
+
+    def phase(name, items, work):
+        return run_phase(name, items, work, args.concurrency, {name: stats[name]}, server_pid)
+
+    # Upload, then queue a job per document
+    uploaded = phase('upload', list(enumerate(inputs)), lambda item: client_for(item[0]).post_files(
+        stats['upload'], '/api/documents/upload', 'file', [item[1]]))
+    document_ids = [result['document_id'] for result in uploaded if result]
+    submitted = phase('process', list(enumerate(document_ids)), lambda item: (
+        item[1], time.perf_counter(), client_for(item[0]).post_json(
+            stats['process'], '/api/documents/process',
+            {'document_id': item[1], 'operation': args.operation})
+    ))
+    jobs = [(document_id, queued_at, result['job_id'], args.pages)
+            for document_id, queued_at, result in submitted if result]
+
+    merged = phase('merge', list(enumerate(merge_sets)), lambda item: (
+        time.perf_counter(), client_for(item[0]).post_files(stats['merge'], '/api/documents/merge', 'files[]', item[1])
+    ))
+    jobs += [(result['document_id'], queued_at, result['job_id'], args.pages * args.merge_files)
+             for queued_at, result in merged if result and result.get('job_id')]
+
+    def wait(item):
+        i, (document_id, queued_at, job_id, pages) = item
+        client = client_for(i)
+        while True:
+            response = client.post_json(stats['poll'], '/api/jobs/status', {'job_ids': [job_id]})
+            status = response['jobs'][0].get('status') if response else 'FAILURE'
+            if status in TERMINAL:
+                elapsed = time.perf_counter() - queued_at
+                stats['job'].record(elapsed, ok=status == 'SUCCESS')
+                with stats['job']._lock:
+                    stats['job'].per_page.append(elapsed / pages)
+                return document_id if status == 'SUCCESS' else None
+            time.sleep(args.poll_interval)
+
+    finished = run_phase('poll', list(enumerate(jobs)), wait, args.concurrency,
+                         {'poll': stats['poll'], 'job': stats['job']}, server_pid)
+    phase('download', [(i, document_id) for i, document_id in enumerate(finished) if document_id],
+          lambda item: client_for(item[0]).request(stats['download'], 'GET', f"/api/documents/{item[1]}/download"))
+    return {name: stage.summary() for name, stage in stats.items() if stage.latencies}
+
+
+def make_tokens(args) -> List[str]:
+    """One bearer token per simulated tenant, when the signing secret is known."""
+    secret = args.secret or (None if args.url else os.getenv('SECRET_KEY', 'your-secret-key'))
+    if not secret:
+        return []
+    import jwt
+
+    now = int(time.time())
+    return [jwt.encode({'sub': f"bench-{i}", 'iat': now, 'exp': now + 3600}, secret, algorithm='HS256')
+            for i in range(args.tenants)]
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Stages whose p95 latency grew or throughput fell by more than tolerance."""
+    regressions = []
+    for stage, current in results.items():
+        before = baseline.get(stage)
+        if not before:
+            continue
+        if before['p95_ms'] and current['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{stage}: p95 {before['p95_ms']} -> {current['p95_ms']} ms")
+        if before['throughput_per_s'] and current['throughput_per_s'] < before['throughput_per_s'] * (1 - tolerance):
+            regressions.append(f"{stage}: throughput {before['throughput_per_s']} -> {current['throughput_per_s']}/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='running API; default: start one in this process')
+    parser.add_argument('--server-pid', type=int, help='PID of the server under --url, for RSS')
+    parser.add_argument('--redis', choices=['fake', 'url'], default='url',
+                        help='in-process: fakeredis, or Redis at REDIS_URL')
+    parser.add_argument('--celery', choices=['eager', 'worker'], default='eager',
+                        help='in-process: run jobs inline, or on an in-process worker')
+    parser.add_argument('--workers', type=int, default=4, help='in-process worker threads')
+    parser.add_argument('--documents', type=int, default=50)
+    parser.add_argument('--merges', type=int, default=10)
+    parser.add_argument('--merge-files', type=int, default=3)
+    parser.add_argument('--pages', type=int, default=4)
+    parser.add_argument('--image-kb', type=int, default=64)
+    parser.add_argument('--operation', default='compress_pdf')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--tenants', type=int, default=16)
+    parser.add_argument('--secret', help='JWT secret of the API under --url, to spread jobs over tenants')
+    parser.add_argument('--poll-interval', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write the results here')
+    parser.add_argument('--compare', help='results JSON of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+    # In-process runs change directory; result paths are relative to where we started
+    args.json = args.json and os.path.abspath(args.json)
+    args.compare = args.compare and os.path.abspath(args.compare)
+
+    workdir = tempfile.mkdtemp()
+    try:
+        print('generating inputs...', file=sys.stderr)
+        inputs = [make_pdf(os.path.join(workdir, f"doc_{i}.pdf"), args.pages, args.image_kb, seed=args.seed + i)
+                  for i in range(args.documents)]
+        merge_sets = [
+            [make_pdf(os.path.join(workdir, f"merge_{i}_{j}.pdf"), args.pages, args.image_kb,
+                      seed=args.seed + 100000 + i * args.merge_files + j)
+             for j in range(args.merge_files)]
+            for i in range(args.merges)
+        ]
+        if args.url:
+            base_url = args.url
+        else:
+            # Scratch and local storage go to the temporary directory
+            sys.path.insert(0, os.getcwd())
+            os.chdir(workdir)
+            base_url = start_in_process(args, workdir)
+
+        start = time.perf_counter()
+        results = run(args, base_url, inputs, merge_sets)
+        total = time.perf_counter() - start
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{args.documents} x {args.operation}, {args.merges} merges of {args.merge_files}, "
+          f"{args.pages} pages x {args.image_kb} KB, concurrency {args.concurrency}, {total:.1f}s")
+    columns = ('count', 'errors', 'retries', 'p50_ms', 'p95_ms', 'p99_ms', 'throughput_per_s',
+               'peak_rss_mb', 'ms_per_page_p50')
+    print(f"{'stage':<10}" + ''.join(f"{column:>{len(column) + 2}}" for column in columns))
+    for stage, summary in results.items():
+        print(f"{stage:<10}" + ''.join(
+            f"{'-' if summary[column] is None else summary[column]:>{len(column) + 2}}" for column in columns
+        ))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
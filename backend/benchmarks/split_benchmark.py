@@ -0,0 +1,77 @@
+"""
+Split a large PDF into single-page documents: the one-off page index scan,
+then writing every part by byte copy (PdfService.split_pdf), with the peak
+Python heap of each, against PyPDF2 writing the same parts for a sample.
+
+Usage (from backend/):
+    python -m benchmarks.split_benchmark --pages 2000
+    python -m benchmarks.split_benchmark --pages 2000 --image-kb 512 --baseline 100
+
+Runs on files only; no database, Redis or worker needed.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic import make_pdf
+
+
+def measure(label: str, pages: int, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<22} {pages:6d} pages  {elapsed:8.2f} s  {pages / elapsed:9.0f} pages/s  "
+          f"peak heap {peak / 2 ** 20:7.1f} MiB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=2000)
+    parser.add_argument('--image-kb', type=int, default=64)
+    parser.add_argument('--baseline', type=int, default=50, help='pages to split with PyPDF2 for comparison')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    source = make_pdf(os.path.join(workdir, 'source.pdf'), pages=args.pages, image_kb=args.image_kb, seed=1)
+    # Parts go to storage/ under the temporary directory
+    sys.path.insert(0, os.getcwd())
+    os.chdir(workdir)
+    os.makedirs('storage')
+
+    from PyPDF2 import PdfReader, PdfWriter
+    from app.services.page_index import PageIndexService
+    from app.services.pdf_service import PdfService
+
+    try:
+        print(f"{args.pages}-page source, {os.path.getsize(source) / 2 ** 20:.0f} MiB")
+        index = measure('index scan (once)', args.pages, lambda: PageIndexService.scan(source))
+        parts = [[number] for number in range(1, args.pages + 1)]
+        paths = measure('split by byte copy', args.pages,
+                        lambda: PdfService.split_pdf(source, index, parts, 'part'))
+        assert len(PdfReader(paths[-1]).pages) == 1
+        for path in paths:
+            os.remove(path)
+
+        def split_parsed():
+            reader = PdfReader(source)
+            for number in range(args.baseline):
+                writer = PdfWriter()
+                writer.add_page(reader.pages[number])
+                with open(f"storage/parsed_{number}.pdf", 'wb') as output:
+                    writer.write(output)
+
+        measure('split with PyPDF2', args.baseline, split_parsed)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+API cold-start cost: what `import wsgi` spends importing, and how long a
+fresh server process takes to answer its first /api/health.
+
+Usage (from backend/):
+    python -m benchmarks.startup_benchmark --runs 5
+    python -m benchmarks.startup_benchmark --server flask --top 25
+
+Each run is a new interpreter started in a throwaway directory, as a new
+replica would be. The health response only has to arrive, not be healthy,
+so no database or Redis is needed; STORAGE_BACKEND and the rest are taken
+from the environment.
+"""
+import argparse
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORTTIME = re.compile(r'import time:\s+\d+ \|\s+(\d+) \| *(\S+)')
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run_python(args, workdir: str, **kwargs) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR)
+    return subprocess.run([sys.executable] + args, cwd=workdir, env=env,
+                          capture_output=True, text=True, check=True, **kwargs)
+
+
+def import_profile(workdir: str) -> dict:
+    """Cumulative import time (us) of every top-level package imported by wsgi."""
+    stderr = run_python(['-X', 'importtime', '-c', 'import wsgi'], workdir).stderr
+    packages = {}
+    for cumulative, name in IMPORTTIME.findall(stderr):
+        # A package's outermost import has the largest cumulative time
+        root = name.split('.')[0]
+        packages[root] = max(packages.get(root, 0), int(cumulative))
+    return packages
+
+
+def time_to_first_health(workdir: str, server: str) -> tuple:
+    port = free_port()
+    if server == 'gunicorn':
+        command = ['-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', '1', 'wsgi:app']
+    else:
+        command = ['-m', 'flask', '--app', 'wsgi', 'run', '--port', str(port)]
+    url = f"http://127.0.0.1:{port}/api/health"
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable] + command, cwd=workdir,
+                               env=dict(os.environ, PYTHONPATH=BACKEND_DIR),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"{server} exited with {process.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=5) as response:
+                    status = response.status
+                break
+            except urllib.error.HTTPError as e:
+                status = e.code
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        return time.perf_counter() - start, status
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def median(values):
+    return sorted(values)[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--server', choices=['gunicorn', 'flask'], default='gunicorn')
+    parser.add_argument('--top', type=int, default=15, help='heaviest packages to list')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        interpreter, imports, first_health = [], [], []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            run_python(['-c', 'pass'], workdir)
+            interpreter.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            run_python(['-c', 'import wsgi'], workdir)
+            imports.append(time.perf_counter() - start)
+            elapsed, status = time_to_first_health(workdir, args.server)
+            first_health.append(elapsed)
+
+        print(f"median of {args.runs} runs")
+        print(f"  bare interpreter          {median(interpreter) * 1000:8.1f} ms")
+        print(f"  python -c 'import wsgi'   {median(imports) * 1000:8.1f} ms")
+        print(f"  first /api/health ({args.server}) {median(first_health) * 1000:8.1f} ms  (HTTP {status})")
+
+        packages = import_profile(workdir)
+        print(f"\nheaviest imports of wsgi (python -X importtime, cumulative)")
+        for name, cumulative in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"  {name:<28} {cumulative / 1000:8.1f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
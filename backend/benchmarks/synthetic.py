@@ -0,0 +1,90 @@
+import os
+import random
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+WORDS = (
+    'invoice', 'payment', 'account', 'total', 'amount', 'customer', 'order', 'delivery',
+    'address', 'number', 'date', 'balance', 'service', 'period', 'contract', 'signature',
+)
+
+
+def make_pdf(path: str, pages: int = 10, image_kb: int = 256, seed: Optional[int] = None) -> str:
+    """
+    Write a synthetic scan-like PDF: one uncompressible image per page
+    plus a font shared by every page. With seed, the same bytes every time.
+    """
+    randbytes = os.urandom if seed is None else random.Random(seed).randbytes
+    side = max(1, int((image_kb * 1024 / 3) ** 0.5))
+    images = ((side, side, b"/ColorSpace /DeviceRGB", randbytes(side * side * 3)) for _ in range(pages))
+    return _write_image_pages(path, images)
+
+
+def make_scan_pdf(path: str, pages: int = 10, dpi: int = 150, seed: Optional[int] = None) -> str:
+    """
+    Write a synthetic scanned document for OCR: each page one grayscale
+    image of printed lines of words. With seed, the same bytes every time.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    rng = random.Random(seed)
+    font = ImageFont.load_default()
+    width, height = int(8.5 * dpi), 11 * dpi
+
+    def scans():
+        for _ in range(pages):
+            # Drawn small and scaled up: the default bitmap font is too small to read
+            small = Image.new('L', (width // 3, height // 3), 255)
+            draw = ImageDraw.Draw(small)
+            for y in range(16, small.height - 24, 14):
+                draw.text((16, y), ' '.join(rng.choice(WORDS) for _ in range(6)), fill=0, font=font)
+            image = small.resize((width, height))
+            yield (width, height, b"/ColorSpace /DeviceGray /Filter /FlateDecode",
+                   zlib.compress(image.tobytes()))
+
+    return _write_image_pages(path, scans())
+
+
+def _write_image_pages(path: str, images: Iterable[Tuple[int, int, bytes, bytes]]) -> str:
+    """One page per (width, height, image dictionary entries, data), each with a 'Page N' label."""
+    images = list(images)
+    pages = len(images)
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_ref = len(objects) + 1 + pages * 3
+    kids = []
+    for number, (width, height, entries, data) in enumerate(images):
+        image = add(
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d "
+            b"%s /BitsPerComponent 8 /Length %d >>\nstream\n"
+            % (width, height, entries, len(data)) + data + b"\nendstream"
+        )
+        content = b"q 612 0 0 792 0 0 cm /Im0 Do Q BT /F1 12 Tf 20 20 Td (Page %d) Tj ET" % (number + 1)
+        contents = add(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 %d 0 R >> /XObject << /Im0 %d 0 R >> >> "
+            b"/Contents %d 0 R >>" % (pages_ref, font, image, contents)
+        ))
+    add(b"<< /Type /Pages /Kids [%s] /Count %d >>"
+        % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_ref)
+
+    with open(path, "wb") as output:
+        output.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(output.tell())
+            output.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = output.tell()
+        output.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            output.write(b"%010d 00000 n \n" % offset)
+        output.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                     % (len(objects) + 1, catalog, xref))
+    return path
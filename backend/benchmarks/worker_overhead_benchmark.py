@@ -0,0 +1,95 @@
+"""
+Per-task overhead of tiny jobs with a cold versus a warm worker process.
+
+"cold" rebuilds what tasks used to create per call: storage client, blob
+service, database connection and the page process pool. "warm" reuses
+them, as app.worker now sets up once per process.
+
+Usage (from backend/):
+    python -m benchmarks.worker_overhead_benchmark --tasks 50
+    DATABASE_URL=postgresql://... STORAGE_BACKEND=s3 ... python -m benchmarks.worker_overhead_benchmark
+
+Tasks run eagerly in this process. Needs Redis at REDIS_URL; without
+DATABASE_URL a throwaway SQLite file is used.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import make_pdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, default=50)
+    parser.add_argument('--operation', choices=['compress_pdf', 'merge_pdfs'], default='compress_pdf')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    source = make_pdf(os.path.join(workdir, 'tiny.pdf'), pages=1, image_kb=16)
+    # Scratch and local storage go to the temporary directory
+    sys.path.insert(0, os.getcwd())
+    os.chdir(workdir)
+
+    from app import create_app, tasks
+    from app.extensions import celery, db
+    from app.models.blob import Blob
+    from app.models.document import Document
+    from app.services.pdf_service import shutdown_page_pool
+    from app.services.storage_backends import get_storage_backend
+
+    app = create_app()
+    celery.conf.update(task_always_eager=True, task_eager_propagates=True,
+                       result_backend='cache+memory://')
+
+    def cold_start():
+        get_storage_backend.cache_clear()
+        tasks.get_blob_service.cache_clear()
+        shutdown_page_pool()
+        db.session.remove()
+        db.engine.dispose()
+
+    try:
+        with app.app_context():
+            db.create_all()
+            blob = tasks.get_blob_service().put_path(shutil.copy(source, 'input.pdf'))
+            # Plain values: cold runs drop the session the blob was loaded in
+            blob_id, blob_key, blob_size = blob.id, blob.path, blob.size
+
+            def run(label: str, before_each=None):
+                document_ids = Document.bulk_create([
+                    {'name': 'tiny.pdf', 'type': 'pdf', 'size': blob_size, 'status': 'pending',
+                     'blob_id': blob_id, 'url': blob_key}
+                    for _ in range(args.tasks)
+                ])
+                # Each document holds a reference to the input blob
+                Blob.query.filter_by(id=blob_id).update({Blob.ref_count: Blob.ref_count + args.tasks})
+                db.session.commit()
+                params = {'pdf_keys': [blob_key, blob_key], 'output_filename': 'bench.pdf'} \
+                    if args.operation == 'merge_pdfs' else {}
+                timings = []
+                for document_id in document_ids:
+                    if before_each:
+                        before_each()
+                    start = time.perf_counter()
+                    tasks.process_document.apply(args=(document_id, args.operation, params)).get()
+                    timings.append(time.perf_counter() - start)
+                timings.sort()
+                print(f"{label:<6} median {timings[len(timings) // 2] * 1000:8.1f} ms   "
+                      f"p95 {timings[int(len(timings) * 0.95)] * 1000:8.1f} ms   "
+                      f"total {sum(timings):6.2f} s")
+
+            print(f"{args.tasks} x {args.operation} of a 1-page PDF")
+            run('cold', cold_start)
+            run('warm')
+    finally:
+        shutdown_page_pool()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -16,10 +16,96 @@ class Config:
     AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
     AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
     AWS_S3_BUCKET = os.getenv('AWS_S3_BUCKET')
+    AWS_S3_ENDPOINT_URL = os.getenv('AWS_S3_ENDPOINT_URL')  # e.g. MinIO
+    AWS_REGION = os.getenv('AWS_REGION')
+    
+    # Storage
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')  # 'local' or 's3'
+    S3_MAX_POOL_CONNECTIONS = int(os.getenv('S3_MAX_POOL_CONNECTIONS', 32))
+    S3_PART_SIZE = int(os.getenv('S3_PART_SIZE', 8 * 1024 * 1024))
+    S3_MAX_CONCURRENCY = int(os.getenv('S3_MAX_CONCURRENCY', 8))
+    
+    # Downloads: 'stream' (served by the app, Range-aware), 'accel' (nginx
+    # X-Accel-Redirect, local storage) or 'presign' (redirect to the object store)
+    DOWNLOAD_MODE = os.getenv('DOWNLOAD_MODE', 'stream')
+    DOWNLOAD_ACCEL_PREFIX = os.getenv('DOWNLOAD_ACCEL_PREFIX', '/protected-storage/')
+    DOWNLOAD_URL_EXPIRY = int(os.getenv('DOWNLOAD_URL_EXPIRY', 300))
+    
+    # Jobs
+    JOB_STATUS_BATCH_LIMIT = int(os.getenv('JOB_STATUS_BATCH_LIMIT', 1000))
+    
+    # ASGI server (asgi:app): threads running the wrapped Flask app, threads for
+    # the async endpoints' blocking calls (file I/O, PDF checks), and the async
+    # endpoints' own database and Redis connections
+    ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', 16))
+    ASGI_BLOCKING_THREADS = int(os.getenv('ASGI_BLOCKING_THREADS', 40))
+    ASGI_DB_POOL_SIZE = int(os.getenv('ASGI_DB_POOL_SIZE', 10))
+    ASGI_REDIS_MAX_CONNECTIONS = int(os.getenv('ASGI_REDIS_MAX_CONNECTIONS', 50))
+    
+    # Readiness checks, run in the background per process
+    HEALTH_CHECK_INTERVAL = float(os.getenv('HEALTH_CHECK_INTERVAL', 5))  # seconds
+    HEALTH_CHECK_TIMEOUT = float(os.getenv('HEALTH_CHECK_TIMEOUT', 2))
+    READINESS_MAX_QUEUE_DEPTH = int(os.getenv('READINESS_MAX_QUEUE_DEPTH', 0))  # 0 = not checked
+    
+    # Instrumentation: profile 1 request in N (0 = off), keep profiles of the slow ones
+    PROFILE_SAMPLE_EVERY = int(os.getenv('PROFILE_SAMPLE_EVERY', 0))
+    PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', 500))
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+    WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', 0))  # Celery workers' /metrics; 0 = off
+    
+    # Auth caches, per process
+    TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+    TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 300))  # seconds; never past a token's exp
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 30))
+    
+    # Task scheduling
+    TASK_INTERACTIVE_MAX_COST = int(os.getenv('TASK_INTERACTIVE_MAX_COST', 10 * 1024 * 1024))  # pages x bytes
+    USER_MAX_ACTIVE_JOBS = int(os.getenv('USER_MAX_ACTIVE_JOBS', 5))
+    USER_JOBS_PER_MINUTE = int(os.getenv('USER_JOBS_PER_MINUTE', 30))
+    # Hard limit per task; a job that never reports back frees its tenant's slot after this
+    TASK_TIME_LIMIT = int(os.getenv('TASK_TIME_LIMIT', 60 * 60))  # seconds
+    # Reverse proxies in front of the API whose X-Forwarded-* headers are trusted (0: none)
+    TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', 0))
+    
+    # Listing
+    DOCUMENTS_PAGE_LIMIT = int(os.getenv('DOCUMENTS_PAGE_LIMIT', 200))
+    # Parsed PDFs kept per API process for pages served without the page index
+    PAGE_READER_CACHE_SIZE = int(os.getenv('PAGE_READER_CACHE_SIZE', 8))
+    
+    # Result cache
+    RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', 5 * 1024 * 1024 * 1024))
+    
+    # PDF processing
+    PDF_WORKERS = int(os.getenv('PDF_WORKERS', 0))  # 0 = one per CPU
+    PDF_PAGE_RANGE_SIZE = int(os.getenv('PDF_PAGE_RANGE_SIZE', 8))
+    MERGE_MAX_FILES = int(os.getenv('MERGE_MAX_FILES', 10))
+    MERGE_FAN_IN = int(os.getenv('MERGE_FAN_IN', 8))  # inputs per parallel merge task
+    PIPELINE_MAX_STEPS = int(os.getenv('PIPELINE_MAX_STEPS', 10))
+    OCR_LANGUAGE = os.getenv('OCR_LANGUAGE', 'eng')  # Tesseract language(s), e.g. 'eng+deu'
+    OCR_PAGE_RANGE_SIZE = int(os.getenv('OCR_PAGE_RANGE_SIZE', 1))  # pages per pool task; 1 = progress per page
+    OCR_CACHE_TTL = int(os.getenv('OCR_CACHE_TTL', 30 * 24 * 60 * 60))  # seconds
+    SPLIT_MAX_PARTS = int(os.getenv('SPLIT_MAX_PARTS', 10000))  # output documents per split_pdf job
+    ENCRYPTION_MASTER_KEY = os.getenv('ENCRYPTION_MASTER_KEY')  # base64, 32 bytes; derived from SECRET_KEY if unset
+    ENCRYPTION_CHUNK_SIZE = int(os.getenv('ENCRYPTION_CHUNK_SIZE', 1024 * 1024))  # plaintext bytes per sealed chunk
     
     # Celery
     CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
     CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
+    # Redis broker priorities: 0 is served first
+    CELERY_BROKER_TRANSPORT_OPTIONS = {
+        'priority_steps': list(range(10)),
+        'sep': ':',
+        'queue_order_strategy': 'priority'
+    }
+    
+    # Redis
+    REDIS_URL = os.getenv('REDIS_URL', CELERY_RESULT_BACKEND)
+    
+    # File Upload
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 10 * 1024 * 1024))  # per request
+    MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 1024 * 1024 * 1024))  # per chunked upload
+    UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
     
     # Stripe
     STRIPE_API_KEY = os.getenv('STRIPE_API_KEY') 
\ No newline at end of file
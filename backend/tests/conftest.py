@@ -0,0 +1,120 @@
+"""
+Shared fixtures. Tests run against a throwaway SQLite database, local
+storage and scratch in a temporary directory, an in-process fake Redis and
+Celery in eager mode, so nothing has to be running.
+
+Run from backend/: python -m pytest
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import fakeredis
+import jwt
+import pytest
+
+# Configuration is read at import time: point it at the temporary directory first
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+WORKDIR = tempfile.mkdtemp(prefix='fileops-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ['STORAGE_BACKEND'] = 'local'
+os.environ['DOWNLOAD_MODE'] = 'stream'
+os.environ['PDF_WORKERS'] = '2'
+os.chdir(WORKDIR)
+os.makedirs('storage', exist_ok=True)
+
+from app import create_app  # noqa: E402
+from app.config.config import BaseConfig  # noqa: E402
+from app.extensions import celery, db, redis_client  # noqa: E402
+
+TEST_USER_ID = 'test-user'
+
+redis_server = fakeredis.FakeServer()
+# Services default to the shared client; give it the fake server's connections
+redis_client.connection_pool = fakeredis.FakeRedis(server=redis_server).connection_pool
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import tasks  # noqa: F401  (registers the tasks)
+    from app.services.pdf_service import shutdown_page_pool
+
+    flask_app = create_app()
+    flask_app.config.update(TESTING=True)
+    celery.conf.update(task_always_eager=True, task_eager_propagates=True, result_backend='cache+memory://')
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+    shutdown_page_pool()
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def clean_state(app):
+    """Every test starts with empty tables, Redis and storage."""
+    yield
+    db.session.remove()
+    for table in reversed(db.metadata.sorted_tables):
+        db.session.execute(table.delete())
+    db.session.commit()
+    redis_client.flushall()
+    for name in os.listdir('storage'):
+        path = os.path.join('storage', name)
+        shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def make_token(user_id=TEST_USER_ID, expires_in=3600, issued_at=None):
+    now = int(time.time()) if issued_at is None else issued_at
+    return jwt.encode({'sub': user_id, 'iat': now, 'exp': now + expires_in}, BaseConfig.SECRET_KEY, algorithm='HS256')
+
+
+@pytest.fixture
+def auth_headers(app):
+    """Bearer token of TEST_USER_ID, a user that exists."""
+    from app.models.user import User
+
+    User(id=TEST_USER_ID, email='test@example.com', name='Test').save()
+    return {'Authorization': f"Bearer {make_token()}"}
+
+
+@pytest.fixture
+def blob_service():
+    from app.services.blob_service import BlobService
+    from app.services.storage_service import StorageService
+
+    return BlobService(StorageService())
+
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    """Write a small synthetic PDF (benchmarks.synthetic) and return its path."""
+    from benchmarks.synthetic import make_pdf as write_pdf
+
+    def make(pages=4, seed=0, name=None):
+        return write_pdf(str(tmp_path / (name or f"source_{pages}_{seed}.pdf")), pages=pages, image_kb=2, seed=seed)
+    return make
+
+
+@pytest.fixture
+def stored_document(blob_service, make_pdf):
+    """A document of TEST_USER_ID holding a stored PDF of the given number of pages."""
+    from app.services.document_service import DocumentService
+    from app.services.page_index import PageIndexService
+
+    def create(pages=4, seed=0, name='source.pdf'):
+        path = make_pdf(pages, seed)
+        index = PageIndexService.scan(path)
+        blob = blob_service.put_path(shutil.copy(path, os.path.join('storage', f"upload_{seed}_{pages}.pdf")))
+        PageIndexService(blob_service.storage_service).save(blob.digest, index)
+        return DocumentService(blob_service.storage_service).create_document(
+            name, 'pdf', blob.size, blob, status='completed',
+            metadata={'sha256': blob.digest, 'page_count': index['count']}, user_id=TEST_USER_ID
+        )
+    return create
@@ -0,0 +1,174 @@
+import asyncio
+import json
+
+import fakeredis
+import pytest
+
+from app.asgi import create_asgi_app
+from app.extensions import db, redis_client
+from app.models.document import Document
+from app.routes import ingest
+from app.services.job_events import publish_job_event
+from conftest import TEST_USER_ID, make_token, redis_server
+
+
+@pytest.fixture
+def asgi(app, monkeypatch):
+    monkeypatch.setattr('app.services.job_events.get_async_redis',
+                        lambda: fakeredis.FakeAsyncRedis(server=redis_server))
+    return create_asgi_app(app)
+
+
+def call(asgi, method, path, headers=None, body=b''):
+    """Send one HTTP request to the ASGI app; returns (status, headers, body)."""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+        'method': method, 'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': query.encode(),
+        'headers': [(name.lower().encode(), str(value).encode()) for name, value in (headers or {}).items()]
+                   + [(b'content-length', str(len(body)).encode()), (b'host', b'testserver')],
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+    response = {'headers': {}, 'body': b''}
+
+    async def run():
+        done = asyncio.Event()
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            # The client stays connected until the whole response is sent
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = {name.decode(): value.decode() for name, value in message['headers']}
+            elif message['type'] == 'http.response.body':
+                response['body'] += message.get('body', b'')
+                if not message.get('more_body'):
+                    done.set()
+
+        try:
+            await asgi(scope, receive, send)
+        finally:
+            await ingest.ingest_store.engine.dispose()
+
+    asyncio.run(run())
+    return response['status'], response['headers'], response['body']
+
+
+def multipart(filename, content, field='file'):
+    boundary = 'testboundary'
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/pdf\r\n\r\n").encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return {'Content-Type': f"multipart/form-data; boundary={boundary}"}, body
+
+
+def test_upload_stores_the_document(asgi, make_pdf):
+    with open(make_pdf(pages=2), 'rb') as f:
+        content = f.read()
+    headers, body = multipart('report.pdf', content)
+    status, _, response = call(asgi, 'POST', '/api/documents/upload', headers, body)
+    assert status == 200
+
+    document = db.session.get(Document, json.loads(response)['document_id'])
+    assert (document.name, document.type, document.size) == ('report.pdf', 'pdf', len(content))
+    assert document.blob.ref_count == 1
+
+
+def test_upload_of_a_file_that_is_not_a_pdf_is_rejected(asgi):
+    headers, body = multipart('report.pdf', b'MZ' + b'\0' * 1000)
+    status, _, _ = call(asgi, 'POST', '/api/documents/upload', headers, body)
+    assert status == 400
+    assert Document.query.count() == 0
+
+    status, _, response = call(asgi, 'POST', '/api/documents/upload', {'Content-Type': 'text/plain'}, b'x')
+    assert (status, json.loads(response)['error']) == (400, 'No file provided')
+
+
+def test_job_status(asgi, auth_headers):
+    publish_job_event('job-1', 'PROGRESS', progress=40)
+    status, headers, response = call(asgi, 'GET', '/api/jobs/job-1', auth_headers)
+    assert status == 200
+    assert json.loads(response)['progress'] == 40
+    assert 'x-trace-id' in headers
+
+    status, _, response = call(asgi, 'GET', '/api/jobs/job-1')
+    assert (status, json.loads(response)['code']) == (401, 'AUTHENTICATION_ERROR')
+
+
+def test_batch_job_status(asgi, auth_headers):
+    publish_job_event('job-1', 'SUCCESS', progress=100)
+    publish_job_event('job-2', 'FAILURE', error='Broken PDF')
+    body = json.dumps({'job_ids': ['job-1', 'job-2']}).encode()
+    headers = dict(auth_headers, **{'Content-Type': 'application/json'})
+    status, _, response = call(asgi, 'POST', '/api/jobs/status', headers, body)
+    assert status == 200
+    assert [job['status'] for job in json.loads(response)['jobs']] == ['SUCCESS', 'FAILURE']
+
+    status, _, response = call(asgi, 'POST', '/api/jobs/status', auth_headers, b'{"job_ids": []}')
+    assert (status, json.loads(response)['code']) == (400, 'VALIDATION_ERROR')
+
+
+def test_download_with_range_and_etag(asgi, auth_headers, stored_document, blob_service):
+    document = stored_document(pages=2)
+    with blob_service.storage_service.local_path(document.url) as path, open(path, 'rb') as f:
+        content = f.read()
+    path = f"/api/documents/{document.id}/download"
+
+    status, headers, body = call(asgi, 'GET', path, auth_headers)
+    assert (status, body) == (200, content)
+    etag = headers['etag']
+    assert etag == f'"{document.metadata_["sha256"]}"'
+
+    status, headers, body = call(asgi, 'GET', path, dict(auth_headers, Range='bytes=10-19'))
+    assert (status, body) == (206, content[10:20])
+    assert headers['content-range'] == f"bytes 10-19/{len(content)}"
+
+    status, _, body = call(asgi, 'GET', path, dict(auth_headers, **{'If-None-Match': etag}))
+    assert (status, body) == (304, b'')
+
+    assert call(asgi, 'GET', '/api/documents/unknown/download', auth_headers)[0] == 404
+    assert call(asgi, 'GET', path)[0] == 401
+
+
+def test_other_routes_are_served_by_the_flask_app(asgi, auth_headers, stored_document):
+    document = stored_document(pages=2)
+    status, _, body = call(asgi, 'GET', '/api/documents?fields=id,name', auth_headers)
+    assert status == 200
+    assert json.loads(body) == [{'id': document.id, 'name': 'source.pdf'}]
+
+
+def test_event_stream_closes_when_the_final_event_is_lost(asgi, auth_headers, monkeypatch):
+    monkeypatch.setattr(ingest, 'KEEPALIVE_SECONDS', 0.05)
+    publish_job_event('job-1', 'PROGRESS', progress=50)
+    read = ingest.get_job_statuses_async
+
+    async def get_job_statuses_async(job_ids):
+        # The job fails once the stream is open, and its event is lost
+        statuses = await read(job_ids)
+        redis_client.set('job_status:job-1', json.dumps({'job_id': 'job-1', 'status': 'FAILURE'}))
+        return statuses
+    monkeypatch.setattr(ingest, 'get_job_statuses_async', get_job_statuses_async)
+
+    status, headers, body = call(asgi, 'GET', '/api/jobs/job-1/events', auth_headers)
+    assert (status, headers['content-type']) == (200, 'text/event-stream; charset=utf-8')
+    events = [json.loads(line[len('data: '):]) for line in body.decode().splitlines() if line.startswith('data: ')]
+    assert [event['status'] for event in events] == ['PROGRESS', 'FAILURE']
+
+
+def test_upload_with_a_token_belongs_to_its_user(asgi, auth_headers, make_pdf):
+    with open(make_pdf(pages=1), 'rb') as f:
+        headers, body = multipart('mine.pdf', f.read())
+    _, _, response = call(asgi, 'POST', '/api/documents/upload', dict(auth_headers, **headers), body)
+    assert db.session.get(Document, json.loads(response)['document_id']).user_id == TEST_USER_ID
+
+    # Anonymous, as is a token of an unknown user
+    headers['Authorization'] = f"Bearer {make_token('gone')}"
+    _, _, response = call(asgi, 'POST', '/api/documents/upload', headers, body)
+    assert db.session.get(Document, json.loads(response)['document_id']).user_id is None
@@ -0,0 +1,107 @@
+import time
+
+import fakeredis
+import jwt
+import pytest
+
+from app.extensions import db
+from app.models.user import User
+from app.services.auth_cache import CHANNEL, AuthCache, RevokedTokenError
+from conftest import make_token, redis_server
+
+
+@pytest.fixture
+def cache():
+    return AuthCache(redis=fakeredis.FakeRedis(server=redis_server))
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_claims_are_cached_until_the_token_expires(cache):
+    token = make_token(expires_in=60)
+    claims = cache.verify(token)
+    assert claims['sub'] == 'test-user'
+    assert cache.verify(token) is claims
+    # Kept until exp, which is sooner than TOKEN_CACHE_TTL
+    [(_, expires_at)] = cache.tokens._entries.values()
+    assert expires_at == claims['exp']
+
+    with pytest.raises(jwt.ExpiredSignatureError):
+        cache.verify(make_token(expires_in=-10))
+    with pytest.raises(jwt.InvalidTokenError):
+        cache.verify(jwt.encode({'sub': 'test-user'}, 'another-secret', algorithm='HS256'))
+
+
+def test_revoked_token_is_refused_by_every_process(cache):
+    token = make_token()
+    other = AuthCache(redis=fakeredis.FakeRedis(server=redis_server))
+    cache.verify(token)
+    other.verify(token)
+    wait_for(lambda: dict(cache.redis.pubsub_numsub(CHANNEL))[CHANNEL.encode()] >= 2)
+
+    cache.revoke_token(token)
+    with pytest.raises(RevokedTokenError):
+        cache.verify(token)
+    # The other process drops its cached claims on the broadcast...
+    wait_for(lambda: not len(other.tokens))
+    with pytest.raises(RevokedTokenError):
+        other.verify(token)
+    # ...and one that never saw the token finds the revocation in Redis
+    with pytest.raises(RevokedTokenError):
+        AuthCache(redis=fakeredis.FakeRedis(server=redis_server)).verify(token)
+    # Other tokens of the user are still good
+    assert cache.verify(make_token(expires_in=7200))['sub'] == 'test-user'
+
+
+def test_revoking_a_user_refuses_their_earlier_tokens(cache):
+    before = make_token(issued_at=int(time.time()) - 10)
+    cache.verify(before)
+    cache.revoke_user('test-user')
+    with pytest.raises(RevokedTokenError):
+        cache.verify(before)
+    assert len(cache.tokens) == 0
+
+    # Tokens issued since are good (tokens carry whole seconds: date the revocation back)
+    cache.redis.set('auth:revoked_user:test-user', time.time() - 5)
+    assert cache.verify(make_token())['sub'] == 'test-user'
+    assert cache.verify(make_token('someone-else'))['sub'] == 'someone-else'
+
+
+def test_signature_is_trusted_when_redis_is_down():
+    server = fakeredis.FakeServer()
+    server.connected = False
+    cache = AuthCache(redis=fakeredis.FakeRedis(server=server))
+    token = make_token()
+    assert cache.verify(token)['sub'] == 'test-user'
+    # Unknown revocations: not cached, so it is checked again once Redis is back
+    assert len(cache.tokens) == 0
+    with pytest.raises(jwt.ExpiredSignatureError):
+        cache.verify(make_token(expires_in=-10))
+
+
+def test_user_records_are_cached_until_invalidated(cache, app):
+    user = User(email='ada@example.com', name='Ada').save()
+    assert cache.get_user(user.id)['name'] == 'Ada'
+
+    User.query.filter_by(id=user.id).update({'name': 'Ada L.'})
+    db.session.commit()
+    assert cache.get_user(user.id)['name'] == 'Ada'
+    cache.invalidate_user(user.id)
+    assert cache.get_user(user.id)['name'] == 'Ada L.'
+    assert cache.get_user('unknown') is None
+
+
+def test_expired_and_revoked_tokens_get_401(client, auth_headers):
+    from app.services.auth_cache import auth_cache
+
+    response = client.get('/api/documents', headers={'Authorization': f"Bearer {make_token(expires_in=-10)}"})
+    assert (response.status_code, response.json['error']) == (401, 'Token has expired')
+
+    assert client.get('/api/documents', headers=auth_headers).status_code == 200
+    auth_cache.revoke_token(auth_headers['Authorization'][len('Bearer '):])
+    response = client.get('/api/documents', headers=auth_headers)
+    assert (response.status_code, response.json['error']) == (401, 'Token has been revoked')
@@ -0,0 +1,93 @@
+import io
+import os
+from datetime import timedelta
+
+from app.extensions import db
+from app.models.blob import Blob
+
+
+def ref_count(blob_id):
+    return db.session.get(Blob, blob_id).ref_count
+
+
+def test_duplicate_content_is_stored_once(blob_service):
+    first = blob_service.put_file(io.BytesIO(b'same content'))
+    second = blob_service.put_file(io.BytesIO(b'same content'))
+    other = blob_service.put_file(io.BytesIO(b'other content'))
+
+    assert first.id == second.id != other.id
+    assert ref_count(first.id) == 2
+    assert Blob.query.count() == 2
+    assert blob_service.storage_service.has_blob(first.digest)
+
+
+def test_put_paths_counts_repeated_content_per_file(blob_service):
+    paths = []
+    for i, content in enumerate((b'a', b'b', b'a')):
+        paths.append(os.path.join('storage', f"part_{i}"))
+        with open(paths[-1], 'wb') as f:
+            f.write(content)
+
+    blobs = blob_service.put_paths(paths)
+    assert blobs[0].id == blobs[2].id != blobs[1].id
+    assert ref_count(blobs[0].id) == 2
+    assert not any(os.path.exists(path) for path in paths)
+
+
+def test_release_drops_one_reference_per_id(blob_service):
+    blob = blob_service.put_file(io.BytesIO(b'content'))
+    blob_service.acquire(blob.id)
+    blob_service.acquire(blob.id)
+
+    blob_service.release([blob.id, blob.id])
+    assert ref_count(blob.id) == 1
+    # Never below zero
+    blob_service.release([blob.id, blob.id])
+    assert ref_count(blob.id) == 1
+
+
+def test_garbage_collection_removes_only_unreferenced_blobs(blob_service):
+    kept = blob_service.put_file(io.BytesIO(b'kept'))
+    dropped = blob_service.put_file(io.BytesIO(b'dropped'))
+    kept_digest, dropped_digest = kept.digest, dropped.digest
+    blob_service.release([dropped.id])
+
+    # Within the grace period nothing goes
+    assert blob_service.collect_garbage() == 0
+    assert blob_service.collect_garbage(timedelta(0)) == 1
+    assert [blob.digest for blob in Blob.query.all()] == [kept_digest]
+    assert blob_service.storage_service.has_blob(kept_digest)
+    assert not blob_service.storage_service.has_blob(dropped_digest)
+
+
+def test_blob_referenced_again_before_collection_survives(blob_service):
+    blob = blob_service.put_file(io.BytesIO(b'content'))
+    blob_service.release([blob.id])
+    # A new upload of the same content takes the released blob back
+    again = blob_service.put_file(io.BytesIO(b'content'))
+
+    assert again.id == blob.id
+    assert blob_service.collect_garbage(timedelta(0)) == 0
+    assert blob_service.storage_service.has_blob(again.digest)
+
+
+def test_content_stored_again_after_collection(blob_service):
+    blob = blob_service.put_file(io.BytesIO(b'content'))
+    digest = blob.digest
+    blob_service.release([blob.id])
+    blob_service.collect_garbage(timedelta(0))
+
+    again = blob_service.put_file(io.BytesIO(b'content'))
+    assert again.digest == digest
+    assert ref_count(again.id) == 1
+    assert blob_service.storage_service.has_blob(digest)
+
+
+def test_row_whose_file_is_missing_is_rewritten(blob_service):
+    blob = blob_service.put_file(io.BytesIO(b'content'))
+    blob_service.storage_service.delete_blob(blob.digest)
+
+    again = blob_service.put_file(io.BytesIO(b'content'))
+    assert again.id == blob.id
+    assert ref_count(blob.id) == 2
+    assert blob_service.storage_service.has_blob(blob.digest)
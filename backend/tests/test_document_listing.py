@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.base import unit_of_work
+from app.models.document import Document
+from app.services.document_service import DocumentService
+from app.services.storage_service import StorageService
+from app.utils.error_handling import ValidationError
+from conftest import TEST_USER_ID, make_token
+
+
+@pytest.fixture
+def documents():
+    """Seven documents, newest last; three share a created_at, so order falls back to id."""
+    start = datetime(2024, 1, 1)
+    created = [start + timedelta(minutes=i) for i in range(4)] + [start + timedelta(minutes=5)] * 3
+    with unit_of_work():
+        rows = [
+            Document(name=f"doc_{i}.pdf", type='pdf', status='completed' if i % 2 else 'pending',
+                     created_at=created_at, user_id=TEST_USER_ID).save(commit=False)
+            for i, created_at in enumerate(created)
+        ]
+    return sorted(rows, key=lambda document: (document.created_at, document.id), reverse=True)
+
+
+def list_all(service, **filters):
+    pages, cursor = [], None
+    while True:
+        page, cursor = service.list_documents(cursor=cursor, **filters)
+        pages.append([document.id for document in page])
+        if cursor is None:
+            return pages
+
+
+def test_pages_cover_every_document_once_newest_first(documents):
+    service = DocumentService(StorageService())
+    pages = list_all(service, limit=3)
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [document_id for page in pages for document_id in page] == [document.id for document in documents]
+
+
+def test_filters_apply_across_pages(documents):
+    service = DocumentService(StorageService())
+    pages = list_all(service, limit=2, status='completed')
+    assert [document_id for page in pages for document_id in page] == [
+        document.id for document in documents if document.status == 'completed'
+    ]
+
+
+def test_documents_added_meanwhile_do_not_shift_later_pages(documents):
+    service = DocumentService(StorageService())
+    first, cursor = service.list_documents(limit=3)
+    Document(name='new.pdf', type='pdf', created_at=datetime(2025, 1, 1)).save()
+    second, _ = service.list_documents(limit=3, cursor=cursor)
+    assert [document.id for document in first + second] == [document.id for document in documents[:6]]
+
+
+def test_bad_cursor_and_fields_are_rejected(documents):
+    service = DocumentService(StorageService())
+    with pytest.raises(ValidationError, match='Invalid cursor'):
+        service.list_documents(cursor='not-a-cursor')
+    with pytest.raises(ValidationError, match='Unknown fields: owner'):
+        service.list_documents(fields=['id', 'owner'])
+
+
+def test_listing_route_returns_fields_and_next_cursor(client, auth_headers, documents):
+    response = client.get('/api/documents?limit=4&fields=id,name', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json[0] == {'id': documents[0].id, 'name': documents[0].name}
+    cursor = response.headers['X-Next-Cursor']
+
+    response = client.get(f"/api/documents?limit=4&fields=id&cursor={cursor}", headers=auth_headers)
+    assert [item['id'] for item in response.json] == [document.id for document in documents[4:]]
+    assert 'X-Next-Cursor' not in response.headers
+
+
+def test_listing_route_only_lists_the_callers_documents(client, auth_headers, documents):
+    Document(name='anonymous.pdf', type='pdf').save()
+    Document(name='theirs.pdf', type='pdf', user_id='someone-else').save()
+    response = client.get('/api/documents?limit=100&fields=id&user_id=someone-else', headers=auth_headers)
+    assert [item['id'] for item in response.json] == [document.id for document in documents]
+
+
+def test_listing_route_requires_auth(client, documents):
+    response = client.get('/api/documents')
+    assert response.status_code == 401
+    assert response.json['code'] == 'AUTHENTICATION_ERROR'
+
+    # A valid token of a user that no longer exists
+    response = client.get('/api/documents', headers={'Authorization': f"Bearer {make_token('gone')}"})
+    assert (response.status_code, response.json['error']) == (401, 'Unknown user')
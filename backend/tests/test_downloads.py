@@ -0,0 +1,69 @@
+import pytest
+
+from app.services.download_service import DownloadService
+
+
+@pytest.fixture
+def document(stored_document):
+    return stored_document(pages=2)
+
+
+@pytest.fixture
+def content(document, blob_service):
+    with blob_service.storage_service.local_path(document.url) as path, open(path, 'rb') as f:
+        return f.read()
+
+
+def test_full_download_has_the_content_digest_as_etag(client, auth_headers, document, content):
+    response = client.get(f"/api/documents/{document.id}/download", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.data == content
+    assert response.headers['ETag'] == f'"{document.metadata_["sha256"]}"'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert 'attachment; filename=source.pdf' in response.headers['Content-Disposition']
+
+
+def test_unchanged_content_is_not_sent_again(client, auth_headers, document):
+    etag = f'"{document.metadata_["sha256"]}"'
+    response = client.get(f"/api/documents/{document.id}/download",
+                          headers=dict(auth_headers, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_range_request_gets_that_range(client, auth_headers, document, content):
+    response = client.get(f"/api/documents/{document.id}/download", headers=dict(auth_headers, Range='bytes=10-19'))
+    assert response.status_code == 206
+    assert response.data == content[10:20]
+    assert response.headers['Content-Range'] == f"bytes 10-19/{len(content)}"
+
+    response = client.get(f"/api/documents/{document.id}/download", headers=dict(auth_headers, Range='bytes=-5'))
+    assert response.data == content[-5:]
+
+
+def test_range_for_an_old_version_gets_everything(client, auth_headers, document, content):
+    headers = dict(auth_headers, **{'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    response = client.get(f"/api/documents/{document.id}/download", headers=headers)
+    assert response.status_code == 200
+    assert response.data == content
+
+
+def test_unknown_document_and_missing_token(client, auth_headers, document):
+    assert client.get('/api/documents/unknown/download', headers=auth_headers).status_code == 404
+    assert client.get(f"/api/documents/{document.id}/download").status_code == 401
+
+
+@pytest.mark.parametrize('range_header, if_range, expected', [
+    (None, None, (200, 0, 99)),
+    ('bytes=0-9', None, (206, 0, 9)),
+    ('bytes=90-', None, (206, 90, 99)),
+    ('bytes=-10', None, (206, 90, 99)),
+    ('bytes=50-500', None, (206, 50, 99)),
+    ('bytes=200-300', None, (416, 0, 99)),
+    ('bytes=0-9', '"etag"', (206, 0, 9)),
+    ('bytes=0-9', '"other"', (200, 0, 99)),
+    # Several ranges would need a multipart response; the whole content is sent instead
+    ('bytes=0-9,20-29', None, (200, 0, 99)),
+])
+def test_byte_range(range_header, if_range, expected):
+    assert DownloadService.byte_range(100, 'etag', range_header, if_range) == expected
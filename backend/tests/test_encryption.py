@@ -0,0 +1,135 @@
+import io
+import os
+
+import pikepdf
+import pytest
+from PyPDF2 import PdfReader
+
+from app.extensions import db
+from app.models.document import Document
+from app.services.document_service import DocumentService
+from app.services.encryption_service import HEADER, EncryptionService
+from app.services.storage_service import StorageService
+from app.utils.error_handling import ValidationError
+
+
+@pytest.fixture
+def service():
+    return EncryptionService(master_key=b'k' * 32, chunk_size=16)
+
+
+def encrypt(service, data, block_size=7):
+    output = io.BytesIO()
+    size = service.encrypt_stream((data[i:i + block_size] for i in range(0, len(data), block_size)), output)
+    assert size == len(data)
+    return output.getvalue()
+
+
+def decrypt(service, envelope, block_size=5):
+    output = io.BytesIO()
+    service.decrypt_stream((envelope[i:i + block_size] for i in range(0, len(envelope), block_size)), output)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize('size', [0, 1, 16, 50])
+def test_round_trip(service, size):
+    data = os.urandom(size)
+    envelope = encrypt(service, data)
+    assert decrypt(service, envelope) == data
+
+
+def test_each_file_gets_its_own_data_key(service):
+    assert encrypt(service, b'same content') != encrypt(service, b'same content')
+
+
+@pytest.mark.parametrize('damage, message', [
+    (lambda envelope: envelope[:-1] + bytes([envelope[-1] ^ 1]), 'corrupt or truncated at chunk 3'),
+    # Dropping whole chunks at the end is caught by the end-of-file flag
+    (lambda envelope: envelope[:HEADER.size + 2 * (16 + 16)], 'corrupt or truncated at chunk 1'),
+    (lambda envelope: envelope[:HEADER.size] + envelope[HEADER.size + 32:HEADER.size + 64]
+     + envelope[HEADER.size:HEADER.size + 32] + envelope[HEADER.size + 64:], 'corrupt or truncated at chunk 0'),
+    (lambda envelope: b'%PDF-1.7' + envelope[8:], 'Not an encrypted document'),
+    (lambda envelope: envelope[:20], 'Not an encrypted document'),
+])
+def test_tampering_is_detected(service, damage, message):
+    envelope = encrypt(service, os.urandom(50))
+    with pytest.raises(ValueError, match=message):
+        decrypt(service, damage(envelope))
+
+
+def test_wrong_master_key(service):
+    envelope = encrypt(service, b'secret')
+    with pytest.raises(ValueError, match='different master key'):
+        decrypt(EncryptionService(master_key=b'x' * 32), envelope)
+
+
+def test_seal_and_unseal(service):
+    token = service.seal('hunter2')
+    assert 'hunter2' not in token
+    assert service.unseal(token) == 'hunter2'
+
+
+def content_of(document):
+    with StorageService().local_path(document.url) as path, open(path, 'rb') as f:
+        return f.read()
+
+
+def test_envelope_encryption_of_a_document(stored_document):
+    document = stored_document(pages=2)
+    original = content_of(document)
+    service = DocumentService(StorageService())
+
+    service.process_document(document.id, 'encrypt_pdf', {'mode': 'envelope'})
+    encrypted = db.session.get(Document, document.id)
+    assert (encrypted.type, encrypted.status) == ('encrypted', 'completed')
+    assert encrypted.metadata_['encryption'] == 'envelope'
+    assert content_of(encrypted).startswith(b'FOPSENV1')
+
+    service.process_document(document.id, 'decrypt_pdf')
+    decrypted = db.session.get(Document, document.id)
+    assert decrypted.type == 'pdf'
+    assert 'encryption' not in decrypted.metadata_
+    assert decrypted.metadata_['sha256'] == document.metadata_['sha256']
+    assert content_of(decrypted) == original
+
+
+def test_pdf_password_encryption_of_a_document(stored_document):
+    document = stored_document(pages=2)
+    service = DocumentService(StorageService())
+
+    service.process_document(document.id, 'encrypt_pdf', {'password': 'hunter2'})
+    encrypted = db.session.get(Document, document.id)
+    assert (encrypted.type, encrypted.metadata_['encryption']) == ('pdf', 'aes-256')
+    with StorageService().local_path(encrypted.url) as path:
+        with pytest.raises(pikepdf.PasswordError):
+            pikepdf.open(path)
+        with pikepdf.open(path, password='hunter2') as pdf:
+            assert len(pdf.pages) == 2
+
+    service.process_document(document.id, 'decrypt_pdf', {'password': 'hunter2'})
+    decrypted = db.session.get(Document, document.id)
+    assert 'encryption' not in decrypted.metadata_
+    with StorageService().local_path(decrypted.url) as path:
+        reader = PdfReader(path)
+        assert not reader.is_encrypted
+        assert reader.pages[1].extract_text().strip() == 'Page 2'
+
+
+@pytest.mark.parametrize('operation, params, metadata, message', [
+    ('encrypt_pdf', {}, {}, 'password is required'),
+    ('encrypt_pdf', {'mode': 'rot13'}, {}, 'mode must be one of'),
+    ('encrypt_pdf', {'mode': 'envelope', 'password': 'x'}, {}, 'takes no password'),
+    ('encrypt_pdf', {'password': 'x'}, {'encryption': 'pdf'}, 'already encrypted'),
+    ('encrypt_pdf', {'password': 'x' * 128}, {}, 'at most 127 bytes'),
+    ('encrypt_pdf', {'password': 'x', 'level': 9}, {}, 'Unknown parameters'),
+    ('decrypt_pdf', {'password': 'x'}, {'encryption': 'envelope'}, 'take no password'),
+])
+def test_invalid_encryption_parameters(operation, params, metadata, message):
+    with pytest.raises(ValidationError, match=message):
+        DocumentService.prepare_encryption(operation, params, metadata)
+
+
+def test_passwords_are_sealed_for_the_broker():
+    params = DocumentService.prepare_encryption('encrypt_pdf', {'password': 'hunter2'}, {})
+    assert params['password'] != 'hunter2'
+    assert EncryptionService().unseal(params['password']) == 'hunter2'
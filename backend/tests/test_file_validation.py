@@ -0,0 +1,55 @@
+import os
+
+import pytest
+from PyPDF2 import PdfReader
+
+from app.middleware.file_validation import SNIFF_SIZE, ValidatingUploadStream
+from app.utils.error_handling import FileTooLargeError, InvalidFileError
+
+
+@pytest.fixture
+def pdf_bytes(make_pdf):
+    with open(make_pdf(pages=3), 'rb') as f:
+        return f.read()
+
+
+def feed(stream, data, chunk_size=256):
+    """Write data in chunks, as the multipart parser does."""
+    for offset in range(0, len(data), chunk_size):
+        stream.write(data[offset:offset + chunk_size])
+
+
+def test_file_that_is_not_a_pdf_is_rejected_once_its_first_kb_arrives(tmp_path):
+    stream = ValidatingUploadStream('report.pdf', scratch_dir=str(tmp_path))
+    data = b'MZ' + b'\0' * (10 * SNIFF_SIZE)
+    with pytest.raises(InvalidFileError, match='does not look like a .pdf file'):
+        feed(stream, data)
+    # Rejected on the write that completed the first KB, and the spool file is gone
+    assert stream.size == SNIFF_SIZE
+    assert not os.path.exists(stream.path)
+
+
+def test_file_over_the_size_limit_is_rejected_mid_stream(tmp_path, pdf_bytes):
+    stream = ValidatingUploadStream('report.pdf', max_size=2 * SNIFF_SIZE, scratch_dir=str(tmp_path))
+    with pytest.raises(FileTooLargeError):
+        feed(stream, pdf_bytes)
+    assert stream.size <= 2 * SNIFF_SIZE + 256
+    assert not os.path.exists(stream.path)
+
+
+def test_truncated_pdf_is_rejected_when_complete(tmp_path, pdf_bytes):
+    stream = ValidatingUploadStream('report.pdf', scratch_dir=str(tmp_path))
+    feed(stream, pdf_bytes[:len(pdf_bytes) // 2])
+    with pytest.raises(InvalidFileError, match='Truncated or malformed PDF'):
+        stream.finish()
+    stream.close()
+
+
+def test_page_count_is_read_from_the_page_tree_root(tmp_path, pdf_bytes, monkeypatch):
+    stream = ValidatingUploadStream('report.pdf', scratch_dir=str(tmp_path))
+    feed(stream, pdf_bytes)
+    # The pages themselves are never loaded
+    monkeypatch.setattr(PdfReader, '_flatten', lambda *args, **kwargs: pytest.fail('pages were loaded'))
+    metadata = stream.finish()
+    assert (metadata['page_count'], metadata['size']) == (3, len(pdf_bytes))
+    stream.close()
@@ -0,0 +1,41 @@
+import json
+
+from app.extensions import redis_client
+from app.services.job_events import _status_key, publish_job_event
+
+
+def events_of(body):
+    return [json.loads(line[len('data: '):]) for line in body.splitlines() if line.startswith('data: ')]
+
+
+def finish_unannounced(monkeypatch, module, job_id, status):
+    """Once the stream has read the current state, the job finishes but its event is lost."""
+    read = getattr(module, 'get_job_statuses')
+
+    def get_job_statuses(job_ids):
+        statuses = read(job_ids)
+        redis_client.set(_status_key(job_id), json.dumps({'job_id': job_id, 'status': status}))
+        return statuses
+    monkeypatch.setattr(module, 'get_job_statuses', get_job_statuses)
+
+
+def test_stream_ends_with_the_final_status(client, auth_headers):
+    publish_job_event('job-1', 'SUCCESS', progress=100)
+    response = client.get('/api/jobs/job-1/events', headers=auth_headers)
+    assert response.mimetype == 'text/event-stream'
+    assert [event['status'] for event in events_of(response.text)] == ['SUCCESS']
+
+
+def test_stream_closes_when_the_final_event_is_lost(client, auth_headers, monkeypatch):
+    from app.routes import api
+
+    monkeypatch.setattr(api, 'KEEPALIVE_SECONDS', 0.05)
+    publish_job_event('job-1', 'PROGRESS', progress=50)
+    finish_unannounced(monkeypatch, api, 'job-1', 'SUCCESS')
+
+    response = client.get('/api/jobs/job-1/events', headers=auth_headers)
+    assert [event['status'] for event in events_of(response.text)] == ['PROGRESS', 'SUCCESS']
+
+
+def test_stream_requires_auth(client):
+    assert client.get('/api/jobs/job-1/events').status_code == 401
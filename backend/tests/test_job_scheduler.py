@@ -0,0 +1,127 @@
+import time
+
+import pytest
+
+from app import create_app
+from app.config.config import BaseConfig
+from app.extensions import redis_client
+from app.middleware.auth import get_tenant
+from app.services.job_events import publish_job_event
+from app.services.job_scheduler import JOB_TTL, JobScheduler
+from app.utils.error_handling import RateLimitError
+from config.config import Config
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(BaseConfig, 'USER_MAX_ACTIVE_JOBS', 2)
+    monkeypatch.setattr(BaseConfig, 'USER_JOBS_PER_MINUTE', 100)
+    return JobScheduler()
+
+
+def submit(scheduler, tenant, job_id, cost=1):
+    return scheduler.admit(job_id, tenant, 'compress_pdf', cost)
+
+
+def test_cheap_jobs_go_to_interactive_and_priority_grows_with_cost(scheduler):
+    assert scheduler.route('compress_pdf', 1) == ('interactive', 0)
+    big = BaseConfig.TASK_INTERACTIVE_MAX_COST + 1
+    assert scheduler.route('compress_pdf', big)[0] == 'transform'
+    assert scheduler.route('merge_pdfs', big)[0] == 'merge'
+    assert scheduler.route('compress_pdf', 10 ** 12)[1] == 9
+    # Tenants with jobs in flight queue behind others
+    assert scheduler.route('compress_pdf', 1, active_jobs=3) == ('interactive', 3)
+
+
+def test_active_job_limit_per_tenant(scheduler):
+    submit(scheduler, 'alice', 'job-1')
+    assert submit(scheduler, 'alice', 'job-2') == ('interactive', 1)
+    with pytest.raises(RateLimitError, match='2 jobs already queued or running'):
+        submit(scheduler, 'alice', 'job-x')
+    assert redis_client.hgetall('sched:job:job-x') == {}
+    # Other tenants are not held up
+    submit(scheduler, 'bob', 'job-3')
+
+    # A finished job frees its slot
+    publish_job_event('job-1', 'SUCCESS')
+    submit(scheduler, 'alice', 'job-4')
+
+
+def test_submissions_per_minute(scheduler, monkeypatch):
+    monkeypatch.setattr(BaseConfig, 'USER_JOBS_PER_MINUTE', 2)
+    monkeypatch.setattr(BaseConfig, 'USER_MAX_ACTIVE_JOBS', 100)
+    submit(scheduler, 'alice', 'job-1')
+    submit(scheduler, 'alice', 'job-2')
+    with pytest.raises(RateLimitError, match='More than 2 jobs per minute'):
+        submit(scheduler, 'alice', 'job-3')
+
+
+def test_rejected_submissions_do_not_use_up_the_rate(scheduler, monkeypatch):
+    monkeypatch.setattr(BaseConfig, 'USER_JOBS_PER_MINUTE', 2)
+    monkeypatch.setattr(BaseConfig, 'USER_MAX_ACTIVE_JOBS', 1)
+    submit(scheduler, 'alice', 'job-1')
+    for attempt in range(5):
+        with pytest.raises(RateLimitError, match='1 jobs already queued or running'):
+            submit(scheduler, 'alice', f"retry-{attempt}")
+
+    scheduler.job_finished('job-1')
+    submit(scheduler, 'alice', 'job-2')
+
+
+def test_concurrent_submissions_cannot_both_take_the_last_slot(scheduler, monkeypatch):
+    submit(scheduler, 'alice', 'job-1')
+    route = scheduler.route
+    racing = []
+
+    def route_while_another_submits(operation, cost, active_jobs=0):
+        # Another API process admits a job between this one's check and its write
+        if not racing:
+            racing.append(True)
+            submit(JobScheduler(), 'alice', 'job-2')
+        return route(operation, cost, active_jobs)
+    monkeypatch.setattr(scheduler, 'route', route_while_another_submits)
+
+    with pytest.raises(RateLimitError, match='2 jobs already queued or running'):
+        submit(scheduler, 'alice', 'job-3')
+    assert redis_client.zrange('sched:active:alice', 0, -1) == [b'job-1', b'job-2']
+
+
+def test_slot_of_a_job_that_never_reports_back_lapses(scheduler):
+    submit(scheduler, 'alice', 'job-1')
+    submit(scheduler, 'alice', 'job-2')
+    scheduler.job_started('job-1')
+    deadline = redis_client.zscore('sched:active:alice', 'job-1')
+    assert deadline == pytest.approx(time.time() + BaseConfig.TASK_TIME_LIMIT + 60, abs=5)
+    assert redis_client.zscore('sched:active:alice', 'job-2') == pytest.approx(time.time() + JOB_TTL, abs=5)
+
+    # e.g. its worker was killed: once past the deadline the slot is free again
+    redis_client.zadd('sched:active:alice', {'job-1': time.time() - 1})
+    submit(scheduler, 'alice', 'job-3')
+
+
+def test_finished_job_is_not_brought_back_by_a_late_task(scheduler):
+    submit(scheduler, 'alice', 'job-1')
+    scheduler.job_finished('job-1')
+    scheduler.job_running('job-1')
+    assert redis_client.zcard('sched:active:alice') == 0
+
+
+def test_queue_metrics(scheduler):
+    submit(scheduler, 'alice', 'job-1')
+    submit(scheduler, 'bob', 'job-2')
+    scheduler.job_started('job-1')
+
+    metrics = scheduler.metrics()['interactive']
+    assert metrics['depth'] == 1
+    assert metrics['started_total'] == 1
+    assert metrics['wait_p50_seconds'] is not None
+
+
+@pytest.mark.parametrize('trusted_proxies, tenant', [(0, 'ip:10.0.0.1'), (1, 'ip:203.0.113.7')])
+def test_anonymous_tenant_is_the_client_behind_trusted_proxies(monkeypatch, trusted_proxies, tenant):
+    monkeypatch.setattr(Config, 'TRUSTED_PROXY_COUNT', trusted_proxies)
+    proxied = create_app()
+    proxied.add_url_rule('/tenant', 'tenant', get_tenant)
+    response = proxied.test_client().get('/tenant', headers={'X-Forwarded-For': '198.51.100.1, 203.0.113.7'},
+                                         environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    assert response.text == tenant
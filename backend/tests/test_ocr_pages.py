@@ -0,0 +1,53 @@
+import zlib
+
+import pikepdf
+from PyPDF2 import PdfReader
+
+from app.services import pdf_page_ops
+
+
+def gray_image(pdf, size, shade):
+    return pikepdf.Stream(pdf, zlib.compress(bytes([shade]) * size * size), Type=pikepdf.Name.XObject,
+                          Subtype=pikepdf.Name.Image, Width=size, Height=size, BitsPerComponent=8,
+                          ColorSpace=pikepdf.Name.DeviceGray, Filter=pikepdf.Name.FlateDecode)
+
+
+def scanned_pdf(path, pages=2):
+    """Pages that share one resource dictionary, drawing its small image; the large one is unused."""
+    pdf = pikepdf.new()
+    resources = pdf.make_indirect(pikepdf.Dictionary(XObject=pikepdf.Dictionary(
+        Unused=gray_image(pdf, 64, 0), Scan=gray_image(pdf, 16, 200),
+    )))
+    for _ in range(pages):
+        pdf.pages.append(pikepdf.Page(pikepdf.Dictionary(
+            Type=pikepdf.Name.Page, MediaBox=[0, 0, 200, 200], Resources=resources,
+            Contents=pdf.make_stream(b'q 200 0 0 200 0 0 cm /Scan Do Q'),
+        )))
+    pdf.save(path)
+    return path
+
+
+def test_scan_image_is_the_one_the_page_draws(tmp_path):
+    source = scanned_pdf(str(tmp_path / 'scan.pdf'))
+    image = pdf_page_ops._scan_image(PdfReader(source).pages[0])
+    assert int(image['/Width']) == 16
+
+
+def test_text_layer_marks_only_its_own_page(tmp_path):
+    source = scanned_pdf(str(tmp_path / 'scan.pdf'))
+    keys = pdf_page_ops.ocr_page_keys(source, 0, 2)
+    assert keys[0] is not None and keys[0] == keys[1]
+
+    output = str(tmp_path / 'ocr.pdf')
+    # Answered from the cache; nothing was read on page 1
+    known = {0: {'width': 16, 'height': 16, 'words': [['Hello', 1, 1, 8, 4]]},
+             1: {'width': 16, 'height': 16, 'words': []}}
+    assert pdf_page_ops.ocr_page_range(source, 0, 2, output, 'eng', known) == (2, {})
+
+    # Page 1 shared its resources with page 0 and is still to be OCRed
+    assert pdf_page_ops.ocr_page_keys(output, 0, 2) == [None, keys[1]]
+    reader = PdfReader(output)
+    assert 'Hello' in reader.pages[0].extract_text()
+    assert '/Font' not in reader.pages[1]['/Resources']
+    with pikepdf.open(output) as pdf:
+        assert pdf.check() == []
@@ -0,0 +1,80 @@
+import io
+
+from app.extensions import db
+from app.models.blob import Blob
+from app.services.result_cache import ResultCache
+
+
+def ref_count(blob_id):
+    return db.session.get(Blob, blob_id).ref_count
+
+
+def test_key_depends_on_operation_inputs_order_and_params():
+    key = ResultCache.make_key('merge_pdfs', ['a', 'b'], {'linearize': True})
+    assert key == ResultCache.make_key('merge_pdfs', ['a', 'b'], {'linearize': True})
+    assert key != ResultCache.make_key('merge_pdfs', ['b', 'a'], {'linearize': True})
+    assert key != ResultCache.make_key('merge_pdfs', ['a', 'b'])
+
+
+def test_hit_returns_blob_with_a_reference_for_the_caller(blob_service):
+    cache = ResultCache(blob_service)
+    blob = blob_service.put_file(io.BytesIO(b'output'))
+    assert cache.get('key') is None
+
+    cache.put('key', blob)
+    assert ref_count(blob.id) == 2  # the caller's and the cache's
+    hit = cache.get('key')
+    assert hit.id == blob.id
+    assert ref_count(blob.id) == 3
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_second_put_for_a_key_keeps_no_reference(blob_service):
+    cache = ResultCache(blob_service)
+    first = blob_service.put_file(io.BytesIO(b'first'))
+    second = blob_service.put_file(io.BytesIO(b'second'))
+
+    cache.put('key', first)
+    cache.put('key', second)
+    assert cache.get('key').id == first.id
+    assert ref_count(second.id) == 1
+    assert cache.stats()['entries'] == 1
+    assert cache.stats()['bytes'] == first.size
+
+
+def test_eviction_keeps_total_size_under_bound(blob_service):
+    cache = ResultCache(blob_service, max_bytes=10)
+    blobs = [blob_service.put_file(io.BytesIO(content)) for content in (b'aaaa', b'bbbb', b'cccc')]
+    cache.put('a', blobs[0])
+    cache.put('b', blobs[1])
+    # Recently used entries are kept
+    cache.get('a')
+    cache.put('c', blobs[2])
+
+    assert cache.get('b') is None
+    assert [cache.get(key) is not None for key in ('a', 'c')] == [True, True]
+    assert ref_count(blobs[1].id) == 1
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['bytes'] == 8
+
+
+def test_outputs_larger_than_the_cache_are_not_kept(blob_service):
+    cache = ResultCache(blob_service, max_bytes=4)
+    blob = blob_service.put_file(io.BytesIO(b'too large'))
+    cache.put('key', blob)
+    assert cache.get('key') is None
+    assert ref_count(blob.id) == 1
+
+
+def test_entry_whose_file_is_gone_is_dropped(blob_service):
+    cache = ResultCache(blob_service)
+    blob = blob_service.put_file(io.BytesIO(b'output'))
+    cache.put('key', blob)
+    blob_service.storage_service.delete_blob(blob.digest)
+
+    assert cache.get('key') is None
+    # The cache's reference is given back and the entry forgotten
+    assert ref_count(blob.id) == 1
+    assert cache.stats()['entries'] == 0
+    assert cache.stats()['bytes'] == 0
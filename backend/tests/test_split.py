@@ -0,0 +1,97 @@
+import pytest
+from PyPDF2 import PdfReader
+
+from app.extensions import db
+from app.models.blob import Blob
+from app.models.document import Document
+from app.services.document_service import DocumentService
+from app.services.job_events import get_job_statuses
+from app.services.storage_service import StorageService
+from app.utils.error_handling import ValidationError
+
+
+@pytest.fixture
+def document_service():
+    return DocumentService(StorageService())
+
+
+def parts_of(document_id, blob_service):
+    """Child documents in part order, with the page labels of each."""
+    parts, _ = DocumentService(blob_service.storage_service).list_documents(parent_id=document_id, limit=100)
+    labels = []
+    for part in sorted(parts, key=lambda part: part.name):
+        with blob_service.storage_service.local_path(part.url) as path:
+            labels.append((part.name, [page.extract_text().strip() for page in PdfReader(path).pages]))
+    return labels
+
+
+def test_split_into_parts_of_n_pages(document_service, stored_document, blob_service):
+    source = stored_document(pages=5)
+    job = document_service.process_document(source.id, 'split_pdf', {'pages_per_part': 2})
+
+    assert parts_of(source.id, blob_service) == [
+        ('source_1-2.pdf', ['Page 1', 'Page 2']),
+        ('source_3-4.pdf', ['Page 3', 'Page 4']),
+        ('source_5.pdf', ['Page 5']),
+    ]
+    # The source is only read
+    assert db.session.get(Document, source.id).status == 'completed'
+    status = get_job_statuses([job['job_id']])[job['job_id']]
+    assert (status['status'], status['document_count']) == ('SUCCESS', 3)
+
+
+def test_split_by_ranges(document_service, stored_document, blob_service):
+    source = stored_document(pages=5)
+    document_service.process_document(source.id, 'split_pdf', {'ranges': '1-2,5'})
+    assert parts_of(source.id, blob_service) == [
+        ('source_1-2.pdf', ['Page 1', 'Page 2']),
+        ('source_5.pdf', ['Page 5']),
+    ]
+
+
+def test_extract_pages_into_one_document(document_service, stored_document, blob_service):
+    source = stored_document(pages=5)
+    document_service.process_document(source.id, 'extract_pages', {'pages': '4,1-2'})
+
+    [(name, labels)] = parts_of(source.id, blob_service)
+    assert labels == ['Page 4', 'Page 1', 'Page 2']
+    part = Document.query.filter_by(parent_id=source.id).one()
+    assert part.metadata_['page_count'] == 3
+    assert part.status == 'completed'
+
+
+def test_identical_parts_share_a_blob(document_service, stored_document):
+    source = stored_document(pages=2)
+    document_service.process_document(source.id, 'split_pdf', {'ranges': '1,1'})
+
+    parts = Document.query.filter_by(parent_id=source.id).all()
+    assert len(parts) == 2 and parts[0].blob_id == parts[1].blob_id
+    assert db.session.get(Blob, parts[0].blob_id).ref_count == 2
+    # The split's own reference on the source is given back
+    assert db.session.get(Blob, source.blob_id).ref_count == 1
+
+
+@pytest.mark.parametrize('operation, params, message', [
+    ('split_pdf', {'pages_per_part': 0}, 'pages_per_part must be a positive integer'),
+    ('split_pdf', {'ranges': '1-2', 'pages_per_part': 1}, 'either ranges or pages_per_part'),
+    ('split_pdf', {'ranges': '4-9'}, None),
+    ('extract_pages', {}, 'pages is required'),
+    ('extract_pages', {'pages': '1', 'ranges': '1'}, 'Unknown parameters'),
+])
+def test_invalid_parameters_are_rejected(document_service, stored_document, operation, params, message):
+    source = stored_document(pages=3)
+    with pytest.raises(ValidationError, match=message):
+        DocumentService.plan_split(operation, params, 3)
+    # Nothing is written for a job that fails in the worker either
+    if operation == 'split_pdf' and 'ranges' in params and 'pages_per_part' not in params:
+        with pytest.raises(Exception):
+            document_service.process_document(source.id, operation, params)
+        assert Document.query.filter_by(parent_id=source.id).count() == 0
+
+
+def test_plan_split():
+    assert DocumentService.plan_split('split_pdf', {}, 3) == [[1], [2], [3]]
+    assert DocumentService.plan_split('split_pdf', {'pages_per_part': 2}, 3) == [[1, 2], [3]]
+    assert DocumentService.plan_split('extract_pages', {'pages': '3,1-2'}, 3) == [[3, 1, 2]]
+    # Without a page count only the parameters are checked
+    assert DocumentService.plan_split('split_pdf', {'ranges': '1-2'}, None) is None
@@ -0,0 +1,142 @@
+"""
+The same interface tests for every storage backend: the local filesystem,
+and S3 against moto's in-process stand-in.
+"""
+import hashlib
+import io
+import os
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from moto import mock_s3
+
+from app.middleware.file_validation import inspect_stored
+from app.services.storage_backends import LocalStorageBackend, S3StorageBackend
+from app.services.storage_service import StorageService
+from app.services.upload_service import UploadService
+
+BUCKET = 'test-documents'
+
+
+@pytest.fixture(params=['local', 's3'])
+def backend(request, tmp_path):
+    if request.param == 'local':
+        yield LocalStorageBackend(str(tmp_path / 'store'))
+        return
+    with mock_s3():
+        s3 = S3StorageBackend(BUCKET, region='us-east-1', access_key='testing', secret_key='testing',
+                              part_size=5 * 1024 * 1024)
+        s3.client.create_bucket(Bucket=BUCKET)
+        yield s3
+
+
+@pytest.fixture
+def scratch(tmp_path):
+    def write(data, name='scratch.bin'):
+        path = tmp_path / name
+        path.write_bytes(data)
+        return str(path)
+    return write
+
+
+def read(backend, key, start=0, end=None):
+    return b''.join(backend.iter_range(key, start, end))
+
+
+def test_store_read_and_delete(backend, scratch):
+    data = os.urandom(200 * 1024)
+    backend.put_stream('a/stream', io.BytesIO(data))
+    path = scratch(data[:1000])
+    backend.put_file('a/file', path)
+    assert not os.path.exists(path)
+
+    assert backend.exists('a/stream') and not backend.exists('a/missing')
+    assert (backend.size('a/stream'), backend.size('a/file')) == (len(data), 1000)
+    assert read(backend, 'a/stream') == data
+    assert read(backend, 'a/stream', 10, 19) == data[10:20]
+    assert read(backend, 'a/stream', len(data) - 5) == data[-5:]
+    with backend.local_path('a/file') as local:
+        with open(local, 'rb') as f:
+            assert f.read() == data[:1000]
+
+    backend.delete('a/stream')
+    backend.delete('a/stream')
+    assert not backend.exists('a/stream')
+
+
+def test_open_reads_ranges(backend):
+    data = os.urandom(300 * 1024)
+    backend.put_stream('object', io.BytesIO(data))
+    with backend.open('object') as f:
+        assert f.read(10) == data[:10]
+        f.seek(-1000, io.SEEK_END)
+        assert f.read() == data[-1000:]
+        f.seek(150 * 1024)
+        assert f.read(100 * 1024) == data[150 * 1024:250 * 1024]
+        assert f.tell() == 250 * 1024
+
+
+def test_copy(backend):
+    backend.put_stream('source', io.BytesIO(b'content'))
+    backend.copy('source', 'blobs/ab/cd/copy')
+    backend.delete('source')
+    assert read(backend, 'blobs/ab/cd/copy') == b'content'
+
+
+def test_parts_are_joined_in_order_and_hashed(backend, scratch):
+    size = backend.MIN_PART_SIZE
+    parts = [os.urandom(size), os.urandom(size), b'tail']
+    handle = backend.start_parts('uploads/1')
+    tokens = [None] * 3
+    # Out of order, and the first part sent twice: the later one counts
+    for number in (3, 1, 2):
+        tokens[number - 1] = backend.put_part('uploads/1', handle, number, scratch(parts[number - 1]))
+    parts[0] = os.urandom(size)
+    tokens[0] = backend.put_part('uploads/1', handle, 1, scratch(parts[0]))
+
+    digest = backend.join_parts('uploads/1', handle, tokens)
+    assert digest == hashlib.sha256(b''.join(parts)).hexdigest()
+    assert read(backend, 'uploads/1') == b''.join(parts)
+
+    # Discarding after the join removes the joined object
+    backend.abort_parts('uploads/1', handle)
+    assert not backend.exists('uploads/1')
+
+
+def test_abort_discards_the_parts(backend, scratch):
+    handle = backend.start_parts('uploads/2')
+    backend.put_part('uploads/2', handle, 1, scratch(b'part'))
+    backend.abort_parts('uploads/2', handle)
+    backend.abort_parts('uploads/2', handle)
+    assert not backend.exists('uploads/2')
+    if isinstance(backend, S3StorageBackend):
+        assert not backend.client.list_multipart_uploads(Bucket=BUCKET).get('Uploads')
+    else:
+        assert not backend._parts_dir('uploads/2').exists()
+
+
+def test_presigned_url(backend):
+    backend.put_stream('blobs/ab/cd/abcd', io.BytesIO(b'content'))
+    url = backend.presigned_url('blobs/ab/cd/abcd', 'report.pdf', 60)
+    if isinstance(backend, LocalStorageBackend):
+        assert url is None
+        return
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    assert parsed.path.endswith('/blobs/ab/cd/abcd')
+    assert query['response-content-disposition'] == ['attachment; filename="report.pdf"']
+    assert 'Signature' in query or 'X-Amz-Signature' in query
+
+
+def test_chunked_upload_is_validated_in_place(backend, make_pdf):
+    with open(make_pdf(pages=3), 'rb') as f:
+        data = f.read()
+    uploads = UploadService(StorageService(backend))
+    upload_id = uploads.create_upload('scan.pdf', len(data))['upload_id']
+    uploads.write_chunk(upload_id, 0, io.BytesIO(data), len(data), None)
+
+    upload = uploads.complete_upload(upload_id)
+    assert upload['digest'] == hashlib.sha256(data).hexdigest()
+    assert inspect_stored(backend, upload['key']) == {'size': len(data), 'page_count': 3}
+    uploads.close_upload(upload_id)
+    assert not backend.exists(upload['key'])
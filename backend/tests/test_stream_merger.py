@@ -0,0 +1,94 @@
+import pikepdf
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import (
+    ArrayObject,
+    DictionaryObject,
+    FloatObject,
+    NameObject,
+    NumberObject,
+    TextStringObject,
+)
+
+from app.services.pdf_stream_merger import StreamingPdfMerger
+
+
+def with_catalog_entries(source, path, field, value, bookmarks, dests):
+    """Copy source to path, adding a text field on page 1, bookmarks and named destinations."""
+    writer = PdfWriter()
+    writer.append_pages_from_reader(PdfReader(source))
+    widget = DictionaryObject({
+        NameObject('/Type'): NameObject('/Annot'),
+        NameObject('/Subtype'): NameObject('/Widget'),
+        NameObject('/FT'): NameObject('/Tx'),
+        NameObject('/T'): TextStringObject(field),
+        NameObject('/V'): TextStringObject(value),
+        NameObject('/Rect'): ArrayObject(FloatObject(n) for n in (50, 50, 200, 80)),
+        NameObject('/P'): writer.pages[0].indirect_reference,
+    })
+    widget_ref = writer._add_object(widget)
+    writer.pages[0][NameObject('/Annots')] = ArrayObject([widget_ref])
+    writer._root_object[NameObject('/AcroForm')] = DictionaryObject({
+        NameObject('/Fields'): ArrayObject([widget_ref]),
+        NameObject('/NeedAppearances'): NumberObject(1),
+    })
+
+    for title, page, children in bookmarks:
+        parent = writer.add_outline_item(title, page)
+        for child_title, child_page in children:
+            writer.add_outline_item(child_title, child_page, parent=parent)
+    for name, page in dests:
+        writer.add_named_destination(name, page)
+    with open(path, 'wb') as f:
+        writer.write(f)
+    return path
+
+
+def merge(paths, output):
+    with open(output, 'wb') as f:
+        merger = StreamingPdfMerger(f)
+        for path in paths:
+            merger.append(path)
+        merger.close()
+    return output
+
+
+def flatten(reader, outline):
+    items = []
+    for item in outline:
+        if isinstance(item, list):
+            items.extend((f"  {title}", page) for title, page in flatten(reader, item))
+        else:
+            items.append((item.title, reader.get_destination_page_number(item)))
+    return items
+
+
+def test_bookmarks_fields_and_named_destinations_are_carried_over(make_pdf, tmp_path):
+    first = with_catalog_entries(make_pdf(pages=2, seed=1), str(tmp_path / 'first.pdf'), 'name', 'Ada',
+                                 [('Intro', 1, [])], [('first-start', 0)])
+    second = with_catalog_entries(make_pdf(pages=3, seed=2), str(tmp_path / 'second.pdf'), 'city', 'Paris',
+                                  [('Part', 0, [('Section', 2)]), ('End', 1, [])], [('second-end', 2)])
+    plain = make_pdf(pages=1, seed=3)
+    output = merge([first, plain, second], str(tmp_path / 'merged.pdf'))
+
+    reader = PdfReader(output)
+    assert len(reader.pages) == 6
+    # Bookmarks of later inputs point at their pages in the output
+    assert flatten(reader, reader.outline) == [('Intro', 1), ('Part', 3), ('  Section', 5), ('End', 4)]
+    assert {name: reader.get_destination_page_number(dest) for name, dest in reader.named_destinations.items()} == {
+        'first-start': 0, 'second-end': 5,
+    }
+
+    assert {name: field.get('/V') for name, field in reader.get_fields().items()} == {'name': 'Ada', 'city': 'Paris'}
+    assert reader.trailer['/Root']['/AcroForm']['/NeedAppearances'] == 1
+    # Each widget stays on its page and is the field listed in the form
+    fields = reader.trailer['/Root']['/AcroForm']['/Fields']
+    assert [reader.pages[n]['/Annots'][0].idnum for n in (0, 3)] == [ref.idnum for ref in fields]
+
+    with pikepdf.open(output) as pdf:
+        assert pdf.check() == []
+
+
+def test_inputs_without_catalog_entries_give_a_plain_catalog(make_pdf, tmp_path):
+    output = merge([make_pdf(pages=2, seed=1), make_pdf(pages=1, seed=2)], str(tmp_path / 'merged.pdf'))
+    root = PdfReader(output).trailer['/Root']
+    assert sorted(root.keys()) == ['/Pages', '/Type']
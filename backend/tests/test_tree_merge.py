@@ -0,0 +1,81 @@
+import io
+import shutil
+import uuid
+
+import pytest
+from PyPDF2 import PdfReader
+
+from app import tasks
+from app.config.config import BaseConfig
+from app.extensions import db, redis_client
+from app.models.blob import Blob
+from app.models.document import Document
+
+
+@pytest.fixture
+def merge_job(blob_service, make_pdf):
+    """A merge document and its stored inputs, each with one reference held for the job, as the API takes it."""
+    def create(inputs):
+        blobs = [
+            blob_service.put_path(shutil.copy(make_pdf(pages=1, seed=i), f"storage/input_{i}.pdf"))
+            for i in range(inputs)
+        ]
+        document = Document(name='merged.pdf', type='pdf', status='pending').save()
+        params = {
+            'pdf_keys': [blob.path for blob in blobs],
+            'input_blob_ids': [blob.id for blob in blobs],
+            'output_filename': f"{document.id}_merged.pdf"
+        }
+        return document.id, params, [blob.id for blob in blobs]
+    return create
+
+
+def ref_counts(blob_ids):
+    db.session.expire_all()
+    return [db.session.get(Blob, blob_id).ref_count for blob_id in blob_ids]
+
+
+def test_tree_merge_releases_inputs_and_parts(monkeypatch, blob_service, merge_job):
+    monkeypatch.setattr(BaseConfig, 'MERGE_FAN_IN', 2)
+    document_id, params, input_ids = merge_job(5)
+    job_id = str(uuid.uuid4())
+
+    tasks.process_document.apply(args=[document_id, 'merge_pdfs', params], task_id=job_id)
+
+    document = db.session.get(Document, document_id)
+    assert document.status == 'completed'
+    with blob_service.storage_service.local_path(document.url) as path:
+        assert len(PdfReader(path).pages) == 5
+    # The job's references on the inputs are gone, and every intermediate part with it
+    assert ref_counts(input_ids) == [0] * 5
+    part_ids = {blob.id for blob in Blob.query.all()} - set(input_ids) - {document.blob_id}
+    assert part_ids and ref_counts(part_ids) == [0] * len(part_ids)
+    assert not redis_client.exists(f"merge_parts:{job_id}")
+
+
+def test_failed_tree_merge_releases_everything_once(blob_service, merge_job):
+    document_id, params, input_ids = merge_job(2)
+    Document.transition_status(document_id, 'pending', 'processing')
+    job_id = str(uuid.uuid4())
+    part_ids = [blob_service.put_file(io.BytesIO(content)).id for content in (b'part 1', b'part 2')]
+    for part_id in part_ids:
+        tasks._add_merge_part(job_id, part_id)
+    # The next level already merged (and released) the first part
+    blob_service.release(tasks._take_merge_parts(job_id, [part_ids[0]]))
+
+    # Every failed group of a level, and every level it was carried into, calls the errback
+    for _ in range(3):
+        tasks.merge_tree_failed(None, ValueError('boom'), None, document_id, input_ids, job_id)
+
+    assert db.session.get(Document, document_id).status == 'failed'
+    assert ref_counts(input_ids) == [0, 0]
+    assert ref_counts(part_ids) == [0, 0]
+
+
+def test_final_merge_after_a_failure_does_not_release_again(blob_service, merge_job):
+    document_id, params, input_ids = merge_job(2)
+    job_id = str(uuid.uuid4())
+    tasks.merge_tree_failed(None, ValueError('boom'), None, document_id, input_ids, job_id)
+
+    tasks._release_job_inputs(job_id, input_ids, blob_service)
+    assert ref_counts(input_ids) == [0, 0]
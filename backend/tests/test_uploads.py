@@ -0,0 +1,153 @@
+import hashlib
+import io
+import os
+import time
+
+import pytest
+
+from app.extensions import redis_client
+from app.models.blob import Blob
+from app.models.document import Document
+from app.services.storage_service import StorageService
+from app.services.upload_service import UploadService
+from app.utils.error_handling import ValidationError
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def pdf_bytes(make_pdf):
+    with open(make_pdf(pages=3), 'rb') as f:
+        return f.read()
+
+
+def put_chunk(client, upload_id, offset, data, checksum=None):
+    headers = {'X-Chunk-SHA256': checksum} if checksum else {}
+    return client.put(f"/api/uploads/{upload_id}/chunks/{offset}", data=data, headers=headers)
+
+
+def test_chunked_upload_resumes_from_missing_ranges(client, pdf_bytes):
+    chunk_size = len(pdf_bytes) // 3 + 1
+    response = client.post('/api/uploads', json={
+        'filename': 'scan.pdf', 'size': len(pdf_bytes), 'chunk_size': chunk_size
+    })
+    assert response.status_code == 201
+    upload_id = response.json['upload_id']
+    assert response.json['missing'] == [{'offset': 0, 'length': len(pdf_bytes)}]
+
+    chunks = [pdf_bytes[offset:offset + chunk_size] for offset in range(0, len(pdf_bytes), chunk_size)]
+    # The middle chunk is "lost"; the status says what to resend
+    for index in (0, 2):
+        response = put_chunk(client, upload_id, index * chunk_size, chunks[index], sha256(chunks[index]))
+        assert response.status_code == 200
+        assert response.json['sha256'] == sha256(chunks[index])
+    assert client.get(f"/api/uploads/{upload_id}").json['missing'] == [
+        {'offset': chunk_size, 'length': chunk_size}
+    ]
+    assert client.post(f"/api/uploads/{upload_id}/complete").status_code == 400
+
+    assert put_chunk(client, upload_id, chunk_size, chunks[1], sha256(chunks[1])).status_code == 200
+    response = client.post(f"/api/uploads/{upload_id}/complete")
+    assert response.status_code == 200
+
+    document = Document.get_by_id(response.json['document_id'])
+    assert document.metadata_['sha256'] == sha256(pdf_bytes)
+    assert document.metadata_['page_count'] == 3
+    # The session is gone once completed
+    assert client.get(f"/api/uploads/{upload_id}").status_code == 404
+
+
+def upload_all(client, data, chunk_size=None):
+    chunk_size = chunk_size or len(data)
+    upload_id = client.post('/api/uploads', json={
+        'filename': 'scan.pdf', 'size': len(data), 'chunk_size': chunk_size
+    }).json['upload_id']
+    for offset in range(0, len(data), chunk_size):
+        assert put_chunk(client, upload_id, offset, data[offset:offset + chunk_size]).status_code == 200
+    return upload_id
+
+
+def test_completed_upload_is_adopted_as_a_blob_in_place(client, pdf_bytes, blob_service):
+    upload_id = upload_all(client, pdf_bytes, len(pdf_bytes) // 2 + 1)
+    response = client.post(f"/api/uploads/{upload_id}/complete")
+    document = Document.get_by_id(response.json['document_id'])
+    assert document.url == blob_service.storage_service.blob_key(sha256(pdf_bytes))
+    assert document.blob.ref_count == 1
+    # Nothing is left of the upload itself
+    assert os.listdir(os.path.join('storage', 'uploads')) == []
+    assert redis_client.zcard(UploadService.EXPIRING_KEY) == 0
+
+
+def test_failed_completion_can_be_retried(client, pdf_bytes, monkeypatch):
+    from app.routes import api
+
+    upload_id = upload_all(client, pdf_bytes)
+    monkeypatch.setattr(api.document_service, 'create_document', lambda *args, **kwargs: 1 / 0)
+    assert client.post(f"/api/uploads/{upload_id}/complete").status_code == 500
+    # The blob reference taken for the document was given back
+    blob = Blob.query.one()
+    assert blob.ref_count == 0
+
+    monkeypatch.undo()
+    assert client.get(f"/api/uploads/{upload_id}").json['missing'] == []
+    response = client.post(f"/api/uploads/{upload_id}/complete")
+    assert response.status_code == 200
+    assert Document.get_by_id(response.json['document_id']).blob.ref_count == 1
+
+
+def test_upload_that_is_not_a_valid_pdf_is_discarded(client, pdf_bytes):
+    upload_id = upload_all(client, pdf_bytes[:-200])
+    response = client.post(f"/api/uploads/{upload_id}/complete")
+    assert response.status_code == 400
+    assert 'Truncated or malformed PDF' in response.json['error']
+    assert client.get(f"/api/uploads/{upload_id}").status_code == 404
+    assert Document.query.count() == 0 and Blob.query.count() == 0
+    assert os.listdir(os.path.join('storage', 'uploads')) == []
+
+
+def test_chunk_with_bad_checksum_keeps_the_accepted_one():
+    service = UploadService(StorageService())
+    session = service.create_upload('a.pdf', 10, 4)
+    upload_id = session['upload_id']
+
+    service.write_chunk(upload_id, 0, io.BytesIO(b'AAAA'), 4, sha256(b'AAAA'))
+    with pytest.raises(ValidationError, match='Checksum mismatch for chunk at offset 0'):
+        service.write_chunk(upload_id, 0, io.BytesIO(b'BBBB'), 4, sha256(b'XXXX'))
+    with pytest.raises(ValidationError, match='Expected 4 bytes, got 2'):
+        service.write_chunk(upload_id, 4, io.BytesIO(b'CC'), None, None)
+    service.write_chunk(upload_id, 4, io.BytesIO(b'CCCC'), 4, None)
+    service.write_chunk(upload_id, 8, io.BytesIO(b'DD'), 2, sha256(b'DD'))
+
+    upload = service.complete_upload(upload_id)
+    assert upload['digest'] == sha256(b'AAAACCCCDD')
+    assert b''.join(service.storage_service.backend.iter_range(upload['key'])) == b'AAAACCCCDD'
+    # Completing again is answered from the session
+    assert service.complete_upload(upload_id) == upload
+
+
+def test_chunk_offsets_and_lengths_are_checked():
+    service = UploadService(StorageService())
+    upload_id = service.create_upload('a.pdf', 10, 4)['upload_id']
+    with pytest.raises(ValidationError, match='multiple of 4'):
+        service.write_chunk(upload_id, 3, io.BytesIO(b'AAAA'), 4, None)
+    with pytest.raises(ValidationError, match='must be 2 bytes'):
+        service.write_chunk(upload_id, 8, io.BytesIO(b'DDDD'), 4, None)
+    with pytest.raises(ValidationError):
+        service.create_upload('a.txt', 10, 4)
+
+
+def test_abandoned_sessions_are_aborted():
+    service = UploadService(StorageService())
+    session = service.create_upload('a.pdf', 10, 4)
+    service.write_chunk(session['upload_id'], 0, io.BytesIO(b'AAAA'), 4, None)
+    parts_dir = service.storage_service.backend._parts_dir(f"uploads/{session['upload_id']}")
+    assert os.listdir(parts_dir)
+
+    # Past its deadline, the next session to start cleans it up
+    member = redis_client.zrange(service.EXPIRING_KEY, 0, -1)[0]
+    redis_client.zadd(service.EXPIRING_KEY, {member: time.time() - 1})
+    service.create_upload('b.pdf', 10, 4)
+    assert not os.path.exists(parts_dir)
+    assert redis_client.zcard(service.EXPIRING_KEY) == 1
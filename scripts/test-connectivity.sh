@@ -20,4 +20,4 @@ docker-compose exec redis redis-cli ping
 
 # Test worker-redis connectivity
 echo "Testing worker-redis connectivity..."
-docker-compose exec worker celery -A app.celery inspect ping 
\ No newline at end of file
+docker-compose exec worker celery -A app.worker inspect ping 
\ No newline at end of file